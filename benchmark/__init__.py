@@ -0,0 +1,9 @@
+"""
+基准测试与压测工具包
+
+- fake_markmap: 确定性的 markmap 替身可执行文件
+- corpus: 合成测试语料（Markdown、文件、目录）
+- runner: 并发压测驱动与 JSON 报告
+
+用法: python -m benchmark --help
+"""
@@ -0,0 +1,93 @@
+"""
+基准测试命令行入口
+
+示例:
+    python -m benchmark run --profile quick --output bench_report.json
+    python -m benchmark run --mode uvicorn --scenarios upload,files --dir-entries 10,100000
+    python -m benchmark compare base.json bench_report.json --threshold 0.1
+"""
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmark import runner
+
+
+def _int_list(value: str):
+    return [int(item) for item in value.split(',') if item.strip()]
+
+
+def _size_list(value: str):
+    return [runner.parse_size(item) for item in value.split(',') if item.strip()]
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m benchmark", description="Mindmap 服务基准测试")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="执行压测并输出JSON报告")
+    run.add_argument("--mode", choices=["inprocess", "uvicorn"], default="inprocess", help="被测服务运行方式")
+    run.add_argument("--profile", choices=sorted(runner.PROFILES), default="quick", help="预置规模档位")
+    run.add_argument("--scenarios", default=",".join(runner.SCENARIOS), help="逗号分隔的场景列表")
+    run.add_argument("--markdown-nodes", type=_int_list, help="Markdown 节点数，如 10,1000,100000")
+    run.add_argument("--file-sizes", type=_size_list, help="文件大小，如 1KB,1MB,50MB")
+    run.add_argument("--dir-entries", type=_int_list, help="目录项数量，如 10,1000,1000000")
+    run.add_argument("--requests", type=int, help="每个用例的请求数（大输入会自动减少）")
+    run.add_argument("--concurrency", type=int, help="并发数")
+    run.add_argument("--warmup", type=int, default=2, help="每个用例的预热请求数（不计入统计）")
+    run.add_argument("--workdir", default=str(Path(tempfile.gettempdir()) / "mindmap-benchmark"), help="语料和存储目录")
+    run.add_argument("--uvicorn-arg", action="append", default=[], help="传给 uvicorn 的额外参数，如 --uvicorn-arg=--workers=4")
+    run.add_argument("--output", default="bench_report.json", help="报告输出路径")
+
+    compare = sub.add_parser("compare", help="对比两份报告")
+    compare.add_argument("base", help="基线报告")
+    compare.add_argument("current", help="当前报告")
+    compare.add_argument("--threshold", type=float, default=0.1, help="判定退化的相对变化阈值")
+
+    # 内部使用：inprocess 模式下在独立子进程中执行用例
+    worker = sub.add_parser("worker", help=argparse.SUPPRESS)
+    worker.add_argument("--cases", required=True)
+    worker.add_argument("--output", required=True)
+    worker.add_argument("--warmup", type=int, default=2)
+
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+
+    if args.command == "run":
+        profile = runner.PROFILES[args.profile]
+        cases = runner.build_cases(
+            scenarios=[item.strip() for item in args.scenarios.split(',') if item.strip()],
+            markdown_nodes=args.markdown_nodes or profile["markdown_nodes"],
+            file_sizes=args.file_sizes or profile["file_sizes"],
+            dir_entries=args.dir_entries or profile["dir_entries"],
+            requests=args.requests or profile["requests"],
+            concurrency=args.concurrency or profile["concurrency"],
+        )
+        report = runner.run_suite(
+            args.mode, Path(args.workdir), cases, args.warmup,
+            args.concurrency or profile["concurrency"], args.uvicorn_arg
+        )
+        report["meta"]["profile"] = args.profile
+        Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+        print(f"报告已写入: {args.output}")
+        return 0
+
+    if args.command == "compare":
+        base = json.loads(Path(args.base).read_text(encoding='utf-8'))
+        current = json.loads(Path(args.current).read_text(encoding='utf-8'))
+        return runner.compare_reports(base, current, args.threshold)
+
+    cases = json.loads(Path(args.cases).read_text(encoding='utf-8'))
+    results = asyncio.run(runner.run_inprocess(cases, args.warmup))
+    Path(args.output).write_text(json.dumps(results, ensure_ascii=False), encoding='utf-8')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""
+合成测试语料生成
+
+所有语料由固定随机种子生成，同样的参数在任何机器上得到完全相同的内容，
+已生成的语料会按参数缓存，重复运行时直接复用。
+"""
+import os
+import random
+from pathlib import Path
+
+# 中英文混合词表，贴近实际使用场景
+WORDS = [
+    "思维导图", "项目计划", "需求分析", "系统设计", "性能优化", "测试用例", "部署流程",
+    "文件管理", "数据结构", "接口文档", "用户体验", "缓存策略", "并发控制", "日志分析",
+    "markdown", "render", "upload", "preview", "cache", "latency", "throughput",
+    "worker", "queue", "index", "storage", "stream", "config", "metrics"
+]
+
+
+def _sentence(rng: random.Random, min_words: int = 2, max_words: int = 6) -> str:
+    """生成一个随机短句"""
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words)))
+
+
+def generate_markdown(node_count: int, seed: int = 0) -> str:
+    """
+    生成恰好包含 node_count 个节点（标题 + 列表项）的 Markdown 文本
+    结构为多级标题下挂多级列表，分支因子随机
+    """
+    rng = random.Random(seed * 1000003 + node_count)
+    lines = [f"# 基准测试文档 {node_count}"]
+    produced = 1
+    depth = 1
+    while produced < node_count:
+        roll = rng.random()
+        if roll < 0.15 and depth < 4:
+            # 进入更深的标题层级
+            depth += 1
+            lines.append(f"{'#' * depth} {_sentence(rng)}")
+        elif roll < 0.25 and depth > 2:
+            # 回到上一级标题
+            depth -= 1
+            lines.append(f"{'#' * depth} {_sentence(rng)}")
+        elif roll < 0.3:
+            # 同级标题
+            lines.append(f"{'#' * max(depth, 2)} {_sentence(rng)}")
+        else:
+            # 列表项，随机缩进
+            indent = "  " * rng.randint(0, 2)
+            lines.append(f"{indent}- {_sentence(rng)}")
+        produced += 1
+    return "\n".join(lines) + "\n"
+
+
+def write_markdown(workdir: Path, node_count: int, seed: int = 0) -> Path:
+    """生成Markdown语料文件并返回路径"""
+    path = Path(workdir) / "markdown" / f"nodes_{node_count}_seed_{seed}.md"
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(generate_markdown(node_count, seed), encoding='utf-8')
+    return path
+
+
+def write_file(path: Path, size: int, seed: int = 0, text: bool = True) -> Path:
+    """
+    生成指定大小的文件
+    text=True 时生成可读的文本内容，否则生成随机二进制内容
+    """
+    path = Path(path)
+    if path.exists() and path.stat().st_size == size:
+        return path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed * 1000003 + size)
+    block_size = 1024 * 1024
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, 'wb') as f:
+        remaining = size
+        while remaining > 0:
+            if text:
+                block = []
+                block_len = 0
+                while block_len < min(block_size, remaining):
+                    line = (_sentence(rng, 4, 12) + "\n").encode('utf-8')
+                    block.append(line)
+                    block_len += len(line)
+                data = b"".join(block)[:remaining]
+            else:
+                data = rng.randbytes(min(block_size, remaining))
+            f.write(data)
+            remaining -= len(data)
+    os.replace(tmp_path, path)
+    return path
+
+
+def populate_directory(directory: Path, entries: int, seed: int = 0) -> Path:
+    """
+    在目录中生成 entries 个小文件，用于 /files 列表压测
+    完成后写入隐藏标记文件，再次调用时直接跳过
+    """
+    directory = Path(directory)
+    marker = directory / f".bench_entries_{entries}_seed_{seed}"
+    if marker.exists():
+        return directory
+    directory.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed * 1000003 + entries)
+    extensions = ['.txt', '.md', '.json', '.csv', '.pdf', '.png']
+    for i in range(entries):
+        name = f"bench_{i:07d}{extensions[i % len(extensions)]}"
+        fd = os.open(directory / name, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.write(fd, rng.randbytes(rng.randint(16, 256)))
+        finally:
+            os.close(fd)
+    marker.touch()
+    return directory
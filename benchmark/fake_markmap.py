@@ -0,0 +1,130 @@
+"""
+确定性的 markmap 替身
+
+作为脚本运行时模拟 `markmap <input> --output <output> --no-open`：
+读取 Markdown，按标题和列表构建节点树，输出与 markmap-cli 结构一致的 HTML
+（包含相同的 CDN 链接，便于 /upload-local 的替换逻辑照常工作）。
+相同输入总是得到相同输出，不依赖 Node.js 和网络。
+
+可选环境变量（模拟渲染耗时）:
+- FAKE_MARKMAP_DELAY_MS: 每次渲染的固定耗时，单位毫秒
+- FAKE_MARKMAP_DELAY_PER_KB_MS: 每KB输入额外耗时，单位毫秒
+"""
+import html
+import json
+import os
+import re
+import stat
+import sys
+import time
+from pathlib import Path
+
+HTML_TEMPLATE = """<!doctype html>
+<html>
+<head>
+<meta charset="UTF-8">
+<meta name="viewport" content="width=device-width, initial-scale=1.0">
+<meta http-equiv="X-UA-Compatible" content="ie=edge">
+<title>Markmap</title>
+<style>
+* {{ margin: 0; padding: 0; }}
+#mindmap {{ display: block; width: 100vw; height: 100vh; }}
+</style>
+<link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/markmap-toolbar@0.18.10/dist/style.css">
+</head>
+<body>
+<svg id="mindmap"></svg>
+<script src="https://cdn.jsdelivr.net/npm/d3@7.9.0/dist/d3.min.js"></script><script src="https://cdn.jsdelivr.net/npm/markmap-view@0.18.10/dist/browser/index.js"></script><script src="https://cdn.jsdelivr.net/npm/markmap-toolbar@0.18.10/dist/index.js"></script><script>(()=>{{setTimeout(()=>{{const{{markmap:x,mm:K}}=window,P=new x.Toolbar;P.attach(K);const Y=P.render();Y.setAttribute("style","position:absolute;bottom:20px;right:20px"),document.body.append(Y)}})}})()</script><script>((b,L,T,D)=>{{const H=b();window.mm=H.Markmap.create("svg#mindmap",(L||H.deriveOptions)(D),T)}})(()=>window.markmap,null,{data},{{}})</script>
+</body>
+</html>
+"""
+
+HEADING_RE = re.compile(r'^(#{1,6})\s+(.*)$')
+LIST_RE = re.compile(r'^(\s*)(?:[-*+]|\d+[.)])\s+(.*)$')
+
+
+def build_tree(text: str) -> dict:
+    """按标题层级和列表缩进构建节点树"""
+    root = {"content": "", "children": []}
+    # 栈中元素: (层级, 节点)；标题层级为 1-6，列表层级为 10 + 缩进
+    stack = [(0, root)]
+    for line_no, line in enumerate(text.splitlines()):
+        heading = HEADING_RE.match(line)
+        item = None if heading else LIST_RE.match(line)
+        if heading:
+            level = len(heading.group(1))
+            content = heading.group(2).strip()
+            tag = f"h{level}"
+        elif item:
+            level = 10 + len(item.group(1).expandtabs(4)) // 2
+            content = item.group(2).strip()
+            tag = "li"
+        else:
+            continue
+        node = {
+            "content": html.escape(content),
+            "children": [],
+            "payload": {"tag": tag, "lines": f"{line_no},{line_no + 1}"}
+        }
+        while stack[-1][0] >= level:
+            stack.pop()
+        stack[-1][1]["children"].append(node)
+        stack.append((level, node))
+    # 与 markmap 一致：只有一个顶级节点时将其作为根节点
+    if len(root["children"]) == 1:
+        return root["children"][0]
+    return root
+
+
+def render_html(text: str) -> str:
+    """生成思维导图HTML"""
+    data = json.dumps(build_tree(text), ensure_ascii=False, separators=(',', ':'))
+    # 避免内容中的 </script> 提前结束脚本
+    data = data.replace('</', '<\\/')
+    return HTML_TEMPLATE.format(data=data)
+
+
+def simulate_cost(input_size: int):
+    """按配置模拟渲染耗时"""
+    delay_ms = float(os.environ.get('FAKE_MARKMAP_DELAY_MS', '0'))
+    delay_ms += float(os.environ.get('FAKE_MARKMAP_DELAY_PER_KB_MS', '0')) * input_size / 1024
+    if delay_ms > 0:
+        time.sleep(delay_ms / 1000)
+
+
+def install(bin_dir: Path) -> Path:
+    """
+    在 bin_dir 中安装名为 markmap 的可执行文件，返回其路径
+    调用方需将 bin_dir 加入 PATH 的最前面
+    """
+    bin_dir = Path(bin_dir)
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    launcher = bin_dir / "markmap"
+    launcher.write_text(
+        f'#!/bin/sh\nexec "{sys.executable}" "{Path(__file__).resolve()}" "$@"\n',
+        encoding='utf-8'
+    )
+    launcher.chmod(launcher.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return launcher
+
+
+def main(argv=None) -> int:
+    args = list(sys.argv[1:] if argv is None else argv)
+    if not args or args[0].startswith('-'):
+        print("usage: markmap <input.md> --output <output.html> [--no-open]", file=sys.stderr)
+        return 2
+
+    input_path = Path(args[0])
+    output_path = input_path.with_suffix('.html')
+    if '--output' in args:
+        output_path = Path(args[args.index('--output') + 1])
+
+    raw = input_path.read_bytes()
+    simulate_cost(len(raw))
+    output_path.write_text(render_html(raw.decode('utf-8')), encoding='utf-8')
+    print(f"Markmap is generated: {output_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,389 @@
+"""
+压测驱动与报告
+
+两种运行模式:
+- inprocess: 在子进程中直接加载 main:app，通过 httpx 的 ASGITransport 发起请求
+- uvicorn: 启动真实的 uvicorn 服务进程，通过本机 HTTP 发起请求
+
+两种模式都使用独立的工作目录（MINDMAP_STATIC_DIR）和 PATH 上的 markmap 替身，
+全程离线运行，结果写入可在多次运行之间对比的 JSON 报告。
+"""
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from benchmark import corpus, fake_markmap
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+SCENARIOS = ["upload", "upload-local", "upload-file", "preview", "files"]
+
+# 预置的规模档位
+PROFILES = {
+    "quick": {
+        "markdown_nodes": [10, 1000],
+        "file_sizes": [1024, 1024 * 1024],
+        "dir_entries": [10, 1000],
+        "requests": 50,
+        "concurrency": 8,
+    },
+    "full": {
+        "markdown_nodes": [10, 1000, 10000, 100000],
+        "file_sizes": [1024, 1024 * 1024, 10 * 1024 * 1024, 50 * 1024 * 1024],
+        "dir_entries": [10, 1000, 100000, 1000000],
+        "requests": 200,
+        "concurrency": 32,
+    },
+}
+
+# 单个用例的工作量预算，超大输入时自动减少请求数
+CASE_BUDGETS = {
+    "upload": 2_000_000,          # 节点数
+    "upload-local": 2_000_000,    # 节点数
+    "upload-file": 512 * 1024 * 1024,  # 字节
+    "preview": 512 * 1024 * 1024,      # 字节
+    "files": 4_000_000,           # 目录项
+}
+MIN_REQUESTS = 3
+
+
+def parse_size(value: str) -> int:
+    """解析 1KB / 10MB / 2048 这样的大小"""
+    value = value.strip().upper()
+    for suffix, factor in (("GB", 1024 ** 3), ("MB", 1024 ** 2), ("KB", 1024), ("B", 1)):
+        if value.endswith(suffix):
+            return int(float(value[:-len(suffix)]) * factor)
+    return int(value)
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """线性插值百分位数"""
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100
+    lower = int(k)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (k - lower)
+
+
+def build_cases(scenarios: List[str], markdown_nodes: List[int], file_sizes: List[int],
+                dir_entries: List[int], requests: int, concurrency: int) -> List[Dict[str, Any]]:
+    """展开场景与规模，生成用例列表"""
+    cases = []
+    for scenario in scenarios:
+        if scenario in ("upload", "upload-local"):
+            params = markdown_nodes
+        elif scenario in ("upload-file", "preview"):
+            params = file_sizes
+        elif scenario == "files":
+            params = dir_entries
+        else:
+            raise ValueError(f"未知场景: {scenario}")
+        for param in params:
+            total = max(MIN_REQUESTS, min(requests, CASE_BUDGETS[scenario] // max(param, 1)))
+            cases.append({
+                "scenario": scenario,
+                "param": param,
+                "requests": total,
+                "concurrency": min(concurrency, total),
+                # 目录列表压测需要独立的存储目录，其余场景共用默认目录
+                "workspace": f"files_{param}" if scenario == "files" else "default",
+            })
+    return cases
+
+
+def prepare_workspace(workdir: Path, name: str, cases: List[Dict[str, Any]]) -> Path:
+    """准备存储目录和用例需要的语料，返回 static 目录"""
+    static_dir = workdir / "workspaces" / name / "static"
+    (static_dir / "html").mkdir(parents=True, exist_ok=True)
+    (static_dir / "markdown").mkdir(parents=True, exist_ok=True)
+    for case in cases:
+        scenario, param = case["scenario"], case["param"]
+        if scenario in ("upload", "upload-local"):
+            case["body_path"] = str(corpus.write_markdown(workdir / "corpus", param))
+        elif scenario == "upload-file":
+            case["body_path"] = str(corpus.write_file(workdir / "corpus" / "files" / f"upload_{param}.bin", param, text=False))
+        elif scenario == "preview":
+            case["target"] = f"bench_preview_{param}.txt"
+            corpus.write_file(static_dir / case["target"], param, text=True)
+        elif scenario == "files":
+            corpus.populate_directory(static_dir, param)
+    return static_dir
+
+
+def make_sender(case: Dict[str, Any]):
+    """根据用例生成单次请求函数，返回HTTP状态码"""
+    scenario = case["scenario"]
+
+    if scenario in ("upload", "upload-local"):
+        body = Path(case["body_path"]).read_bytes()
+        url = f"/{scenario}"
+
+        async def send(client):
+            response = await client.post(url, content=body, headers={"Content-Type": "text/plain; charset=utf-8"})
+            return response.status_code
+    elif scenario == "upload-file":
+        body_path = case["body_path"]
+
+        async def send(client):
+            with open(body_path, 'rb') as f:
+                response = await client.post("/upload-file", files={"file": ("bench.zip", f, "application/zip")})
+            return response.status_code
+    elif scenario == "preview":
+        url = f"/preview/{case['target']}"
+
+        async def send(client):
+            response = await client.get(url)
+            return response.status_code
+    else:
+        async def send(client):
+            response = await client.get("/files")
+            return response.status_code
+
+    return send
+
+
+async def loop_stall_counters(client) -> Dict[str, float]:
+    """被测服务累计的事件循环阻塞次数和时长（旧版本服务没有这些指标时为 0）"""
+    try:
+        counters = (await client.get("/metrics")).json().get("counters", {})
+    except Exception:
+        counters = {}
+    return {
+        "stalls": counters.get("event_loop_stalls_total", 0),
+        "seconds": counters.get("event_loop_stall_seconds_total", 0),
+    }
+
+
+async def run_case(client, case: Dict[str, Any], warmup: int) -> Dict[str, Any]:
+    """以指定并发执行一个用例，统计吞吐、延迟分布和期间的事件循环阻塞"""
+    send = make_sender(case)
+    for _ in range(warmup):
+        await send(client)
+    stalls_before = await loop_stall_counters(client)
+
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    pending = iter(range(case["requests"]))
+
+    async def worker():
+        for _ in pending:
+            start = time.perf_counter()
+            try:
+                status = str(await send(client))
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(case["concurrency"])))
+    duration = time.perf_counter() - started
+    # 阻塞在事件循环恢复后才记录，稍等看门狗线程汇报
+    await asyncio.sleep(0.2)
+    stalls_after = await loop_stall_counters(client)
+
+    latencies.sort()
+    ms = [value * 1000 for value in latencies]
+    return {
+        "key": f"{case['scenario']}[{case['param']}]",
+        "scenario": case["scenario"],
+        "param": case["param"],
+        "requests": case["requests"],
+        "concurrency": case["concurrency"],
+        "duration_s": round(duration, 4),
+        "throughput_rps": round(len(latencies) / duration, 3) if duration > 0 else 0.0,
+        "errors": sum(count for status, count in statuses.items() if status != "200"),
+        "statuses": statuses,
+        "latency_ms": {
+            "min": round(ms[0], 3),
+            "mean": round(sum(ms) / len(ms), 3),
+            "p50": round(percentile(ms, 50), 3),
+            "p95": round(percentile(ms, 95), 3),
+            "p99": round(percentile(ms, 99), 3),
+            "max": round(ms[-1], 3),
+        },
+        "loop_stalls": int(stalls_after["stalls"] - stalls_before["stalls"]),
+        "loop_stall_ms": round((stalls_after["seconds"] - stalls_before["seconds"]) * 1000, 3),
+    }
+
+
+async def run_inprocess(cases: List[Dict[str, Any]], warmup: int) -> List[Dict[str, Any]]:
+    """在当前进程中加载应用并执行用例（由 worker 子进程调用）"""
+    import httpx
+    sys.path.insert(0, str(REPO_ROOT))
+    from main import app
+
+    transport = httpx.ASGITransport(app=app)
+    results = []
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            for case in cases:
+                results.append(await run_case(client, case, warmup))
+    return results
+
+
+async def run_against_url(base_url: str, cases: List[Dict[str, Any]], warmup: int, concurrency: int) -> List[Dict[str, Any]]:
+    """对已启动的HTTP服务执行用例"""
+    import httpx
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    results = []
+    async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as client:
+        for case in cases:
+            results.append(await run_case(client, case, warmup))
+            print(f"  {results[-1]['key']}: {results[-1]['throughput_rps']} req/s, p95 {results[-1]['latency_ms']['p95']} ms, "
+                  f"事件循环阻塞 {results[-1]['loop_stalls']} 次")
+    return results
+
+
+def target_env(workdir: Path, static_dir: Path) -> Dict[str, str]:
+    """被测服务的环境变量：独立存储目录 + PATH 上的 markmap 替身"""
+    bin_dir = workdir / "bin"
+    fake_markmap.install(bin_dir)
+    env = dict(os.environ)
+    env["MINDMAP_STATIC_DIR"] = str(static_dir)
+    env["PATH"] = f"{bin_dir}{os.pathsep}{env.get('PATH', '')}"
+    return env
+
+
+def free_port() -> int:
+    """获取一个空闲端口"""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_server(port: int, process: subprocess.Popen, timeout: float = 60.0):
+    """等待服务端口可连接"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"uvicorn 进程提前退出，返回码: {process.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f"等待 uvicorn 启动超时（端口 {port}）")
+
+
+def run_workspace(mode: str, workdir: Path, name: str, cases: List[Dict[str, Any]],
+                  warmup: int, concurrency: int, uvicorn_args: List[str]) -> List[Dict[str, Any]]:
+    """在一个独立存储目录上启动被测服务并执行用例"""
+    static_dir = prepare_workspace(workdir, name, cases)
+    env = target_env(workdir, static_dir)
+    log_path = workdir / f"{name}.{mode}.log"
+    print(f"[{name}] 模式={mode} 存储目录={static_dir}")
+
+    with open(log_path, 'w', encoding='utf-8') as log:
+        if mode == "inprocess":
+            cases_path = workdir / f"{name}.cases.json"
+            output_path = workdir / f"{name}.results.json"
+            cases_path.write_text(json.dumps(cases), encoding='utf-8')
+            subprocess.run(
+                [sys.executable, "-m", "benchmark", "worker",
+                 "--cases", str(cases_path), "--output", str(output_path), "--warmup", str(warmup)],
+                cwd=str(REPO_ROOT), env=env, check=True, stdout=log, stderr=subprocess.STDOUT
+            )
+            results = json.loads(output_path.read_text(encoding='utf-8'))
+            for item in results:
+                print(f"  {item['key']}: {item['throughput_rps']} req/s, p95 {item['latency_ms']['p95']} ms, "
+                      f"事件循环阻塞 {item['loop_stalls']} 次")
+            return results
+
+        port = free_port()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+             "--port", str(port), "--log-level", "warning", *uvicorn_args],
+            cwd=str(REPO_ROOT), env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+        try:
+            wait_for_server(port, process)
+            return asyncio.run(run_against_url(f"http://127.0.0.1:{port}", cases, warmup, concurrency))
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def git_revision() -> str:
+    """当前代码版本，便于对比报告"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=str(REPO_ROOT),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def run_suite(mode: str, workdir: Path, cases: List[Dict[str, Any]], warmup: int,
+              concurrency: int, uvicorn_args: List[str]) -> Dict[str, Any]:
+    """执行全部用例并生成报告"""
+    workdir = Path(workdir)
+    workdir.mkdir(parents=True, exist_ok=True)
+
+    # 按存储目录分组，保持用例原有顺序
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for case in cases:
+        groups.setdefault(case["workspace"], []).append(case)
+
+    results = []
+    for name, group in groups.items():
+        results.extend(run_workspace(mode, workdir, name, group, warmup, concurrency, uvicorn_args))
+
+    return {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "revision": git_revision(),
+            "mode": mode,
+            "uvicorn_args": uvicorn_args,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "warmup": warmup,
+        },
+        "results": results,
+    }
+
+
+def compare_reports(base: Dict[str, Any], current: Dict[str, Any], threshold: float) -> int:
+    """
+    对比两份报告，打印吞吐和延迟变化
+    任一用例吞吐下降或 p95 上升超过阈值、或事件循环阻塞总时长增加超过阈值时返回 1
+    """
+    base_results = {item["key"]: item for item in base["results"]}
+    regressions = 0
+    print(f"{'用例':<28}{'吞吐(基线)':>14}{'吞吐(当前)':>14}{'变化':>9}{'p95(基线)':>13}{'p95(当前)':>13}{'变化':>9}")
+    for item in current["results"]:
+        old = base_results.get(item["key"])
+        if old is None:
+            print(f"{item['key']:<28}{'-':>14}{item['throughput_rps']:>14}{'新增':>9}")
+            continue
+        rps_change = (item["throughput_rps"] - old["throughput_rps"]) / old["throughput_rps"] if old["throughput_rps"] else 0.0
+        p95_old, p95_new = old["latency_ms"]["p95"], item["latency_ms"]["p95"]
+        p95_change = (p95_new - p95_old) / p95_old if p95_old else 0.0
+        flag = ""
+        if rps_change < -threshold or p95_change > threshold:
+            regressions += 1
+            flag = "  <-- 退化"
+        print(f"{item['key']:<28}{old['throughput_rps']:>14}{item['throughput_rps']:>14}{rps_change:>+9.1%}"
+              f"{p95_old:>13}{p95_new:>13}{p95_change:>+9.1%}{flag}")
+        # 旧报告没有阻塞统计时跳过
+        if "loop_stalls" in old and "loop_stalls" in item:
+            stall_old, stall_new = old["loop_stall_ms"], item["loop_stall_ms"]
+            if item["loop_stalls"] > old["loop_stalls"] and stall_new > stall_old * (1 + threshold):
+                regressions += 1
+                print(f"{'':<28}事件循环阻塞: {old['loop_stalls']} 次 {stall_old} ms -> "
+                      f"{item['loop_stalls']} 次 {stall_new} ms  <-- 退化")
+    print(f"退化用例数: {regressions}")
+    return 1 if regressions else 0
@@ -0,0 +1,10 @@
+"""
+离线批量渲染工具包
+
+不经过HTTP接口，直接复用 MindmapService 的渲染流程，用进程池批量将目录树中的 Markdown 渲染为思维导图HTML。
+适合修改 enable_svg_download_button、CDN 替换规则或大型思维导图参数后重新生成全部页面。
+
+- runner: 任务发现、断点文件、进程池调度与吞吐量统计
+
+用法: python -m bulk_render --help
+"""
@@ -0,0 +1,61 @@
+"""
+离线批量渲染命令行入口
+
+示例:
+    python -m bulk_render                                   # 重新渲染 static/markdown 到 static/html（沿用各页面原有变体）
+    python -m bulk_render docs/ --output site/ --variant local --workers 8
+    python -m bulk_render --force --report render_report.json
+"""
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+from config import MARKDOWN_DIR, STATIC_HTML_DIR
+from bulk_render import runner
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m bulk_render", description="批量将 Markdown 渲染为思维导图HTML")
+    parser.add_argument("input", nargs="?", default=str(MARKDOWN_DIR), help="Markdown 目录（递归查找 .md 文件）")
+    parser.add_argument("--output", default=str(STATIC_HTML_DIR), help="HTML 输出目录，保持与输入相同的相对路径")
+    parser.add_argument("--variant", choices=runner.VARIANTS, default="auto",
+                        help="cdn: 同 /upload；local: 同 /upload-local；auto: 沿用已有输出的变体，新文件使用 cdn")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="渲染进程数")
+    parser.add_argument("--checkpoint", help="断点文件路径（默认按输入输出目录保存在运行时目录中）")
+    parser.add_argument("--force", action="store_true", help="忽略断点和已有输出，全部重新渲染")
+    parser.add_argument("--limit", type=int, help="本次最多渲染的文件数")
+    parser.add_argument("--report", help="将吞吐量统计写入JSON文件")
+    parser.add_argument("--verbose", action="store_true", help="输出每个文件的渲染日志")
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    input_dir = Path(args.input)
+    output_dir = Path(args.output)
+    if not input_dir.is_dir():
+        print(f"输入目录不存在: {input_dir}")
+        return 2
+    checkpoint = Path(args.checkpoint) if args.checkpoint else runner.default_checkpoint(input_dir, output_dir)
+
+    try:
+        summary = runner.run(
+            input_dir, output_dir, args.variant, max(1, args.workers), checkpoint,
+            force=args.force, verbose=args.verbose, limit=args.limit
+        )
+    except RuntimeError as e:
+        print(str(e))
+        return 2
+    runner.print_summary(summary)
+    if args.report:
+        Path(args.report).write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding='utf-8')
+        print(f"统计已写入: {args.report}")
+    if summary["interrupted"]:
+        return 130
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,302 @@
+"""
+批量渲染驱动
+
+- 递归查找输入目录中的 .md 文件，输出到对应的相对路径（.html）
+- 每个文件渲染完成后立即追加到断点文件（JSON Lines），中断后重新运行同一命令从断点继续
+- 输出文件存在、源文件大小和修改时间未变、且渲染设置指纹相同的文件视为已是最新，直接跳过；
+  渲染设置指纹由CDN替换结果、SVG下载按钮、大型思维导图参数等计算，修改这些设置后会重新渲染
+- 渲染在进程池中执行，每个工作进程独立调用 markmap 并完成后处理
+"""
+import asyncio
+import contextlib
+import hashlib
+import io
+import json
+import os
+import signal
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from config import (
+    RUNTIME_DIR, LARGE_MAP_NODE_THRESHOLD, LARGE_MAP_INITIAL_DEPTH, LARGE_MAP_NODE_BUDGET
+)
+from module.mindmap_service import MindmapService
+
+VARIANTS = ["auto", "cdn", "local"]
+
+# 计算渲染设置指纹使用的样例HTML（包含所有会被替换的CDN地址）
+FINGERPRINT_PROBE = (
+    '<html><head>'
+    '<script src="https://cdn.jsdelivr.net/npm/d3@7.9.0/dist/d3.min.js"></script>'
+    '<script src="https://cdn.jsdelivr.net/npm/markmap-view@0.18.10/dist/browser/index.js"></script>'
+    '<script src="https://cdn.jsdelivr.net/npm/markmap-toolbar@0.18.10/dist/index.js"></script>'
+    '</head><body><svg id="mindmap"></svg></body></html>'
+)
+
+# 断点文件每写入多少条记录同步一次磁盘
+CHECKPOINT_SYNC_EVERY = 50
+
+# 进度输出间隔，单位秒
+PROGRESS_INTERVAL = 2.0
+
+
+def settings_fingerprint(variant: str) -> str:
+    """当前渲染设置的指纹：同一指纹下渲染出的HTML结构相同"""
+    hasher = hashlib.sha256()
+    hasher.update(variant.encode('utf-8'))
+    hasher.update(f"{LARGE_MAP_NODE_THRESHOLD}/{LARGE_MAP_INITIAL_DEPTH}/{LARGE_MAP_NODE_BUDGET}".encode('utf-8'))
+    with contextlib.redirect_stdout(io.StringIO()):
+        hasher.update(MindmapService.inject_lazy_load_script(FINGERPRINT_PROBE).encode('utf-8'))
+        if variant != 'cdn':
+            hasher.update(MindmapService.derive_variant(FINGERPRINT_PROBE, variant).encode('utf-8'))
+    return hasher.hexdigest()[:16]
+
+
+def discover(input_dir: Path) -> Iterator[Path]:
+    """递归查找 .md 文件（跳过以点开头的文件和目录），按路径排序"""
+    for path in sorted(input_dir.rglob('*.md')):
+        relative = path.relative_to(input_dir)
+        if any(part.startswith('.') for part in relative.parts):
+            continue
+        if path.is_file():
+            yield path
+
+
+def output_path_for(md_path: Path, input_dir: Path, output_dir: Path) -> Path:
+    return (output_dir / md_path.relative_to(input_dir)).with_suffix('.html')
+
+
+def resolve_variant(variant: str, html_path: Path) -> str:
+    """
+    auto: 输出文件已存在时沿用其变体（引用 ../htmljs 的为本地变体），否则使用 CDN 变体
+    local: 按 enable_svg_download_button 选择是否带下载SVG按钮
+    """
+    if variant == 'auto':
+        try:
+            with open(html_path, 'r', encoding='utf-8', errors='replace') as f:
+                variant = 'local' if '../htmljs' in f.read() else 'cdn'
+        except OSError:
+            variant = 'cdn'
+    return MindmapService.local_variant() if variant == 'local' else 'cdn'
+
+
+def default_checkpoint(input_dir: Path, output_dir: Path) -> Path:
+    """默认断点文件：RUNTIME_DIR/bulk_render/{输入输出目录摘要}.jsonl"""
+    key = hashlib.sha1(f"{input_dir.resolve()}\n{output_dir.resolve()}".encode('utf-8')).hexdigest()[:12]
+    return RUNTIME_DIR / "bulk_render" / f"{key}.jsonl"
+
+
+def load_checkpoint(path: Path) -> Dict[str, Dict[str, Any]]:
+    """读取断点文件，每个输入文件取最后一条记录；末尾写了一半的行忽略"""
+    records: Dict[str, Dict[str, Any]] = {}
+    if not path.exists():
+        return records
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and "input" in record:
+                records[record["input"]] = record
+    return records
+
+
+def is_up_to_date(record: Optional[Dict[str, Any]], md_path: Path, html_path: Path, variant: str,
+                  fingerprint: str) -> bool:
+    """上次以同一变体渲染成功、源文件未变、输出仍在且渲染设置未变"""
+    if record is None or record.get("status") != "ok" or record.get("variant") != variant:
+        return False
+    try:
+        stat = md_path.stat()
+        html_stat = html_path.stat()
+    except OSError:
+        return False
+    return (
+        record.get("size") == stat.st_size
+        and record.get("mtime_ns") == stat.st_mtime_ns
+        and record.get("output_mtime_ns") == html_stat.st_mtime_ns
+        and record.get("fingerprint") == fingerprint
+    )
+
+
+def _init_worker(verbose: bool):
+    """工作进程初始化：Ctrl+C 只由主进程处理（正在渲染的文件完成后退出）；默认屏蔽渲染过程的逐条日志"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if not verbose:
+        sys.stdout = open(os.devnull, 'w', encoding='utf-8')
+
+
+def render_one(task: Dict[str, Any]) -> Dict[str, Any]:
+    """在工作进程中渲染单个文件，返回断点记录"""
+    md_path, html_path = Path(task["input_path"]), Path(task["output_path"])
+    record = {"input": task["input"], "output": str(html_path), "variant": task["variant"],
+              "fingerprint": task["fingerprint"]}
+    started = time.perf_counter()
+    try:
+        source = MindmapService.load_markdown(md_path)
+        stat = md_path.stat()
+        asyncio.run(MindmapService.render_file(source, html_path, task["variant"]))
+        record.update({
+            "status": "ok",
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "output_mtime_ns": html_path.stat().st_mtime_ns,
+            "nodes": source.node_count
+        })
+    except Exception as e:
+        detail = getattr(e, 'detail', None) or getattr(e, 'stderr', None) or str(e)
+        record.update({"status": "failed", "error": f"{type(e).__name__}: {detail}"[:500]})
+    record["seconds"] = round(time.perf_counter() - started, 4)
+    return record
+
+
+def plan(input_dir: Path, output_dir: Path, variant: str, records: Dict[str, Dict[str, Any]],
+         force: bool) -> Dict[str, Any]:
+    """生成待渲染任务列表，统计跳过的文件"""
+    fingerprints = {name: settings_fingerprint(name) for name in ('cdn', 'local', 'local-svg')}
+    tasks: List[Dict[str, Any]] = []
+    skipped = 0
+    total = 0
+    for md_path in discover(input_dir):
+        total += 1
+        relative = md_path.relative_to(input_dir).as_posix()
+        html_path = output_path_for(md_path, input_dir, output_dir)
+        record = records.get(relative)
+        if variant == 'auto' and record is not None and record.get("status") == "ok":
+            # 断点中已有记录时按记录的变体判断，不必读取输出文件
+            resolved = 'cdn' if record.get("variant") == 'cdn' else MindmapService.local_variant()
+        else:
+            resolved = resolve_variant(variant, html_path)
+        if not force and is_up_to_date(record, md_path, html_path, resolved, fingerprints[resolved]):
+            skipped += 1
+            continue
+        tasks.append({
+            "input": relative,
+            "input_path": str(md_path),
+            "output_path": str(html_path),
+            "variant": resolved,
+            "fingerprint": fingerprints[resolved],
+            "bytes": md_path.stat().st_size
+        })
+    return {"total": total, "skipped": skipped, "tasks": tasks}
+
+
+def run(input_dir: Path, output_dir: Path, variant: str, workers: int, checkpoint: Path,
+        force: bool = False, verbose: bool = False, limit: Optional[int] = None) -> Dict[str, Any]:
+    """执行批量渲染，返回吞吐量统计"""
+    if not MindmapService.check_markmap_available():
+        raise RuntimeError("未找到 markmap 命令，请先安装 markmap-cli 并加入 PATH")
+    started = time.perf_counter()
+    records = {} if force else load_checkpoint(checkpoint)
+    planned = plan(input_dir, output_dir, variant, records, force)
+    tasks = planned["tasks"][:limit] if limit else planned["tasks"]
+    print(f"共 {planned['total']} 个 Markdown 文件: 已是最新 {planned['skipped']} 个, 待渲染 {len(tasks)} 个"
+          f" (工作进程 {workers}, 断点文件 {checkpoint})")
+
+    checkpoint.parent.mkdir(parents=True, exist_ok=True)
+    durations: List[float] = []
+    failures: List[Dict[str, Any]] = []
+    rendered = 0
+    rendered_bytes = 0
+    interrupted = False
+    render_started = time.perf_counter()
+    last_progress = render_started
+    pending_tasks = iter(tasks)
+    with open(checkpoint, 'a', encoding='utf-8') as log, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(verbose,)) as pool:
+        in_flight = {}
+
+        def collect(future):
+            """记录一个已完成的任务并写入断点文件"""
+            nonlocal rendered, rendered_bytes
+            task = in_flight.pop(future)
+            try:
+                record = future.result()
+            except Exception as e:
+                # 工作进程异常退出（如被系统杀死）
+                record = {"input": task["input"], "status": "failed", "error": f"{type(e).__name__}: {e}"}
+            log.write(json.dumps(record, ensure_ascii=False) + "\n")
+            if record["status"] == "ok":
+                rendered += 1
+                rendered_bytes += task["bytes"]
+                durations.append(record["seconds"])
+            else:
+                failures.append(record)
+            if (rendered + len(failures)) % CHECKPOINT_SYNC_EVERY == 0:
+                log.flush()
+                os.fsync(log.fileno())
+
+        def submit_next() -> bool:
+            task = next(pending_tasks, None)
+            if task is None:
+                return False
+            in_flight[pool.submit(render_one, task)] = task
+            return True
+
+        # 每个进程保持两个任务在途，避免一次性提交数千个任务
+        for _ in range(workers * 2):
+            if not submit_next():
+                break
+        try:
+            while in_flight:
+                done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(future)
+                    submit_next()
+                now = time.perf_counter()
+                if now - last_progress >= PROGRESS_INTERVAL:
+                    last_progress = now
+                    finished = rendered + len(failures)
+                    print(f"  进度 {finished}/{len(tasks)}, {finished / (now - render_started):.1f} 个/秒, 失败 {len(failures)}")
+        except KeyboardInterrupt:
+            # 取消未开始的任务，等待正在渲染的文件完成并记入断点
+            interrupted = True
+            print("收到中断信号，等待正在渲染的文件完成...")
+            pool.shutdown(wait=True, cancel_futures=True)
+            for future in list(in_flight):
+                if future.cancelled():
+                    in_flight.pop(future)
+                else:
+                    collect(future)
+        log.flush()
+        os.fsync(log.fileno())
+
+    elapsed = time.perf_counter() - render_started
+    durations.sort()
+    summary = {
+        "total": planned["total"],
+        "skipped": planned["skipped"],
+        "rendered": rendered,
+        "failed": len(failures),
+        "remaining": len(tasks) - rendered - len(failures),
+        "interrupted": interrupted,
+        "workers": workers,
+        "plan_seconds": round(render_started - started, 3),
+        "render_seconds": round(elapsed, 3),
+        "files_per_second": round(rendered / elapsed, 2) if elapsed > 0 else 0.0,
+        "input_mb_per_second": round(rendered_bytes / (1024 * 1024) / elapsed, 3) if elapsed > 0 else 0.0,
+        "file_seconds": {
+            "p50": round(durations[len(durations) // 2], 4) if durations else 0.0,
+            "p95": round(durations[min(len(durations) - 1, int(len(durations) * 0.95))], 4) if durations else 0.0,
+            "max": round(durations[-1], 4) if durations else 0.0
+        },
+        "failures": failures[:20],
+        "checkpoint": str(checkpoint)
+    }
+    return summary
+
+
+def print_summary(summary: Dict[str, Any]):
+    print(f"渲染完成: {summary['rendered']} 个, 失败 {summary['failed']} 个, 跳过 {summary['skipped']} 个"
+          f" (共 {summary['total']} 个)")
+    print(f"耗时 {summary['render_seconds']}s (扫描 {summary['plan_seconds']}s), "
+          f"吞吐 {summary['files_per_second']} 个/秒, {summary['input_mb_per_second']} MB/秒, "
+          f"单个文件 p50 {summary['file_seconds']['p50']}s / p95 {summary['file_seconds']['p95']}s / 最长 {summary['file_seconds']['max']}s")
+    for failure in summary["failures"]:
+        print(f"  失败: {failure['input']}: {failure.get('error')}")
+    if summary["interrupted"] or summary["remaining"]:
+        print(f"尚有 {summary['remaining']} 个文件未渲染，重新运行同一命令即可从断点继续")
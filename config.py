@@ -2,6 +2,7 @@
 配置文件
 """
 import configparser
+import os
 import sys
 from pathlib import Path
 
@@ -16,9 +17,11 @@ def get_base_dir():
 
 # 基础配置
 BASE_DIR = get_base_dir()
-STATIC_DIR = BASE_DIR / "static"
+# 支持通过环境变量 MINDMAP_STATIC_DIR 指定存储目录（基准测试等场景使用独立目录）
+STATIC_DIR = Path(os.environ['MINDMAP_STATIC_DIR']) if os.environ.get('MINDMAP_STATIC_DIR') else BASE_DIR / "static"
 MARKDOWN_DIR = STATIC_DIR / "markdown"
 STATIC_HTML_DIR = STATIC_DIR / "html"
+SUBTREE_INDEX_DIR = STATIC_DIR / "subtree_index"
 
 # 静态文件配置
 JS_DIR = BASE_DIR / "htmljs"
@@ -42,11 +45,62 @@ if not config.sections():
 # 文件上传配置
 MAX_FILE_SIZE = config.getint('file_upload', 'max_file_size_mb') * 1024 * 1024  # 转换为字节
 CHUNK_SIZE = config.getint('file_upload', 'chunk_size_kb') * 1024  # 转换为字节
+MAX_FILES_PER_UPLOAD = max(1, config.getint('file_upload', 'max_files_per_request')) if config.has_option('file_upload', 'max_files_per_request') else 100
+# 旧版的批量上传线程数（[file_upload] io_workers），未配置 [executors] file_io_workers 时沿用
+FILE_IO_WORKERS = max(1, config.getint('file_upload', 'io_workers')) if config.has_option('file_upload', 'io_workers') else 8
+
+# 按工作类型隔离的线程池大小（每个工作进程）
+EXECUTOR_WORKERS = {
+    'render': max(1, config.getint('executors', 'render_workers')) if config.has_option('executors', 'render_workers') else 4,
+    'file_io': max(1, config.getint('executors', 'file_io_workers')) if config.has_option('executors', 'file_io_workers') else FILE_IO_WORKERS,
+    'listing': max(1, config.getint('executors', 'listing_workers')) if config.has_option('executors', 'listing_workers') else 2,
+    'cpu': max(1, config.getint('executors', 'cpu_workers')) if config.has_option('executors', 'cpu_workers') else 2,
+}
 
 # 服务器配置
 SERVER_HOST = config.get('server', 'host')
 SERVER_PORT = config.getint('server', 'port')
 DEBUG = config.getboolean('server', 'debug')
+WORKERS = max(1, config.getint('server', 'workers')) if config.has_option('server', 'workers') else 1
+
+# 多进程共享状态配置（ID生成、共享缓存、配额、指标汇总）
+# 环境变量优先；通过 MINDMAP_STATIC_DIR 指定存储目录时放在其旁边，避免不同存储目录共用状态
+if os.environ.get('MINDMAP_RUNTIME_DIR'):
+    RUNTIME_DIR = Path(os.environ['MINDMAP_RUNTIME_DIR'])
+elif os.environ.get('MINDMAP_STATIC_DIR'):
+    RUNTIME_DIR = STATIC_DIR.parent / "runtime"
+else:
+    RUNTIME_DIR = BASE_DIR / (config.get('state', 'directory') if config.has_option('state', 'directory') else "runtime")
+STATE_DB_PATH = RUNTIME_DIR / "state.db"
+METRICS_FLUSH_INTERVAL = config.getfloat('state', 'metrics_flush_interval_seconds') if config.has_option('state', 'metrics_flush_interval_seconds') else 2.0
+
+# 存储后端配置（local: 本地磁盘；s3: S3 兼容对象存储，需要安装 boto3）
+def _storage_option(option, env, default=''):
+    """存储配置：环境变量优先（便于注入密钥），其次读取 [storage] 配置节"""
+    if os.environ.get(env):
+        return os.environ[env]
+    return config.get('storage', option) if config.has_option('storage', option) else default
+
+STORAGE_BACKEND = _storage_option('backend', 'MINDMAP_STORAGE_BACKEND', 'local').strip().lower()
+S3_ENDPOINT_URL = _storage_option('s3_endpoint_url', 'MINDMAP_S3_ENDPOINT_URL')
+S3_BUCKET = _storage_option('s3_bucket', 'MINDMAP_S3_BUCKET')
+S3_PREFIX = _storage_option('s3_prefix', 'MINDMAP_S3_PREFIX')
+S3_REGION = _storage_option('s3_region', 'MINDMAP_S3_REGION')
+S3_ACCESS_KEY = _storage_option('s3_access_key', 'AWS_ACCESS_KEY_ID')
+S3_SECRET_KEY = _storage_option('s3_secret_key', 'AWS_SECRET_ACCESS_KEY')
+S3_ADDRESSING_STYLE = _storage_option('s3_addressing_style', 'MINDMAP_S3_ADDRESSING_STYLE', 'auto')
+S3_PRESIGN_DOWNLOADS = config.getboolean('storage', 's3_presign_downloads') if config.has_option('storage', 's3_presign_downloads') else True
+S3_PRESIGN_EXPIRES = config.getint('storage', 's3_presign_expires_seconds') if config.has_option('storage', 's3_presign_expires_seconds') else 300
+S3_MULTIPART_THRESHOLD = max(5, config.getint('storage', 's3_multipart_threshold_mb') if config.has_option('storage', 's3_multipart_threshold_mb') else 8) * 1024 * 1024  # 转换为字节
+S3_MULTIPART_CHUNKSIZE = max(5, config.getint('storage', 's3_multipart_chunksize_mb') if config.has_option('storage', 's3_multipart_chunksize_mb') else 8) * 1024 * 1024  # 转换为字节
+S3_MAX_POOL_CONNECTIONS = max(1, config.getint('storage', 's3_max_pool_connections')) if config.has_option('storage', 's3_max_pool_connections') else 20
+
+# 全文检索配置（索引保存在 RUNTIME_DIR/search.db）
+SEARCH_ENABLED = config.getboolean('search', 'enabled') if config.has_option('search', 'enabled') else True
+SEARCH_MAX_DOCUMENT_CHARS = max(1, config.getint('search', 'max_document_kb') if config.has_option('search', 'max_document_kb') else 1024) * 1024  # 每个文档建索引的字符数上限
+SEARCH_SNIPPET_CHARS = max(20, config.getint('search', 'snippet_chars')) if config.has_option('search', 'snippet_chars') else 120
+SEARCH_MAX_PAGE_SIZE = max(1, config.getint('search', 'max_page_size')) if config.has_option('search', 'max_page_size') else 100
+SEARCH_MAX_RESULTS = max(1, config.getint('search', 'max_ranked_results')) if config.has_option('search', 'max_ranked_results') else 2000
 
 # 静态文件暴露配置
 STATIC_FILES_CONFIG = {
@@ -80,6 +134,60 @@ STATIC_FILES_CONFIG = {
 
 # 思维导图配置
 ENABLE_SVG_DOWNLOAD_BUTTON = config.getboolean('mindmap', 'enable_svg_download_button') if 'mindmap' in config and config.has_option('mindmap', 'enable_svg_download_button') else True
+MAX_MARKDOWN_SIZE = (config.getint('mindmap', 'max_markdown_size_mb') if config.has_option('mindmap', 'max_markdown_size_mb') else 10) * 1024 * 1024  # 转换为字节
+LARGE_MAP_NODE_THRESHOLD = config.getint('mindmap', 'large_map_node_threshold') if config.has_option('mindmap', 'large_map_node_threshold') else 5000
+LARGE_MAP_INITIAL_DEPTH = max(1, config.getint('mindmap', 'large_map_initial_depth')) if config.has_option('mindmap', 'large_map_initial_depth') else 3
+LARGE_MAP_NODE_BUDGET = max(1, config.getint('mindmap', 'large_map_node_budget')) if config.has_option('mindmap', 'large_map_node_budget') else 2000
+TREE_CACHE_MAX_BYTES = (config.getint('mindmap', 'tree_cache_mb') if config.has_option('mindmap', 'tree_cache_mb') else 64) * 1024 * 1024  # 转换为字节
+
+# 渲染准入控制配置
+MAX_CONCURRENT_RENDERS = max(1, config.getint('render', 'max_concurrent_renders')) if config.has_option('render', 'max_concurrent_renders') else 2
+RENDER_MAX_QUEUE_SIZE = max(0, config.getint('render', 'max_queue_size')) if config.has_option('render', 'max_queue_size') else 32
+RENDER_MAX_QUEUE_WAIT = config.getfloat('render', 'max_queue_wait_seconds') if config.has_option('render', 'max_queue_wait_seconds') else 30.0
+
+# 渲染公平调度配置（按输入大小分通道，按客户端公平排队）
+FAST_LANE_MAX_BYTES = (config.getint('render', 'fast_lane_max_kb') if config.has_option('render', 'fast_lane_max_kb') else 64) * 1024
+FAST_LANE_MAX_NODES = config.getint('render', 'fast_lane_max_nodes') if config.has_option('render', 'fast_lane_max_nodes') else 2000
+BULK_LANE_CONCURRENCY = min(MAX_CONCURRENT_RENDERS, max(1, config.getint('render', 'bulk_lane_concurrency'))) if config.has_option('render', 'bulk_lane_concurrency') else 1
+RENDER_MAX_QUEUED_PER_CLIENT = max(1, config.getint('render', 'max_queued_per_client')) if config.has_option('render', 'max_queued_per_client') else 8
+CLIENT_KEY_HEADER = config.get('render', 'client_key_header') if config.has_option('render', 'client_key_header') else 'X-API-Key'
+
+# 渲染超时与取消配置
+RENDER_TIMEOUT = config.getfloat('render', 'render_timeout_seconds') if config.has_option('render', 'render_timeout_seconds') else 120.0
+RENDER_MEMORY_LIMIT_MB = config.getint('render', 'render_memory_limit_mb') if config.has_option('render', 'render_memory_limit_mb') else 0
+DISCONNECT_POLL_INTERVAL = config.getfloat('render', 'disconnect_poll_interval_seconds') if config.has_option('render', 'disconnect_poll_interval_seconds') else 0.5
+ORPHAN_CLEANUP_AGE = config.getfloat('render', 'orphan_cleanup_age_seconds') if config.has_option('render', 'orphan_cleanup_age_seconds') else 3600.0
+
+# 启动预热与就绪探针配置
+WARMUP_ENABLED = config.getboolean('warmup', 'enabled') if config.has_option('warmup', 'enabled') else True
+WARMUP_RENDER = config.getboolean('warmup', 'warmup_render') if config.has_option('warmup', 'warmup_render') else True
+WARMUP_TIMEOUT = config.getfloat('warmup', 'timeout_seconds') if config.has_option('warmup', 'timeout_seconds') else 60.0
+WARMUP_REQUIRE_RENDERER = config.getboolean('warmup', 'require_renderer') if config.has_option('warmup', 'require_renderer') else True
+WARMUP_RETRY_INTERVAL = config.getfloat('warmup', 'retry_interval_seconds') if config.has_option('warmup', 'retry_interval_seconds') else 30.0
+
+# 实时预览配置
+LIVE_ENABLED = config.getboolean('live', 'enabled') if config.has_option('live', 'enabled') else True
+LIVE_MAX_SESSIONS = max(1, config.getint('live', 'max_sessions')) if config.has_option('live', 'max_sessions') else 100
+LIVE_SESSION_IDLE = config.getfloat('live', 'session_idle_seconds') if config.has_option('live', 'session_idle_seconds') else 1800.0
+
+# 事件循环阻塞检测配置
+LOOP_MONITOR_ENABLED = config.getboolean('loop_monitor', 'enabled') if config.has_option('loop_monitor', 'enabled') else True
+LOOP_MONITOR_INTERVAL = max(1, config.getint('loop_monitor', 'interval_ms')) / 1000 if config.has_option('loop_monitor', 'interval_ms') else 0.1
+LOOP_MONITOR_STALL_THRESHOLD = max(1, config.getint('loop_monitor', 'stall_threshold_ms')) / 1000 if config.has_option('loop_monitor', 'stall_threshold_ms') else 0.2
+LOOP_MONITOR_SAMPLE_INTERVAL = max(1, config.getint('loop_monitor', 'sample_interval_ms')) / 1000 if config.has_option('loop_monitor', 'sample_interval_ms') else 0.02
+LOOP_MONITOR_MAX_RECORDS = max(1, config.getint('loop_monitor', 'max_records')) if config.has_option('loop_monitor', 'max_records') else 20
+LOOP_MONITOR_STACK_DEPTH = max(1, config.getint('loop_monitor', 'stack_depth')) if config.has_option('loop_monitor', 'stack_depth') else 30
+
+# 按请求的性能剖析配置（报告保存在 RUNTIME_DIR/profiles）
+PROFILING_ENABLED = config.getboolean('profiling', 'enabled') if config.has_option('profiling', 'enabled') else False
+PROFILING_HEADER = config.get('profiling', 'header') if config.has_option('profiling', 'header') else 'X-Profile'
+PROFILING_QUERY_PARAM = config.get('profiling', 'query_param') if config.has_option('profiling', 'query_param') else 'profile'
+PROFILING_TOKEN = config.get('profiling', 'token').strip() if config.has_option('profiling', 'token') else ''
+PROFILING_DIR = RUNTIME_DIR / (config.get('profiling', 'directory') if config.has_option('profiling', 'directory') else "profiles")
+PROFILING_SAMPLE_INTERVAL = max(1, config.getint('profiling', 'sample_interval_ms')) / 1000 if config.has_option('profiling', 'sample_interval_ms') else 0.005
+PROFILING_TRACEMALLOC_FRAMES = max(1, config.getint('profiling', 'tracemalloc_frames')) if config.has_option('profiling', 'tracemalloc_frames') else 10
+PROFILING_TOP_N = max(1, config.getint('profiling', 'top_n')) if config.has_option('profiling', 'top_n') else 30
+PROFILING_MAX_PROFILES = max(1, config.getint('profiling', 'max_profiles')) if config.has_option('profiling', 'max_profiles') else 100
 
 # 允许的文件类型
 ALLOWED_EXTENSIONS = {
@@ -88,6 +196,12 @@ ALLOWED_EXTENSIONS = {
     '.json', '.xml', '.csv', '.mp3', '.mp4', '.avi', '.mov'
 }
 
+# 已经过压缩的文件类型，打包下载时直接存储，不再重复压缩
+PRECOMPRESSED_EXTENSIONS = {
+    '.zip', '.rar', '.7z', '.gz', '.png', '.jpg', '.jpeg', '.gif', '.webp',
+    '.docx', '.xlsx', '.pptx', '.pdf', '.mp3', '.mp4', '.avi', '.mov'
+}
+
 # MIME类型映射
 MIME_TYPES = {
     '.pdf': 'application/pdf',
@@ -95,9 +209,18 @@ MIME_TYPES = {
     '.jpg': 'image/jpeg',
     '.jpeg': 'image/jpeg',
     '.gif': 'image/gif',
+    '.webp': 'image/webp',
+    '.svg': 'image/svg+xml',
+    '.mp3': 'audio/mpeg',
+    '.mp4': 'video/mp4',
+    '.mov': 'video/quicktime',
+    '.avi': 'video/x-msvideo',
     '.html': 'text/html',
     '.htm': 'text/html',
     '.txt': 'text/plain',
+    '.md': 'text/markdown',
+    '.csv': 'text/csv',
+    '.log': 'text/plain',
     '.json': 'application/json',
     '.xml': 'application/xml',
     '.css': 'text/css',
@@ -107,6 +230,15 @@ MIME_TYPES = {
 # 默认MIME类型
 DEFAULT_MIME_TYPE = 'application/octet-stream'
 
+# 预览配置：文本文件转码后流式返回，超过上限的部分截断
+PREVIEW_MAX_TEXT_BYTES = (config.getint('preview', 'max_text_preview_mb') if config.has_option('preview', 'max_text_preview_mb') else 5) * 1024 * 1024  # 转换为字节
+
+# 大文件下载配置：服务器支持 pathsend 时由服务器零拷贝发送，也可交给前置代理发送
+DOWNLOAD_LARGE_FILE_BYTES = (config.getint('download', 'large_file_mb') if config.has_option('download', 'large_file_mb') else 8) * 1024 * 1024  # 转换为字节
+DOWNLOAD_OFFLOAD = (config.get('download', 'offload') if config.has_option('download', 'offload') else 'none').strip().lower()
+DOWNLOAD_NGINX_PREFIX = config.get('download', 'nginx_internal_prefix') if config.has_option('download', 'nginx_internal_prefix') else '/_static_internal/'
+DOWNLOAD_CHUNK_SIZE = (config.getint('download', 'chunk_size_kb') if config.has_option('download', 'chunk_size_kb') else 1024) * 1024  # 转换为字节
+
 # 获取可用的JS文件列表
 def get_available_js_files():
     """获取可用的JS文件列表"""
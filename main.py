@@ -1,11 +1,25 @@
 """
 FastAPI 主应用程序
 """
-from fastapi import FastAPI, Request, File, UploadFile, Form
-from fastapi.staticfiles import StaticFiles
+from typing import List, Optional
+from fastapi import FastAPI, Request, File, UploadFile, Form, WebSocket
+from fastapi.responses import JSONResponse
 from module.mindmap_service import MindmapService
 from module.file_service import FileService
-from config import SERVER_HOST, SERVER_PORT, DEBUG, STATIC_FILES_CONFIG, get_available_js_files, get_static_file_url
+from module.metrics import Metrics
+from module.render_admission import RenderAdmission
+from module.atomic_writer import AtomicWriter
+from module.search_index import SearchIndex
+from module.workload_pools import WorkloadPools
+from module.warmup import Warmup
+from module.request_profiler import ProfilingMiddleware
+from module.loop_monitor import LoopMonitor
+from module.live_preview import LivePreview
+from module.storage import PublicStaticFiles
+from config import (
+    SERVER_HOST, SERVER_PORT, DEBUG, WORKERS, STATIC_FILES_CONFIG, get_available_js_files, get_static_file_url,
+    STATIC_DIR, STATIC_HTML_DIR, SUBTREE_INDEX_DIR, ORPHAN_CLEANUP_AGE, PROFILING_ENABLED
+)
 
 # 创建FastAPI应用
 app = FastAPI(
@@ -14,18 +28,16 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# 动态挂载静态文件目录
-for static_type, config in STATIC_FILES_CONFIG.items():
-    if config['enabled']:
-        app.mount(config['url_prefix'], StaticFiles(directory=config['path']), name=static_type)
-        print(f"已挂载静态文件: {config['url_prefix']} -> {config['path']}")
+# 按请求的性能剖析（未启用时不安装中间件）
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
 
 # ==================== 基础路由 ====================
 
 @app.get("/")
-def root():
+async def root():
     """根路径，返回API信息"""
-    available_js_files = get_available_js_files()
+    available_js_files = await WorkloadPools.run('listing', get_available_js_files)
     
     return {
         "message": "Mindmap & File Management Service",
@@ -37,14 +49,28 @@ def root():
         "endpoints": {
             "mindmap": {
                 "upload": "POST /upload - 上传Markdown文本生成思维导图",
-                "view": "GET /html/{filename} - 查看思维导图"
+                "view": "GET /html/{filename} - 查看思维导图",
+                "svg": "GET /html/{map_id}.svg - 服务端导出思维导图SVG",
+                "subtree": "GET /html/{map_id}/subtree/{node_id} - 按需加载大型思维导图的子树",
+                "tree": "POST /mindmap/tree - 将Markdown转换为节点树JSON（不生成HTML）",
+                "live": "GET /live/{session_id} - 实时预览页面（WebSocket /live/{session_id}/ws 接收编辑）"
             },
             "file_management": {
                 "upload": "POST /upload-file - 上传文件",
+                "upload_batch": "POST /upload-files - 批量上传多个文件",
                 "download": "GET /download/{file_path:path} - 下载文件",
+                "bundle": "POST /download/bundle - 将多个文件打包为ZIP流式下载",
                 "preview": "GET /preview/{file_path:path} - 预览文件（浏览器直接显示）",
                 "list": "GET /files - 获取文件列表",
-                "save": "POST /save - 保存文本内容为文件"
+                "save": "POST /save - 保存文本内容为文件",
+                "append": "POST /save/append - 向已保存的文本文件追加内容",
+                "replace_range": "POST /save/replace-range - 替换已保存文本文件中的一段内容",
+                "search": "GET /search?q= - 全文检索保存的文本和思维导图Markdown"
+            },
+            "monitoring": {
+                "metrics": "GET /metrics - 获取运行指标（多进程汇总）",
+                "healthz": "GET /healthz - 存活探针（不执行任何I/O）",
+                "readyz": "GET /readyz - 就绪探针（启动预热完成后返回200）"
             },
             "static_files": {
                 "htmljs": "GET /htmljs/* - 访问JavaScript文件",
@@ -63,9 +89,9 @@ def root():
     }
 
 @app.get("/htmljs-files")
-def list_js_files():
+async def list_js_files():
     """列出所有可用的JS文件"""
-    js_files = get_available_js_files()
+    js_files = await WorkloadPools.run('listing', get_available_js_files)
     return {
         "message": "可用的JS文件列表",
         "files": js_files,
@@ -73,17 +99,68 @@ def list_js_files():
         "access_urls": [get_static_file_url(f, "js") for f in js_files]
     }
 
+@app.get("/metrics")
+def get_metrics():
+    """
+    获取运行指标，多进程模式下汇总所有工作进程
+    监控接口保留在默认线程池中执行，各类工作的线程池排满时仍能及时响应
+    """
+    metrics = Metrics.aggregate()
+    # 当前进程的渲染准入状态（活动数、排队数、限制）
+    metrics["render_admission"] = RenderAdmission.status()
+    # 当前进程各类工作线程池的利用率
+    metrics["executors"] = WorkloadPools.status()
+    # 当前进程的事件循环调度延迟和最近的阻塞记录
+    metrics["event_loop"] = LoopMonitor.status()
+    # 当前进程的实时预览会话数和连接数
+    metrics["live"] = LivePreview.status()
+    return metrics
+
+@app.get("/healthz")
+async def healthz():
+    """存活探针：只表示进程能响应请求，不访问磁盘、数据库或渲染器"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """就绪探针：启动预热（探测渲染器、预热渲染、建立缓存和索引）完成前返回 503"""
+    status = Warmup.status()
+    return JSONResponse(status, status_code=200 if Warmup.is_ready() else 503)
+
+@app.on_event("startup")
+def cleanup_render_orphans():
+    """启动时清理上次中断渲染和写入残留的临时文件"""
+    MindmapService.cleanup_orphans()
+    AtomicWriter.cleanup_temp_files(
+        [STATIC_DIR, STATIC_DIR / "text_files", STATIC_HTML_DIR, SUBTREE_INDEX_DIR], ORPHAN_CLEANUP_AGE
+    )
+    # 清理完成后再对账全文索引（后台执行）
+    SearchIndex.reconcile_in_background()
+
+@app.on_event("startup")
+async def start_warmup():
+    """启动事件循环阻塞检测和指标写入线程，并在后台预热渲染流程，完成后 /readyz 返回 200"""
+    LoopMonitor.start()
+    Metrics.start()
+    Warmup.start()
+
+@app.on_event("shutdown")
+def flush_metrics():
+    """进程退出前写入最后一次指标，并关闭各类工作的线程池"""
+    Warmup.stop()
+    LoopMonitor.stop()
+    Metrics.stop()
+    WorkloadPools.shutdown()
+
 # ==================== 思维导图相关路由 ====================
 
 @app.post("/upload")
 async def upload_markdown(request: Request):
     """
     上传Markdown文本，生成思维导图
+    请求体以流式方式写入文件，大小受 max_markdown_size_mb 限制
     """
-    content = await request.body()
-    content = content.decode('utf-8')
-    
-    preview_url = await MindmapService.process_markdown(request, content)
+    preview_url = await MindmapService.process_markdown(request)
     return preview_url
 
 
@@ -91,18 +168,60 @@ async def upload_markdown(request: Request):
 async def upload_markdown_replace(request: Request):
     """
     上传Markdown文本，生成思维导图
+    请求体以流式方式写入文件，大小受 max_markdown_size_mb 限制
     """
-    content = await request.body()
-    content = content.decode('utf-8')
-
-    preview_url = await MindmapService.process_markdown_replace(request, content)
+    preview_url = await MindmapService.process_markdown_replace(request)
     return preview_url
+
+@app.get("/html/{map_id}.svg")
+async def get_svg(map_id: str):
+    """
+    服务端导出思维导图SVG
+    由保存的Markdown在服务端计算布局生成，结果缓存在HTML旁边
+    """
+    return await WorkloadPools.run('cpu', MindmapService.get_svg, map_id)
+
 @app.get("/html/{filename}")
-def get_html(filename: str):
+async def get_html(filename: str):
     """
     获取生成的思维导图HTML文件
     """
-    return MindmapService.get_html_file(filename)
+    return await WorkloadPools.run('file_io', MindmapService.get_html_file, filename)
+
+@app.get("/html/{map_id}/subtree/{node_id}")
+async def get_subtree(map_id: str, node_id: str):
+    """
+    获取大型思维导图中折叠节点的子树（JSON）
+    由思维导图页面在展开节点时按需请求
+    """
+    return await WorkloadPools.run('file_io', MindmapService.get_subtree, map_id, node_id)
+
+@app.get("/live/{session_id}")
+async def live_page(session_id: str):
+    """
+    实时预览页面：连接 /live/{session_id}/ws，收到变化的子树补丁后就地更新思维导图，不刷新页面
+    可加 ?from={map_id} 以已生成的思维导图的Markdown作为初始内容
+    """
+    return LivePreview.page(session_id)
+
+@app.websocket("/live/{session_id}/ws")
+async def live_socket(websocket: WebSocket, session_id: str):
+    """
+    实时预览 WebSocket：编辑器发送 full（完整文本）或 edit（按行替换）消息，
+    服务端增量解析后向同一会话的所有连接推送补丁
+    """
+    await LivePreview.serve(websocket, session_id, websocket.query_params.get('from'))
+
+@app.post("/mindmap/tree")
+async def markdown_tree(request: Request, encoding: str = "verbose", max_depth: Optional[int] = None):
+    """
+    将Markdown文本转换为思维导图节点树（JSON），供自行渲染的客户端使用
+    不生成HTML、不写入文件，与 /upload 等接口共用渲染缓存
+    参数:
+    - encoding: compact 或 verbose（默认）
+    - max_depth: 最大返回层级（根节点为第 0 层），缺省时返回完整节点树
+    """
+    return await MindmapService.markdown_tree(request, encoding, max_depth)
 
 # ==================== 文件管理相关路由 ====================
 
@@ -113,30 +232,60 @@ async def upload_file(request: Request, file: UploadFile = File(...)):
     """
     return await FileService.upload_file(request, file)
 
+@app.post("/upload-files")
+async def upload_files(request: Request, files: List[UploadFile] = File(...)):
+    """
+    批量上传多个文件到static目录
+    每个文件单独校验类型和大小，结果按上传顺序返回，允许部分成功
+    """
+    return await FileService.upload_files(request, files)
+
+@app.post("/download/bundle")
+async def download_bundle(request: Request):
+    """
+    将多个文件打包为ZIP流式下载
+    请求体(JSON):
+    - paths: 文件路径列表，如 ["text_files/a.txt", "1700000000_abcd1234.png"]
+    - filter: 按条件筛选，如 {"category": "text_files", "pattern": "*.md", "extensions": [".md"]}
+    """
+    return await FileService.download_bundle(request)
+
 @app.get("/download/{file_path:path}")
-def download_file(file_path: str):
+async def download_file(file_path: str):
     """
     下载或预览文件
     支持浏览器直接打开PDF、图片等文件
     支持子目录路径，如 text_files/filename.txt
     """
-    return FileService.download_file(file_path)
+    return await WorkloadPools.run('file_io', FileService.download_file, file_path)
 
 @app.get("/preview/{file_path:path}")
-def preview_file(file_path: str):
+async def preview_file(file_path: str):
     """
     预览文件（在浏览器中直接显示）
     主要用于文本文件的预览
     支持子目录路径，如 text_files/filename.txt
     """
-    return FileService.preview_file(file_path)
+    return await WorkloadPools.run('file_io', FileService.preview_file, file_path)
 
 @app.get("/files")
-def list_files(request: Request):
+async def list_files(request: Request):
     """
     获取所有已上传文件列表
     """
-    return FileService.list_files(request)
+    return await WorkloadPools.run('listing', FileService.list_files, request)
+
+@app.get("/search")
+async def search(request: Request, q: str, page: int = 1, page_size: int = 20, category: Optional[str] = None):
+    """
+    全文检索保存的文本文件和思维导图的Markdown源文件
+    参数:
+    - q: 查询内容，多个关键词之间为"与"关系，支持中文
+    - page / page_size: 分页（从 1 开始）
+    - category: 只检索 text_files 或 markdown
+    返回: 按相关度排序的结果，包含访问地址和高亮摘要
+    """
+    return await WorkloadPools.run('listing', SearchIndex.search, str(request.base_url), q, page, page_size, category)
 
 @app.post("/save")
 async def save_text_to_file(request: Request, text_content: str = Form(...), filename: str = Form(...)):
@@ -148,7 +297,38 @@ async def save_text_to_file(request: Request, text_content: str = Form(...), fil
     - filename: 文件名（可选扩展名，默认.txt）
     返回: 文件的预览地址（可在浏览器中直接查看）
     """
-    return FileService.save_text_to_file(request, text_content, filename)
+    return await WorkloadPools.run('file_io', FileService.save_text_to_file, request, text_content, filename)
+
+@app.post("/save/append")
+async def append_text_to_file(request: Request, filename: str = Form(...), text_content: str = Form("")):
+    """
+    向已保存的文本文件末尾追加内容（只提交新增部分）
+    参数:
+    - filename: 已保存的文件名，如 notes.txt 或 text_files/notes.txt
+    - text_content: 要追加的文本
+    返回: 预览地址（与保存时相同）和追加后的文件大小
+    """
+    return await WorkloadPools.run('file_io', FileService.append_text, request, filename, text_content)
+
+@app.post("/save/replace-range")
+async def replace_text_range(request: Request, filename: str = Form(...), start: int = Form(...),
+                             end: int = Form(...), text_content: str = Form("")):
+    """
+    替换已保存文本文件中 [start, end) 的内容（UTF-8 字节偏移）
+    start == end 时为插入，text_content 为空时为删除
+    返回: 预览地址（与保存时相同）和替换后的文件大小
+    """
+    return await WorkloadPools.run('file_io', FileService.replace_text_range, request, filename, start, end, text_content)
+
+# ==================== 静态文件挂载 ====================
+
+# 动态挂载静态文件目录
+# 挂载放在所有路由之后，避免 /html 等前缀遮盖同前缀下的接口（如子树加载接口）
+# 以 . 开头的隐藏文件（文件元数据 .{文件名}.meta.json、原子写入的临时文件）不对外提供
+for static_type, config in STATIC_FILES_CONFIG.items():
+    if config['enabled']:
+        app.mount(config['url_prefix'], PublicStaticFiles(directory=config['path']), name=static_type)
+        print(f"已挂载静态文件: {config['url_prefix']} -> {config['path']}")
 
 # ==================== 应用启动 ====================
 
@@ -160,13 +340,16 @@ def is_running_as_exe():
 if __name__ == "__main__":
     import uvicorn
     
-    # 如果是exe运行，强制关闭热加载
-    reload_enabled = False if is_running_as_exe() else DEBUG
+    # 如果是exe运行，强制关闭热加载；多进程模式与热加载互斥，同样关闭
+    reload_enabled = False if is_running_as_exe() or WORKERS > 1 else DEBUG
     
     print(f"打包后关闭热加载: reload={reload_enabled}")
+    print(f"工作进程数: {WORKERS}")
     
     # 在exe环境中直接传递app对象，而不是字符串
     if is_running_as_exe():
+        if WORKERS > 1:
+            print("exe 环境不支持多进程模式，使用单进程运行")
         uvicorn.run(
             app,  # 直接传递app对象
             host=SERVER_HOST,
@@ -178,5 +361,6 @@ if __name__ == "__main__":
             "main:app",  # 开发环境使用字符串引用
             host=SERVER_HOST,
             port=SERVER_PORT,
-            reload=reload_enabled
+            reload=reload_enabled,
+            workers=WORKERS
         )
@@ -0,0 +1,120 @@
+"""
+原子写入模块
+
+文件服务和思维导图服务共用的写入层，保证并发读写时不会读到写了一半的文件：
+- 内容先写入同目录下的隐藏临时文件（.{文件名}.{进程号}.{随机串}.tmp），完成后 rename 覆盖目标
+- 新文件名通过 O_EXCL 预留，多个写入方不会选中同一个名字
+- 读-改-写操作持有按路径的锁（PathLock），同一文件的修改串行执行
+临时文件以点开头，不会出现在文件列表中；进程中断残留的临时文件在启动时清理。
+"""
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+from .path_lock import PathLock
+
+TEMP_SUFFIX = '.tmp'
+
+
+class AtomicWriter:
+    """原子写入类"""
+
+    @staticmethod
+    def temp_path_for(path: Path) -> Path:
+        """目标文件对应的临时文件路径（同目录，保证 rename 是原子操作）"""
+        return path.with_name(f".{path.name}.{os.getpid()}.{uuid.uuid4().hex[:8]}{TEMP_SUFFIX}")
+
+    @staticmethod
+    def _replace(source: Path, target: Path):
+        """rename 覆盖目标文件；Windows 下目标正被读取时稍后重试"""
+        for attempt in range(10):
+            try:
+                os.replace(source, target)
+                return
+            except PermissionError:
+                if os.name != 'nt' or attempt == 9:
+                    raise
+                time.sleep(0.05)
+
+    @staticmethod
+    @contextmanager
+    def open(path: Path, mode: str = 'wb', encoding: Optional[str] = None):
+        """
+        以原子方式写入文件
+        用法:
+            with AtomicWriter.open(file_path) as f:
+                f.write(...)
+        正常退出时临时文件替换目标文件；出现异常时删除临时文件，目标文件保持不变
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = AtomicWriter.temp_path_for(path)
+        try:
+            with open(temp_path, mode, encoding=encoding) as f:
+                yield f
+            AtomicWriter._replace(temp_path, path)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+
+    @staticmethod
+    def write_bytes(path: Path, data: bytes):
+        """以原子方式写入二进制内容"""
+        with AtomicWriter.open(path, 'wb') as f:
+            f.write(data)
+
+    @staticmethod
+    def write_text(path: Path, text: str, encoding: str = 'utf-8'):
+        """以原子方式写入文本内容"""
+        with AtomicWriter.open(path, 'w', encoding=encoding) as f:
+            f.write(text)
+
+    @staticmethod
+    def reserve(directory: Path, candidates: Iterable[str]) -> Path:
+        """
+        依次尝试用 O_EXCL 创建候选文件名，返回第一个成功预留的路径
+        预留后的空文件随后由 open/write_* 以原子方式替换为实际内容
+        """
+        directory.mkdir(parents=True, exist_ok=True)
+        for name in candidates:
+            path = directory / name
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                continue
+            os.close(fd)
+            return path
+        raise FileExistsError(f"没有可用的文件名: {directory}")
+
+    @staticmethod
+    def update_text(path: Path, transform: Callable[[str], str], encoding: str = 'utf-8') -> str:
+        """
+        读-改-写：持有路径锁读取文件、转换内容并以原子方式写回，返回新内容
+        同一文件的并发修改串行执行，读者始终看到完整的旧版本或新版本
+        """
+        with PathLock.hold(path):
+            with open(path, 'r', encoding=encoding) as f:
+                content = transform(f.read())
+            AtomicWriter.write_text(path, content, encoding)
+        return content
+
+    @staticmethod
+    def cleanup_temp_files(directories: Iterable[Path], max_age: float) -> int:
+        """删除进程中断后残留的临时文件（只处理早于 max_age 秒之前的文件）"""
+        cutoff = time.time() - max_age
+        removed = 0
+        for directory in directories:
+            if not directory.exists():
+                continue
+            for path in directory.glob(f'.*{TEMP_SUFFIX}'):
+                try:
+                    if path.is_file() and path.stat().st_mtime < cutoff:
+                        path.unlink()
+                        removed += 1
+                except OSError:
+                    continue
+        if removed:
+            print(f"已清理残留的写入临时文件: {removed} 个")
+        return removed
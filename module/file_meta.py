@@ -0,0 +1,277 @@
+"""
+文件元数据模块
+
+上传和保存文件时对写入的数据流做一次内容识别，结果保存在文件旁边的隐藏文件 .{文件名}.meta.json 中：
+- mime: 按文件头魔数识别的MIME类型（容器格式如 ZIP/OLE 以扩展名为准，无法识别时按扩展名）
+- is_text / encoding: 是否为文本及其编码（BOM → UTF-8 → GB18030，整个数据流校验一遍）
+- line_count: 文本行数
+- size: 识别时的文件大小，与当前大小不一致时视为过期
+预览和下载直接读取元数据选择编码和响应头，无需反复试探解码；没有元数据的旧文件按文件开头识别。
+"""
+import codecs
+import json
+import time
+from pathlib import PurePosixPath
+from typing import Any, Dict, List, Optional, Tuple
+from config import MIME_TYPES, DEFAULT_MIME_TYPE
+from .storage import Storage, ObjectInfo
+
+# 识别魔数使用的文件开头长度
+HEAD_SIZE = 8192
+
+# 文本编码的字节顺序标记
+TEXT_BOMS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+# 候选文本编码（按顺序选择第一个能完整解码的）
+TEXT_ENCODINGS = ('utf-8', 'gb18030')
+
+# 文件头魔数: (偏移, 字节串, MIME类型)
+MAGIC_NUMBERS: List[Tuple[int, bytes, str]] = [
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (0, b'\xff\xd8\xff', 'image/jpeg'),
+    (0, b'GIF87a', 'image/gif'),
+    (0, b'GIF89a', 'image/gif'),
+    (0, b'%PDF-', 'application/pdf'),
+    (0, b'PK\x03\x04', 'application/zip'),
+    (0, b'PK\x05\x06', 'application/zip'),
+    (0, b'Rar!\x1a\x07', 'application/vnd.rar'),
+    (0, b'7z\xbc\xaf\x27\x1c', 'application/x-7z-compressed'),
+    (0, b'\x1f\x8b', 'application/gzip'),
+    (0, b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'application/x-ole-storage'),
+    (0, b'ID3', 'audio/mpeg'),
+    (0, b'\xff\xfb', 'audio/mpeg'),
+    (4, b'ftypqt', 'video/quicktime'),
+    (4, b'ftyp', 'video/mp4'),
+]
+
+# 容器格式：同一种魔数对应多种文件（docx/xlsx 都是 ZIP，doc/xls 都是 OLE），扩展名已知时以扩展名为准
+CONTAINER_MIME_TYPES = {'application/zip', 'application/x-ole-storage'}
+
+META_SUFFIX = '.meta.json'
+
+
+class ContentSniffer:
+    """数据流内容识别：边写入边喂入数据，结束时得到元数据"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.head = b''
+        self.size = 0
+        self.newlines = 0
+        self.last_byte = b''
+        self.binary = False
+        self.decoders: Optional[List[Tuple[str, Any]]] = None
+
+    def feed(self, data: bytes):
+        if not data:
+            return
+        if len(self.head) < HEAD_SIZE:
+            self.head += data[:HEAD_SIZE - len(self.head)]
+        self.size += len(data)
+        self.last_byte = data[-1:]
+        if self.binary:
+            return
+        if self.decoders is None:
+            self._start()
+            if self.binary:
+                return
+        self.newlines += data.count(b'\n')
+        if self.decoders[0][0] != 'utf-16' and b'\x00' in data:
+            self.binary = True
+            return
+        self._decode(data, final=False)
+
+    def _start(self):
+        """根据开头（BOM、魔数）确定候选编码，已识别为二进制格式的不再做文本检查"""
+        if FileMeta.magic_mime(self.head) is not None:
+            self.binary = True
+            return
+        for bom, encoding in TEXT_BOMS:
+            if self.head.startswith(bom):
+                self.decoders = [(encoding, codecs.getincrementaldecoder(encoding)())]
+                return
+        self.decoders = [(encoding, codecs.getincrementaldecoder(encoding)()) for encoding in TEXT_ENCODINGS]
+
+    def _decode(self, data: bytes, final: bool):
+        survivors = []
+        for encoding, decoder in self.decoders:
+            try:
+                decoder.decode(data, final=final)
+                survivors.append((encoding, decoder))
+            except UnicodeDecodeError:
+                continue
+        self.decoders = survivors
+        if not survivors:
+            self.binary = True
+
+    def result(self) -> Dict[str, Any]:
+        """结束识别，返回元数据"""
+        if self.decoders is None and not self.binary:
+            self._start()
+        if not self.binary:
+            self._decode(b'', final=True)
+        encoding = None if self.binary else self.decoders[0][0]
+        line_count = None
+        if encoding is not None:
+            line_count = self.newlines + (1 if self.size and self.last_byte != b'\n' else 0)
+        return {
+            "mime": FileMeta.resolve_mime(self.name, self.head, encoding is not None),
+            "is_text": encoding is not None,
+            "encoding": encoding,
+            "line_count": line_count,
+            "size": self.size,
+            "sniffed_at": time.time()
+        }
+
+
+class SniffingReader:
+    """包装文件对象，读取的数据同时喂给 ContentSniffer"""
+
+    def __init__(self, source, sniffer: ContentSniffer):
+        self.source = source
+        self.sniffer = sniffer
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.source.read(size)
+        self.sniffer.feed(data)
+        return data
+
+
+class SniffingWriter:
+    """包装文件对象，写入的数据同时喂给 ContentSniffer"""
+
+    def __init__(self, dest, sniffer: ContentSniffer):
+        self.dest = dest
+        self.sniffer = sniffer
+
+    def write(self, data: bytes) -> int:
+        self.sniffer.feed(data)
+        return self.dest.write(data)
+
+
+class FileMeta:
+    """文件元数据类"""
+
+    @staticmethod
+    def magic_mime(head: bytes) -> Optional[str]:
+        """按文件头魔数识别MIME类型"""
+        for offset, magic, mime in MAGIC_NUMBERS:
+            if head[offset:offset + len(magic)] == magic:
+                return mime
+        if head[:4] == b'RIFF' and head[8:12] in (b'WEBP', b'AVI '):
+            return 'image/webp' if head[8:12] == b'WEBP' else 'video/x-msvideo'
+        return None
+
+    @staticmethod
+    def resolve_mime(name: str, head: bytes, is_text: bool) -> str:
+        """综合魔数和扩展名确定MIME类型"""
+        extension_mime = MIME_TYPES.get(PurePosixPath(name).suffix.lower())
+        magic = FileMeta.magic_mime(head)
+        if magic is not None:
+            if magic in CONTAINER_MIME_TYPES and extension_mime is not None:
+                return extension_mime
+            return magic
+        if is_text:
+            if extension_mime is not None and (extension_mime.startswith('text/') or extension_mime in
+                                               ('application/json', 'application/xml', 'application/javascript',
+                                                'image/svg+xml')):
+                return extension_mime
+            return 'text/plain'
+        return extension_mime or DEFAULT_MIME_TYPE
+
+    @staticmethod
+    def sniff_bytes(name: str, data: bytes) -> Dict[str, Any]:
+        """识别内存中的完整内容"""
+        sniffer = ContentSniffer(name)
+        sniffer.feed(data)
+        return sniffer.result()
+
+    @staticmethod
+    def sniff_head(name: str, head: bytes) -> Dict[str, Any]:
+        """
+        只根据文件开头识别（没有元数据的旧文件），不统计行数、不保存
+        开头末尾被截断的多字节字符不算解码错误
+        """
+        sniffer = ContentSniffer(name)
+        sniffer.feed(head)
+        if sniffer.decoders is None and not sniffer.binary:
+            sniffer._start()
+        encoding = None if sniffer.binary or not sniffer.decoders else sniffer.decoders[0][0]
+        return {
+            "mime": FileMeta.resolve_mime(name, sniffer.head, encoding is not None),
+            "is_text": encoding is not None,
+            "encoding": encoding,
+            "line_count": None,
+            "size": None
+        }
+
+    @staticmethod
+    def meta_key(key: str) -> str:
+        """元数据文件的对象键：同目录下的 .{文件名}.meta.json"""
+        path = PurePosixPath(key)
+        return str(path.with_name(f".{path.name}{META_SUFFIX}"))
+
+    @staticmethod
+    def save(key: str, meta: Dict[str, Any]):
+        """保存元数据；失败只记录日志，预览和下载会退回按文件开头识别"""
+        try:
+            data = json.dumps(meta, ensure_ascii=False).encode('utf-8')
+            Storage.backend().put_bytes(FileMeta.meta_key(key), data, 'application/json')
+        except Exception as e:
+            print(f"保存文件元数据失败 {key}: {str(e)}")
+
+    @staticmethod
+    def load(key: str, info: ObjectInfo) -> Optional[Dict[str, Any]]:
+        """读取元数据，不存在或与文件当前大小不一致（文件已在别处被修改）时返回 None"""
+        try:
+            meta = json.loads(Storage.backend().read_bytes(FileMeta.meta_key(key)))
+        except (OSError, ValueError):
+            return None
+        if not isinstance(meta, dict) or meta.get("size") != info.size:
+            return None
+        return meta
+
+    @staticmethod
+    def content_type(meta: Dict[str, Any]) -> str:
+        """响应的 Content-Type，文本类型带上识别出的字符集"""
+        mime = meta.get("mime") or DEFAULT_MIME_TYPE
+        encoding = meta.get("encoding")
+        if meta.get("is_text") and encoding:
+            charset = 'utf-8' if encoding == 'utf-8-sig' else encoding
+            return f"{mime}; charset={charset}"
+        return mime
+
+    @staticmethod
+    def refresh(key: str) -> Optional[Dict[str, Any]]:
+        """重新读取整个文件识别内容并保存元数据"""
+        try:
+            sniffer = ContentSniffer(PurePosixPath(key).name)
+            for chunk in Storage.backend().iter_read(key):
+                sniffer.feed(chunk)
+        except OSError as e:
+            print(f"识别文件内容失败 {key}: {str(e)}")
+            return None
+        meta = sniffer.result()
+        FileMeta.save(key, meta)
+        return meta
+
+    @staticmethod
+    def after_append(meta: Optional[Dict[str, Any]], data: bytes, size: int,
+                     ends_with_newline: bool) -> Optional[Dict[str, Any]]:
+        """
+        追加UTF-8文本后增量更新元数据，不重新扫描整个文件
+        原文件不是UTF-8文本或没有元数据时返回 None，由调用方重新识别
+        """
+        if meta is None or meta.get("encoding") not in ('utf-8', 'utf-8-sig') or meta.get("line_count") is None:
+            return None
+        lines = meta["line_count"]
+        if data:
+            # 原文件末尾没有换行时，最后一行与追加内容的第一行是同一行
+            if lines and not ends_with_newline:
+                lines -= 1
+            lines += data.count(b'\n') + (0 if data.endswith(b'\n') else 1)
+        return dict(meta, line_count=lines, size=size, sniffed_at=time.time())
@@ -2,17 +2,41 @@
 文件上传下载服务模块
 """
 import os
+import io
+import codecs
+import itertools
 import time
 import uuid
-from pathlib import Path
+import json
+import fnmatch
+import asyncio
+import re
+from pathlib import Path, PurePosixPath
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, BinaryIO, Iterator, Optional, Tuple
 from fastapi import Request, UploadFile, HTTPException
-from fastapi.responses import FileResponse, Response
+from fastapi.responses import Response, StreamingResponse
 from config import (
-    STATIC_DIR, MAX_FILE_SIZE, CHUNK_SIZE,
-    ALLOWED_EXTENSIONS, MIME_TYPES, DEFAULT_MIME_TYPE
+    STATIC_DIR, MAX_FILE_SIZE, MAX_FILES_PER_UPLOAD,
+    ALLOWED_EXTENSIONS, MIME_TYPES, DEFAULT_MIME_TYPE, PREVIEW_MAX_TEXT_BYTES
 )
+from .metrics import Metrics
+from .zip_stream import ZipStream
+from .path_lock import PathLock
+from .atomic_writer import AtomicWriter
+from .storage import Storage, ObjectInfo, LimitedReader, SizeLimitExceeded
+from .search_index import SearchIndex
+from .file_meta import FileMeta, ContentSniffer, SniffingReader, SniffingWriter
+from .workload_pools import WorkloadPools
+
+# 预览时按原样流式返回的MIME类型前缀（另外还有 application/pdf）
+INLINE_MEDIA_PREFIXES = ('image/', 'audio/', 'video/')
+
+# 作为纯文本预览的扩展名
+TEXT_PREVIEW_EXTENSIONS = {'.txt', '.md', '.json', '.xml', '.csv', '.log'}
+
+# 打包下载请求体（筛选条件JSON）的大小上限，单位字节
+BUNDLE_MAX_REQUEST_BYTES = 64 * 1024
 
 
 class FileService:
@@ -70,34 +94,15 @@ class FileService:
             
             # 生成唯一文件名
             unique_filename = FileService.generate_unique_filename(file.filename)
-            file_path = STATIC_DIR / unique_filename
             
-            # 检查文件大小并保存文件
-            file_size = 0
+            # 保存文件 - 流式写入存储后端避免内存问题
+            # 本地存储先写入临时文件再替换，对象存储超过阈值时分片上传；
+            # 超过大小限制时中止写入，不会留下不完整的文件
+            meta = await WorkloadPools.run('file_io', FileService._write_upload, file.file, unique_filename)
+            file_size = meta["size"]
             
-            # 保存文件 - 使用流式写入避免内存问题
-            with open(file_path, 'wb') as f:
-                # 重置文件指针到开始位置
-                await file.seek(0)
-                
-                # 分块读取和写入文件
-                while True:
-                    chunk = await file.read(CHUNK_SIZE)
-                    if not chunk:
-                        break
-                    
-                    file_size += len(chunk)
-                    
-                    # 检查文件大小
-                    if file_size > MAX_FILE_SIZE:
-                        # 删除已创建的文件
-                        file_path.unlink(missing_ok=True)
-                        raise HTTPException(
-                            status_code=400,
-                            detail=f"文件太大。最大允许大小: {MAX_FILE_SIZE // (1024*1024)}MB"
-                        )
-                    
-                    f.write(chunk)
+            Metrics.incr("file_upload_total")
+            Metrics.incr("file_upload_bytes_total", file_size)
             
             # 返回下载链接，拼接base URL
             base_url = str(request.base_url)
@@ -108,99 +113,226 @@ class FileService:
                 "original_filename": file.filename,
                 "saved_filename": unique_filename,
                 "download_url": download_url,
-                "file_size": file_size
+                "file_size": file_size,
+                "mime_type": meta["mime"],
+                "encoding": meta["encoding"],
+                "line_count": meta["line_count"]
             }
             
         except HTTPException:
             # 重新抛出HTTP异常
             raise
         except Exception as e:
-            # 清理可能创建的文件
-            if 'file_path' in locals() and file_path.exists():
-                file_path.unlink(missing_ok=True)
             raise HTTPException(status_code=500, detail=f"文件保存失败: {str(e)}")
     
     @staticmethod
-    def download_file(filename: str) -> FileResponse:
+    def _file_too_large() -> HTTPException:
+        return HTTPException(
+            status_code=400,
+            detail=f"文件太大。最大允许大小: {MAX_FILE_SIZE // (1024*1024)}MB"
+        )
+    
+    @staticmethod
+    def _write_upload(source: BinaryIO, key: str) -> Dict[str, Any]:
         """
-        下载static目录中的文件
+        将已接收的上传内容（临时文件）写入存储后端，返回识别出的文件元数据（含大小）
+        写入的同时识别内容（MIME类型、编码、行数）并保存元数据，不需要再读一遍文件
+        超过 MAX_FILE_SIZE 时放弃写入并抛出 400
         """
-        file_path = STATIC_DIR / filename
+        source.seek(0)
+        sniffer = ContentSniffer(key)
+        try:
+            Storage.backend().put_file(
+                key, LimitedReader(SniffingReader(source, sniffer), MAX_FILE_SIZE), FileService.get_mime_type(key)
+            )
+        except SizeLimitExceeded:
+            raise FileService._file_too_large()
+        meta = sniffer.result()
+        FileMeta.save(key, meta)
+        return meta
+    
+    @staticmethod
+    async def _save_one(request: Request, index: int, file: UploadFile) -> Dict[str, Any]:
+        """保存批量上传中的单个文件，返回该文件的结果（失败时包含错误信息）"""
+        result: Dict[str, Any] = {"index": index, "original_filename": file.filename}
+        try:
+            if not file.filename:
+                raise HTTPException(status_code=400, detail="没有选择文件")
+            if not FileService.is_allowed_file(file.filename):
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"不支持的文件类型。支持的类型: {', '.join(ALLOWED_EXTENSIONS)}"
+                )
+            # 大小已知时直接拒绝，不必复制
+            if file.size is not None and file.size > MAX_FILE_SIZE:
+                raise FileService._file_too_large()
+            
+            unique_filename = FileService.generate_unique_filename(file.filename)
+            meta = await WorkloadPools.run('file_io', FileService._write_upload, file.file, unique_filename)
+            file_size = meta["size"]
+            Metrics.incr("file_upload_total")
+            Metrics.incr("file_upload_bytes_total", file_size)
+            result.update({
+                "status": "success",
+                "saved_filename": unique_filename,
+                "download_url": f"{request.base_url}download/{unique_filename}",
+                "file_size": file_size,
+                "mime_type": meta["mime"],
+                "encoding": meta["encoding"],
+                "line_count": meta["line_count"]
+            })
+        except HTTPException as e:
+            result.update({"status": "error", "status_code": e.status_code, "error": e.detail})
+        except Exception as e:
+            result.update({"status": "error", "status_code": 500, "error": f"文件保存失败: {str(e)}"})
+        if result["status"] == "error":
+            Metrics.incr("file_upload_failed_total")
+        return result
+    
+    @staticmethod
+    async def upload_files(request: Request, files: List[UploadFile]) -> Dict[str, Any]:
+        """
+        批量上传多个文件到static目录
+        各文件在 file_io 线程池中并发写入，逐个校验类型和大小；
+        结果按上传顺序返回，部分失败不影响其他文件
+        """
+        if not files:
+            raise HTTPException(status_code=400, detail="没有选择文件")
+        if len(files) > MAX_FILES_PER_UPLOAD:
+            raise HTTPException(
+                status_code=400,
+                detail=f"单次最多上传 {MAX_FILES_PER_UPLOAD} 个文件"
+            )
         
-        if not file_path.exists():
-            raise HTTPException(status_code=404, detail="文件不存在")
+        FileService.create_directories()
+        results = await asyncio.gather(*(
+            FileService._save_one(request, index, file) for index, file in enumerate(files)
+        ))
+        succeeded = sum(1 for result in results if result["status"] == "success")
+        Metrics.incr("file_batch_upload_total")
         
-        # 根据文件扩展名确定MIME类型
-        media_type = FileService.get_mime_type(filename)
+        return {
+            "message": "文件上传完成" if succeeded == len(results) else "部分文件上传失败" if succeeded else "文件上传失败",
+            "total": len(results),
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "files": results
+        }
+    
+    @staticmethod
+    def download_file(filename: str) -> Response:
+        """
+        下载static目录中的文件
+        对象存储时重定向到预签名地址（可配置为由服务端转发）
+        """
+        key = Storage.normalize_key(filename)
         
-        return FileResponse(
-            path=str(file_path),
-            filename=filename,
-            media_type=media_type
-        )
+        # 优先使用上传时识别出的MIME类型（文本带字符集），没有元数据时根据文件扩展名确定
+        info = Storage.backend().stat(key)
+        meta = FileMeta.load(key, info) if info is not None else None
+        media_type = FileMeta.content_type(meta) if meta else FileService.get_mime_type(filename)
+        
+        return Storage.file_response(key, PurePosixPath(key).name, media_type)
+    
+    @staticmethod
+    def iter_decoded_text(chunks: Iterator[bytes], encoding: str, limit: int) -> Iterator[bytes]:
+        """
+        将文本文件逐块转码为UTF-8输出，最多读取 limit 字节，超出时截断并附加提示
+        非法字节替换为 U+FFFD，不会整块丢弃
+        """
+        decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        remaining = limit
+        truncated = False
+        try:
+            for chunk in chunks:
+                if len(chunk) > remaining:
+                    chunk = chunk[:remaining]
+                    truncated = True
+                remaining -= len(chunk)
+                text = decoder.decode(chunk)
+                if text:
+                    yield text.encode('utf-8')
+                if truncated:
+                    break
+            tail = decoder.decode(b'', final=not truncated)
+            if tail:
+                yield tail.encode('utf-8')
+            if truncated:
+                Metrics.incr("file_preview_truncated_total")
+                yield f"\n\n[预览已截断：仅显示前 {limit // (1024 * 1024)}MB，完整内容请下载文件]\n".encode('utf-8')
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
     
     @staticmethod
     def preview_file(filename: str) -> Response:
         """
         预览文件（在浏览器中直接显示）
-        主要用于文本文件的预览
+        按MIME类型分派：
+        - 图片、PDF、音视频：按原样流式返回（支持 Range），浏览器内联显示
+        - 文本（含HTML/CSS/JS）：按识别出的编码逐块转码为UTF-8流式返回，超过 PREVIEW_MAX_TEXT_BYTES 截断
+        - 其他类型：内容是文本时按文本预览，二进制文件改为下载
+        类型和编码取自上传/保存时记录的元数据；没有元数据的旧文件按第一块内容识别
         """
         # 支持子目录路径，如 text_files/filename.txt
-        file_path = STATIC_DIR / filename
+        key = Storage.normalize_key(filename)
+        backend = Storage.backend()
+        info = backend.stat(key)
         
-        print(f"DEBUG: 预览文件请求: {filename}")
-        print(f"DEBUG: 完整路径: {file_path}")
-        print(f"DEBUG: 文件是否存在: {file_path.exists()}")
-        print(f"DEBUG: STATIC_DIR: {STATIC_DIR}")
+        if info is None:
+            raise HTTPException(status_code=404, detail=f"文件不存在: {key}")
         
-        if not file_path.exists():
-            # 列出static目录下的所有文件来帮助调试
-            if STATIC_DIR.exists():
-                print(f"DEBUG: static目录内容:")
-                for item in STATIC_DIR.rglob('*'):
-                    if item.is_file():
-                        print(f"  - {item.relative_to(STATIC_DIR)}")
-            raise HTTPException(status_code=404, detail=f"文件不存在: {file_path}")
+        # 获取纯文件名（不包含路径）
+        display_filename = PurePosixPath(key).name
+        file_extension = PurePosixPath(key).suffix.lower()
+        meta = FileMeta.load(key, info)
+        chunks = None
+        if meta is None:
+            # 没有元数据（旧文件或已在别处修改）：读取第一块内容识别，之后继续使用同一个数据流
+            chunks = backend.iter_read(key)
+            head = next(chunks, b'')
+            meta = FileMeta.sniff_head(key, head)
+            Metrics.incr("file_preview_sniff_total")
+        media_type = meta["mime"]
         
-        # 读取文件内容
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-        except UnicodeDecodeError:
-            # 如果UTF-8解码失败，尝试其他编码
-            try:
-                with open(file_path, 'r', encoding='gbk') as f:
-                    content = f.read()
-            except UnicodeDecodeError:
-                # 如果还是失败，返回二进制内容
-                with open(file_path, 'rb') as f:
-                    content = f.read().decode('utf-8', errors='ignore')
+        if media_type.startswith(INLINE_MEDIA_PREFIXES) or media_type == 'application/pdf':
+            # 图片、PDF、音视频：不解码，原样流式返回
+            if chunks is not None:
+                chunks.close()
+            Metrics.incr("file_preview_stream_total")
+            return Storage.file_response(key, display_filename, media_type, inline=True)
         
         # 根据文件扩展名确定内容类型
-        file_extension = Path(filename).suffix.lower()
-        
-        if file_extension == '.html':
+        if file_extension in ('.html', '.htm'):
             # HTML文件，直接渲染
-            media_type = 'text/html; charset=utf-8'
+            text_media_type = 'text/html; charset=utf-8'
         elif file_extension == '.css':
             # CSS文件，直接渲染
-            media_type = 'text/css; charset=utf-8'
+            text_media_type = 'text/css; charset=utf-8'
         elif file_extension == '.js':
             # JavaScript文件，直接渲染
-            media_type = 'application/javascript; charset=utf-8'
-        elif file_extension in ['.txt', '.md', '.json', '.xml', '.csv', '.log']:
-            # 文本文件，在浏览器中显示
-            media_type = 'text/plain; charset=utf-8'
+            text_media_type = 'application/javascript; charset=utf-8'
         else:
-            # 其他文件类型，尝试作为文本显示
-            media_type = 'text/plain; charset=utf-8'
+            # 文本文件及其他文本内容，在浏览器中显示
+            text_media_type = 'text/plain; charset=utf-8'
         
-        # 获取纯文件名（不包含路径）
-        display_filename = Path(filename).name
+        encoding = meta["encoding"]
+        if encoding is None:
+            if file_extension not in TEXT_PREVIEW_EXTENSIONS and text_media_type.startswith('text/plain'):
+                # 无法作为文本显示的二进制文件，改为下载
+                if chunks is not None:
+                    chunks.close()
+                Metrics.incr("file_preview_binary_total")
+                return Storage.file_response(key, display_filename, media_type)
+            encoding = 'utf-8'
         
-        return Response(
-            content=content,
-            media_type=media_type,
+        # 逐块转码
+        chunks = backend.iter_read(key) if chunks is None else itertools.chain([head], chunks)
+        Metrics.incr("file_preview_text_total")
+        return StreamingResponse(
+            WorkloadPools.iterate('file_io', FileService.iter_decoded_text(chunks, encoding, PREVIEW_MAX_TEXT_BYTES)),
+            media_type=text_media_type,
             headers={
                 "Content-Disposition": f"inline; filename={display_filename}",
                 "Cache-Control": "no-cache"
@@ -213,10 +345,6 @@ class FileService:
         将文本内容保存为文件
         """
         try:
-            # 创建文本文件专用目录
-            text_files_dir = STATIC_DIR / "text_files"
-            text_files_dir.mkdir(exist_ok=True)
-            
             # 验证文件名
             if not filename or not filename.strip():
                 raise HTTPException(status_code=400, detail="文件名不能为空")
@@ -224,33 +352,42 @@ class FileService:
             # 清理文件名，移除非法字符
             import re
             clean_filename = re.sub(r'[<>:"/\\|?*]', '_', filename.strip())
+            # 以 . 开头的是隐藏文件（如文件元数据），不允许保存
+            if clean_filename.startswith('.'):
+                raise HTTPException(status_code=400, detail="文件名不能以 . 开头")
             
             # 如果没有扩展名，默认添加.txt
             if not Path(clean_filename).suffix:
                 clean_filename += '.txt'
             
-            # 检查文件是否已存在，如果存在则添加时间戳
-            file_path = text_files_dir / clean_filename
-            if file_path.exists():
-                timestamp = str(int(time.time()))
-                name_part = Path(clean_filename).stem
-                ext_part = Path(clean_filename).suffix
-                clean_filename = f"{name_part}_{timestamp}{ext_part}"
-                file_path = text_files_dir / clean_filename
+            # 以"不存在才创建"的方式预留文件名（本地 O_EXCL，对象存储条件写入）：
+            # 已存在时添加时间戳，仍冲突时再追加序号
+            timestamp = str(int(time.time()))
+            name_part = Path(clean_filename).stem
+            ext_part = Path(clean_filename).suffix
+            candidates = [clean_filename, f"{name_part}_{timestamp}{ext_part}"]
+            candidates += [f"{name_part}_{timestamp}_{n}{ext_part}" for n in range(1, 1000)]
+            backend = Storage.backend()
+            key = next((f"text_files/{name}" for name in candidates
+                        if backend.create_exclusive(f"text_files/{name}")), None)
+            if key is None:
+                raise HTTPException(status_code=409, detail=f"没有可用的文件名: {clean_filename}")
+            clean_filename = PurePosixPath(key).name
             
-            # 保存文本内容到文件
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(text_content)
+            # 保存文本内容到文件（整体替换预留的空文件）
+            data = text_content.encode('utf-8')
+            backend.put_bytes(key, data, FileService.get_mime_type(clean_filename))
+            FileMeta.save(key, FileMeta.sniff_bytes(clean_filename, data))
             
-            print(f"DEBUG: 文件已保存到: {file_path}")
-            print(f"DEBUG: 文件是否存在: {file_path.exists()}")
+            SearchIndex.index_key(key)
             
             # 获取文件大小
-            file_size = file_path.stat().st_size
+            file_size = len(data)
+            Metrics.incr("text_save_total")
+            Metrics.incr("text_save_bytes_total", file_size)
             
             # 返回预览链接
             preview_url = FileService.get_preview_url(request, f"text_files/{clean_filename}")
-            print(f"DEBUG: 生成的预览URL: {preview_url}")
             
             return preview_url
             
@@ -258,42 +395,284 @@ class FileService:
             # 重新抛出HTTP异常
             raise
         except Exception as e:
-            # 清理可能创建的文件
-            if 'file_path' in locals() and file_path.exists():
-                file_path.unlink(missing_ok=True)
+            # 清理可能预留的文件
+            if 'key' in locals() and key:
+                Storage.backend().delete(key)
             raise HTTPException(status_code=500, detail=f"保存文本文件失败: {str(e)}")
     
+    @staticmethod
+    def resolve_text_file(filename: str) -> Tuple[str, str]:
+        """
+        定位 text_files 目录中已保存的文本文件，返回 (对象键, 文件名)
+        filename 可以带 text_files/ 前缀；清理规则与保存时一致
+        """
+        if not filename or not filename.strip():
+            raise HTTPException(status_code=400, detail="文件名不能为空")
+        name = filename.strip()
+        if name.startswith('text_files/'):
+            name = name[len('text_files/'):]
+        clean_filename = re.sub(r'[<>:"/\\|?*]', '_', name)
+        if clean_filename.startswith('.'):
+            raise HTTPException(status_code=404, detail=f"文件不存在: text_files/{clean_filename}")
+        if not Path(clean_filename).suffix:
+            clean_filename += '.txt'
+        key = f"text_files/{clean_filename}"
+        if not Storage.backend().exists(key):
+            raise HTTPException(status_code=404, detail=f"文件不存在: {key}")
+        return key, clean_filename
+    
+    @staticmethod
+    def _text_edit_result(request: Request, clean_filename: str, file_size: int, **extra) -> Dict[str, Any]:
+        result = {
+            "preview_url": FileService.get_preview_url(request, f"text_files/{clean_filename}"),
+            "filename": f"text_files/{clean_filename}",
+            "size": file_size
+        }
+        result.update(extra)
+        return result
+    
+    @staticmethod
+    def _check_char_boundary(f: BinaryIO, offset: int, size: int, name: str):
+        """偏移量必须落在UTF-8字符边界上，不能切开多字节字符"""
+        if 0 < offset < size:
+            f.seek(offset)
+            byte = f.read(1)
+            if byte and (byte[0] & 0xC0) == 0x80:
+                raise HTTPException(status_code=400, detail=f"{name} 不在UTF-8字符边界上")
+    
+    @staticmethod
+    def append_text(request: Request, filename: str, text_content: str) -> Dict[str, Any]:
+        """
+        向已保存的文本文件末尾追加内容，只需提交新增部分
+        同一文件的写操作串行执行，预览地址保持不变；对象存储不支持追加，读出后整体写回
+        """
+        key, clean_filename = FileService.resolve_text_file(filename)
+        data = text_content.encode('utf-8')
+        backend = Storage.backend()
+        with PathLock.hold(STATIC_DIR / key):
+            file_path = backend.local_path(key)
+            if file_path is not None:
+                with open(file_path, 'ab+') as f:
+                    old_size = f.seek(0, os.SEEK_END)
+                    if old_size:
+                        f.seek(old_size - 1)
+                    ends_with_newline = f.read(1) == b'\n'
+                    f.write(data)
+                    file_size = f.tell()
+            else:
+                old = backend.read_bytes(key)
+                old_size, ends_with_newline = len(old), old.endswith(b'\n')
+                content = old + data
+                backend.put_bytes(key, content, FileService.get_mime_type(clean_filename))
+                file_size = len(content)
+            # UTF-8文本只增量更新行数，其他情况重新识别整个文件
+            meta = FileMeta.load(key, ObjectInfo(key, old_size, 0))
+            meta = FileMeta.after_append(meta, data, file_size, ends_with_newline)
+            if meta is not None:
+                FileMeta.save(key, meta)
+            else:
+                FileMeta.refresh(key)
+        SearchIndex.index_key(key)
+        Metrics.incr("text_append_total")
+        Metrics.incr("text_save_bytes_total", len(data))
+        return FileService._text_edit_result(request, clean_filename, file_size, appended=len(data))
+    
+    @staticmethod
+    def _copy_bytes(src: BinaryIO, dest: BinaryIO, length: int):
+        """从 src 当前位置分块复制 length 个字节到 dest"""
+        while length > 0:
+            chunk = src.read(min(length, 256 * 1024))
+            if not chunk:
+                break
+            dest.write(chunk)
+            length -= len(chunk)
+    
+    @staticmethod
+    def _splice(src: BinaryIO, dest: BinaryIO, size: int, start: int, end: int, data: bytes):
+        """将 src 中 [start, end) 替换为 data 后写入 dest"""
+        if end > size:
+            raise HTTPException(status_code=400, detail=f"区间超出文件大小（{size} 字节）")
+        FileService._check_char_boundary(src, start, size, "start")
+        FileService._check_char_boundary(src, end, size, "end")
+        src.seek(0)
+        FileService._copy_bytes(src, dest, start)
+        dest.write(data)
+        src.seek(end)
+        FileService._copy_bytes(src, dest, size - end)
+    
+    @staticmethod
+    def replace_text_range(request: Request, filename: str, start: int, end: int, text_content: str) -> Dict[str, Any]:
+        """
+        用新内容替换已保存文本文件中 [start, end) 的字节区间（UTF-8 字节偏移）
+        - start == end 时为插入，text_content 为空时为删除
+        - 只需提交替换部分；新内容写入临时文件后整体替换，读者不会看到修改了一半的文件
+        同一文件的写操作串行执行，预览地址保持不变
+        """
+        if start < 0 or end < start:
+            raise HTTPException(status_code=400, detail="区间无效：需要 0 <= start <= end")
+        key, clean_filename = FileService.resolve_text_file(filename)
+        data = text_content.encode('utf-8')
+        backend = Storage.backend()
+        # 写入新内容的同时重新识别（编码、行数）
+        sniffer = ContentSniffer(clean_filename)
+        with PathLock.hold(STATIC_DIR / key):
+            file_path = backend.local_path(key)
+            if file_path is not None:
+                with open(file_path, 'rb') as src:
+                    size = src.seek(0, os.SEEK_END)
+                    with AtomicWriter.open(file_path) as dest:
+                        FileService._splice(src, SniffingWriter(dest, sniffer), size, start, end, data)
+            else:
+                src = io.BytesIO(backend.read_bytes(key))
+                dest = io.BytesIO()
+                FileService._splice(src, SniffingWriter(dest, sniffer), len(src.getvalue()), start, end, data)
+                backend.put_bytes(key, dest.getvalue(), FileService.get_mime_type(clean_filename))
+            file_size = sniffer.size
+            FileMeta.save(key, sniffer.result())
+        SearchIndex.index_key(key)
+        Metrics.incr("text_replace_total")
+        Metrics.incr("text_save_bytes_total", len(data))
+        return FileService._text_edit_result(
+            request, clean_filename, file_size, start=start, end=end, inserted=len(data)
+        )
+    
+    @staticmethod
+    def iter_listed_files() -> Iterator[ObjectInfo]:
+        """遍历文件列表中可见的文件（上传的文件和 text_files 目录），产出存储对象信息"""
+        backend = Storage.backend()
+        # 跳过html、markdown等子目录中的文件，但包含text_files目录
+        yield from backend.list('', recursive=False)
+        yield from backend.list('text_files/', recursive=False)
+    
+    @staticmethod
+    def get_category(relative_path: str) -> str:
+        """文件分类：text_files 或 uploaded"""
+        return "text_files" if "text_files" in str(relative_path) else "uploaded"
+    
     @staticmethod
     def list_files(request: Request) -> Dict[str, List[Dict[str, Any]]]:
         """
         获取static目录中所有文件的列表
         """
         try:
-            if not STATIC_DIR.exists():
-                return {"files": []}
-            
             files = []
             base_url = str(request.base_url)
             
-            # 遍历static目录及其子目录
-            for file_path in STATIC_DIR.rglob('*'):
-                if file_path.is_file() and not file_path.name.startswith('.'):
-                    # 跳过html子目录中的文件，但包含text_files目录
-                    if file_path.parent.name in ['static', 'text_files']:
-                        # 计算相对路径
-                        relative_path = file_path.relative_to(STATIC_DIR)
-                        stat = file_path.stat()
-                        
-                        files.append({
-                            "filename": str(relative_path),
-                            "size": stat.st_size,
-                            "modified_time": datetime.fromtimestamp(stat.st_mtime).isoformat(),
-                            "download_url": f"{base_url}download/{relative_path}",
-                            "preview_url": f"{base_url}preview/{relative_path}",
-                            "category": "text_files" if "text_files" in str(relative_path) else "uploaded"
-                        })
+            for info in FileService.iter_listed_files():
+                files.append({
+                    "filename": info.key,
+                    "size": info.size,
+                    "modified_time": datetime.fromtimestamp(info.mtime).isoformat(),
+                    "download_url": f"{base_url}download/{info.key}",
+                    "preview_url": f"{base_url}preview/{info.key}",
+                    "category": FileService.get_category(info.key)
+                })
             
             return {"files": files}
             
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"获取文件列表失败: {str(e)}")
+
+    @staticmethod
+    def resolve_static_path(relative_path: str) -> ObjectInfo:
+        """将相对路径解析为存储中的文件，拒绝越出static目录的路径"""
+        info = Storage.backend().stat(Storage.normalize_key(relative_path))
+        if info is None:
+            raise HTTPException(status_code=404, detail=f"文件不存在: {relative_path}")
+        return info
+    
+    @staticmethod
+    def select_bundle_files(body: Dict[str, Any]) -> List[ObjectInfo]:
+        """
+        根据请求选择要打包的文件，返回存储对象列表（对象键即包内路径）
+        - paths: 相对static目录的文件路径列表
+        - filter: {"category": "uploaded"|"text_files", "pattern": 通配符, "extensions": [".md", ...]}
+          在文件列表（GET /files）可见的文件中筛选
+        """
+        paths = body.get('paths')
+        filters = body.get('filter')
+        if paths is None and filters is None:
+            raise HTTPException(status_code=400, detail="请提供 paths 或 filter")
+        
+        entries: Dict[str, ObjectInfo] = {}
+        if paths is not None:
+            if not isinstance(paths, list) or not all(isinstance(p, str) and p for p in paths):
+                raise HTTPException(status_code=400, detail="paths 必须是文件路径字符串列表")
+            for relative_path in paths:
+                info = FileService.resolve_static_path(relative_path)
+                entries.setdefault(info.key, info)
+        
+        if filters is not None:
+            if not isinstance(filters, dict):
+                raise HTTPException(status_code=400, detail="filter 必须是对象")
+            category = filters.get('category')
+            pattern = filters.get('pattern')
+            extensions = filters.get('extensions') or []
+            if category is not None and not isinstance(category, str):
+                raise HTTPException(status_code=400, detail="filter.category 必须是字符串")
+            if pattern is not None and not isinstance(pattern, str):
+                raise HTTPException(status_code=400, detail="filter.pattern 必须是通配符字符串")
+            if not isinstance(extensions, list) or not all(isinstance(ext, str) for ext in extensions):
+                raise HTTPException(status_code=400, detail="filter.extensions 必须是扩展名字符串列表")
+            extensions = {ext.lower() for ext in extensions}
+            for info in FileService.iter_listed_files():
+                if category and FileService.get_category(info.key) != category:
+                    continue
+                if pattern and not fnmatch.fnmatch(info.key, pattern):
+                    continue
+                if extensions and PurePosixPath(info.key).suffix.lower() not in extensions:
+                    continue
+                entries.setdefault(info.key, info)
+        
+        if not entries:
+            raise HTTPException(status_code=404, detail="没有符合条件的文件")
+        return list(entries.values())
+    
+    @staticmethod
+    def _bundle_request_too_large() -> HTTPException:
+        return HTTPException(
+            status_code=413,
+            detail=f"请求体太大。打包条件最大允许: {BUNDLE_MAX_REQUEST_BYTES // 1024}KB"
+        )
+    
+    @staticmethod
+    async def download_bundle(request: Request) -> StreamingResponse:
+        """
+        将多个文件打包为ZIP流式下载
+        边读取边压缩边发送，不写临时文件，内存占用与打包大小无关；
+        已压缩的文件类型直接存储
+        请求体超过 BUNDLE_MAX_REQUEST_BYTES 时立即停止接收并返回 413
+        """
+        content_length = request.headers.get('content-length')
+        if content_length and content_length.isdigit() and int(content_length) > BUNDLE_MAX_REQUEST_BYTES:
+            raise FileService._bundle_request_too_large()
+        parts = []
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > BUNDLE_MAX_REQUEST_BYTES:
+                raise FileService._bundle_request_too_large()
+            parts.append(chunk)
+        try:
+            body = json.loads(b''.join(parts) or b'{}')
+        except (ValueError, RecursionError):
+            raise HTTPException(status_code=400, detail="请求体必须是JSON")
+        if not isinstance(body, dict):
+            raise HTTPException(status_code=400, detail="请求体必须是JSON对象")
+        
+        entries = await WorkloadPools.run('listing', FileService.select_bundle_files, body)
+        total_size = sum(info.size for info in entries)
+        Metrics.incr("file_bundle_total")
+        Metrics.incr("file_bundle_files_total", len(entries))
+        Metrics.incr("file_bundle_bytes_total", total_size)
+        print(f"打包下载: {len(entries)} 个文件, {total_size} 字节")
+        
+        bundle_name = f"bundle_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+        return StreamingResponse(
+            WorkloadPools.iterate('file_io', ZipStream.iter_zip(Storage.backend(), entries)),
+            media_type="application/zip",
+            headers={
+                "Content-Disposition": f'attachment; filename="{bundle_name}"',
+                "X-Bundle-File-Count": str(len(entries))
+            }
+        )
@@ -0,0 +1,33 @@
+"""
+跨进程唯一ID生成模块
+"""
+import itertools
+import os
+import threading
+import time
+
+
+class IdGenerator:
+    """
+    生成在多个工作进程之间唯一、且按时间大致有序的ID
+
+    格式: {毫秒时间戳}_{进程号(16进制)}_{进程内序号(16进制)}
+    同一毫秒内同一进程的多次调用由序号区分，不同进程由进程号区分
+    """
+
+    _counter = itertools.count(1)
+    _pid = os.getpid()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def generate() -> str:
+        """生成唯一ID"""
+        # fork 出的子进程会继承父进程的计数器，进程号变化时重置
+        pid = os.getpid()
+        if pid != IdGenerator._pid:
+            with IdGenerator._lock:
+                if pid != IdGenerator._pid:
+                    IdGenerator._counter = itertools.count(1)
+                    IdGenerator._pid = pid
+        seq = next(IdGenerator._counter)
+        return f"{time.time_ns() // 1_000_000}_{pid:x}_{seq:x}"
@@ -0,0 +1,485 @@
+"""
+思维导图实时预览模块
+
+编辑器通过 WebSocket 发送 Markdown 修改，服务端按行增量解析，只把发生变化的子树以补丁形式推送给打开的预览页面，
+页面就地修改节点树后重新绘制，不再每次修改都启动 markmap、写入HTML文件并刷新页面。
+- 每行的解析结果（标题/列表项/代码块标记及其节点HTML）按行缓存，一次修改只重新解析被修改的行；
+  节点树由缓存的行结果重建，与上一版本的节点树比较，相同的子树整体跳过
+- 补丁按顺序应用: {"op": "replace", "path": [...], "node": {...}} 替换子树；
+  {"op": "splice", "path": [...], "index": i, "remove": n, "insert": [...]} 修改子节点列表（path 为从根节点起的子节点下标）
+- 实时预览的节点不带 payload.lines（插入一行会使后面所有节点的行号变化，补丁就不再局部）
+会话保存在工作进程内存中，编辑器和预览页面需要连接到同一个工作进程。
+"""
+import asyncio
+import json
+import re
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+from fastapi import WebSocket, WebSocketDisconnect, HTTPException
+from fastapi.responses import HTMLResponse
+from config import MARKDOWN_DIR, MAX_MARKDOWN_SIZE, LIVE_ENABLED, LIVE_MAX_SESSIONS, LIVE_SESSION_IDLE
+from .markdown_tree import MarkdownTree
+from .mindmap_service import MAP_ID_RE
+from .metrics import Metrics
+from .storage import Storage
+from .workload_pools import WorkloadPools
+
+SESSION_ID_RE = re.compile(r'^[\w-]{1,64}$')
+
+# 虚拟根节点（有多个顶级节点时作为根节点显示）
+ROOT_ENTRY = (0, 'root', '')
+
+# 节点: [行解析结果, 子节点1, 子节点2, ...]（每个节点只分配一个列表）
+Node = List[Any]
+
+LIVE_PAGE = '''<!doctype html>
+<html>
+<head>
+<meta charset="UTF-8">
+<meta name="viewport" content="width=device-width, initial-scale=1.0">
+<title>实时预览</title>
+<style>
+* { margin: 0; padding: 0; }
+#mindmap { display: block; width: 100vw; height: 100vh; }
+#live-status { position: fixed; top: 10px; left: 10px; font: 12px sans-serif; color: #888; }
+</style>
+<link rel="stylesheet" href="../htmljs/style.css">
+</head>
+<body>
+<svg id="mindmap"></svg>
+<div id="live-status">连接中…</div>
+<script src="../htmljs/d3.min.js"></script><script src="../htmljs/index2.js"></script><script src="../htmljs/index.js"></script>
+<script>
+(function() {
+    var statusEl = document.getElementById('live-status');
+    var markmap = window.markmap;
+    var mm = window.mm = markmap.Markmap.create('svg#mindmap', markmap.deriveOptions({}), {content: '', children: []});
+    var toolbar = new markmap.Toolbar();
+    toolbar.attach(mm);
+    var toolbarEl = toolbar.render();
+    toolbarEl.setAttribute('style', 'position:absolute;bottom:20px;right:20px');
+    document.body.append(toolbarEl);
+
+    var rev = -1;
+    var fitted = false;
+    var resyncing = false;
+    var retryDelay = 500;
+    var socket = null;
+
+    function nodeAt(path) {
+        var node = mm.state.data;
+        for (var i = 0; i < path.length; i++) {
+            node = node.children[path[i]];
+        }
+        return node;
+    }
+
+    // 就地修改当前节点树，保留未变化节点的折叠状态
+    function applyOp(op) {
+        if (op.op === 'replace') {
+            if (!op.path.length) {
+                mm.state.data = op.node;
+                return;
+            }
+            nodeAt(op.path.slice(0, -1)).children[op.path[op.path.length - 1]] = op.node;
+        } else if (op.op === 'splice') {
+            var node = nodeAt(op.path);
+            node.children = node.children || [];
+            node.children.splice.apply(node.children, [op.index, op.remove].concat(op.insert));
+        }
+    }
+
+    function render(data) {
+        return mm.setData(data).then(function() {
+            if (!fitted) {
+                fitted = true;
+                mm.fit();
+            }
+        });
+    }
+
+    function connect() {
+        var url = (location.protocol === 'https:' ? 'wss://' : 'ws://') + location.host
+            + location.pathname.replace(/\\/$/, '') + '/ws' + location.search;
+        socket = new WebSocket(url);
+        socket.onopen = function() {
+            retryDelay = 500;
+            statusEl.textContent = '已连接';
+        };
+        socket.onmessage = function(event) {
+            var message = JSON.parse(event.data);
+            if (message.type === 'snapshot') {
+                rev = message.rev;
+                resyncing = false;
+                render(message.root);
+            } else if (message.type === 'patch') {
+                if (resyncing) {
+                    return;
+                }
+                if (message.rev !== rev + 1) {
+                    // 漏掉了补丁，重新获取完整节点树
+                    resyncing = true;
+                    socket.send(JSON.stringify({type: 'snapshot'}));
+                    return;
+                }
+                message.ops.forEach(applyOp);
+                rev = message.rev;
+                render(mm.state.data);
+            }
+        };
+        socket.onclose = function() {
+            statusEl.textContent = '连接已断开，正在重连…';
+            setTimeout(connect, retryDelay);
+            retryDelay = Math.min(retryDelay * 2, 10000);
+        };
+    }
+
+    connect();
+})();
+</script>
+</body>
+</html>
+'''
+
+
+class LiveDocument:
+    """按行缓存解析结果的 Markdown 文档"""
+
+    def __init__(self):
+        self.lines: List[str] = []
+        self.entries: List[Optional[Tuple[Any, ...]]] = []
+        self.size = 0
+
+    def copy(self) -> 'LiveDocument':
+        """浅复制（行和行解析结果都是不可变对象），修改在副本上进行，成功后再替换原文档"""
+        document = LiveDocument()
+        document.lines = list(self.lines)
+        document.entries = list(self.entries)
+        document.size = self.size
+        return document
+
+    def replace_lines(self, start: int, end: int, new_lines: List[str]) -> int:
+        """将 [start, end) 行替换为新的行，只解析新的行，返回解析的行数"""
+        start = max(0, min(start, len(self.lines)))
+        end = max(start, min(end, len(self.lines)))
+        size = self.size + sum(len(line) + 1 for line in new_lines) - sum(len(line) + 1 for line in self.lines[start:end])
+        if size > MAX_MARKDOWN_SIZE:
+            raise ValueError(f"Markdown 内容太大。最大允许大小: {MAX_MARKDOWN_SIZE // (1024*1024)}MB")
+        self.lines[start:end] = new_lines
+        self.entries[start:end] = [MarkdownTree.classify_line(line) for line in new_lines]
+        self.size = size
+        return len(new_lines)
+
+    def set_text(self, text: str) -> int:
+        """
+        替换为完整的新文本：跳过首尾未变化的行，只解析中间变化的部分
+        按换行符分行，与编辑器的行号一致（空文本为一个空行，末尾的空行也算一行）
+        """
+        old = self.lines
+        new = [line[:-1] if line.endswith('\r') else line for line in text.split('\n')]
+        limit = min(len(old), len(new))
+        prefix = 0
+        while prefix < limit and old[prefix] == new[prefix]:
+            prefix += 1
+        suffix = 0
+        while suffix < limit - prefix and old[len(old) - 1 - suffix] == new[len(new) - 1 - suffix]:
+            suffix += 1
+        return self.replace_lines(prefix, len(old) - suffix, new[prefix:len(new) - suffix])
+
+    def build(self) -> Node:
+        """由缓存的行解析结果重建节点树（与 MarkdownTree.parse 的嵌套规则一致，只遍历缓存，不再解析）"""
+        root: Node = [ROOT_ENTRY]
+        levels = [0]
+        parents = [root]
+        in_fence: Optional[str] = None
+        start = MarkdownTree.front_matter_end(self.lines)
+        for entry in (self.entries[start:] if start else self.entries):
+            if entry is None:
+                continue
+            level = entry[0]
+            if level == 'fence':
+                if in_fence is None:
+                    in_fence = entry[1]
+                elif entry[1] == in_fence:
+                    in_fence = None
+                continue
+            if in_fence is not None:
+                continue
+            while levels[-1] >= level:
+                levels.pop()
+                parents.pop()
+            node: Node = [entry]
+            parents[-1].append(node)
+            levels.append(level)
+            parents.append(node)
+        return root
+
+
+class LiveTree:
+    """实时预览节点树的导出与比较"""
+
+    @staticmethod
+    def display_root(root: Node) -> Node:
+        # 与 markmap 一致：只有一个顶级节点时将其作为根节点
+        return root[1] if len(root) == 2 else root
+
+    @staticmethod
+    def _export_node(node: Node) -> Dict[str, Any]:
+        entry = node[0]
+        result: Dict[str, Any] = {"content": entry[2], "children": []}
+        if entry is not ROOT_ENTRY:
+            result["payload"] = {"tag": entry[1]}
+        return result
+
+    @staticmethod
+    def export(node: Node) -> Dict[str, Any]:
+        """转换为 markmap 的节点格式（用显式栈遍历，嵌套层数不受递归深度限制）"""
+        result = LiveTree._export_node(node)
+        stack = [(node, result["children"])]
+        while stack:
+            current, children = stack.pop()
+            for child in current[1:]:
+                exported = LiveTree._export_node(child)
+                children.append(exported)
+                stack.append((child, exported["children"]))
+        return result
+
+    @staticmethod
+    def _same(old: Node, new: Node) -> bool:
+        """子树是否完全相同；嵌套过深无法直接比较时视为不同，由 diff 逐层比较"""
+        try:
+            return old == new
+        except RecursionError:
+            return False
+
+    @staticmethod
+    def diff_roots(old_root: Node, new_root: Node) -> List[Dict[str, Any]]:
+        """比较两个版本的节点树，返回按顺序应用的补丁"""
+        old, new = LiveTree.display_root(old_root), LiveTree.display_root(new_root)
+        if (old is old_root) != (new is new_root):
+            # 顶级节点在一个和多个之间变化，根节点不同
+            return [{"op": "replace", "path": [], "node": LiveTree.export(new)}]
+        ops: List[Dict[str, Any]] = []
+        LiveTree.diff(old, new, [], ops)
+        return ops
+
+    @staticmethod
+    def diff(old: Node, new: Node, path: List[int], ops: List[Dict[str, Any]]):
+        """
+        比较两个子树，将补丁追加到 ops（用显式栈遍历）
+        每个节点先输出自身的补丁，再比较其子节点，子节点的路径使用应用该补丁之后的下标
+        """
+        stack = [(old, new, path)]
+        while stack:
+            old, new, path = stack.pop()
+            if LiveTree._same(old, new):
+                continue
+            if old[0] != new[0]:
+                ops.append({"op": "replace", "path": path, "node": LiveTree.export(new)})
+                continue
+            # 子节点在列表中从下标 1 开始
+            old_count, new_count = len(old) - 1, len(new) - 1
+            limit = min(old_count, new_count)
+            # 首尾节点本身未变化的子节点逐个比较，中间部分整体替换
+            prefix = 0
+            while prefix < limit and old[prefix + 1][0] == new[prefix + 1][0]:
+                prefix += 1
+            suffix = 0
+            while suffix < limit - prefix and old[old_count - suffix][0] == new[new_count - suffix][0]:
+                suffix += 1
+            removed = old_count - prefix - suffix
+            inserted = new[prefix + 1:new_count - suffix + 1]
+            if removed or inserted:
+                ops.append({
+                    "op": "splice", "path": path, "index": prefix, "remove": removed,
+                    "insert": [LiveTree.export(child) for child in inserted]
+                })
+            pending = [(old[index + 1], new[index + 1], path + [index]) for index in range(prefix)]
+            # 中间部分替换后，后缀子节点在新列表中的下标
+            for offset in range(suffix):
+                new_index = new_count - suffix + offset
+                pending.append((old[old_count - suffix + offset + 1], new[new_index + 1], path + [new_index]))
+            stack.extend(reversed(pending))
+
+
+class LiveSession:
+    """一个实时预览会话：文档、当前节点树、版本号和已连接的客户端"""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.document = LiveDocument()
+        self.tree = self.document.build()
+        self.rev = 0
+        self.clients: Set[WebSocket] = set()
+        self.lock = asyncio.Lock()
+        self.touched = time.monotonic()
+
+    def snapshot(self) -> str:
+        return MarkdownTree.dumps(
+            {"type": "snapshot", "rev": self.rev, "root": LiveTree.export(LiveTree.display_root(self.tree))}
+        )
+
+    def apply(self, message: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        应用一次修改，返回 (补丁, 重新解析的行数)
+        - {"type": "full", "markdown": 完整文本}
+        - {"type": "edit", "from": 起始行, "to": 结束行（不含）, "lines": [新的行]}
+        修改在文档副本上进行，比较完成后才替换当前文档和节点树；出错时会话保持原状
+        """
+        document = self.document.copy()
+        if message.get("type") == "full":
+            markdown = message.get("markdown")
+            if not isinstance(markdown, str):
+                raise ValueError("markdown 必须是字符串")
+            reparsed = document.set_text(markdown)
+        else:
+            start, end, lines = message.get("from"), message.get("to"), message.get("lines")
+            if not isinstance(start, int) or not isinstance(end, int) or start > end:
+                raise ValueError("from/to 必须是整数且 from 不大于 to")
+            if not isinstance(lines, list) or not all(isinstance(line, str) for line in lines):
+                raise ValueError("lines 必须是字符串数组")
+            reparsed = document.replace_lines(start, end, lines)
+        tree = document.build()
+        ops = LiveTree.diff_roots(self.tree, tree)
+        self.document, self.tree = document, tree
+        if ops:
+            self.rev += 1
+        return ops, reparsed
+
+    def load_map(self, map_id: str) -> bool:
+        """以已生成的思维导图的 Markdown 源文件作为初始内容"""
+        md_path = MARKDOWN_DIR / f"{map_id}.md"
+        if not MAP_ID_RE.match(map_id) or not Storage.ensure_local(md_path):
+            return False
+        self.document.set_text(md_path.read_text(encoding='utf-8', errors='replace'))
+        self.tree = self.document.build()
+        return True
+
+
+class LivePreview:
+    """实时预览会话管理与 WebSocket 处理"""
+
+    _sessions: Dict[str, LiveSession] = {}
+
+    @staticmethod
+    def page(session_id: str) -> HTMLResponse:
+        """预览页面：连接同一会话的 WebSocket，收到补丁后就地更新思维导图"""
+        if not LIVE_ENABLED:
+            raise HTTPException(status_code=404, detail="实时预览未启用")
+        if not SESSION_ID_RE.match(session_id):
+            raise HTTPException(status_code=400, detail="会话ID只能包含字母、数字、下划线和连字符（最长64个字符）")
+        return HTMLResponse(LIVE_PAGE, headers={"Cache-Control": "no-cache"})
+
+    @staticmethod
+    def _get_session(session_id: str) -> Optional[LiveSession]:
+        session = LivePreview._sessions.get(session_id)
+        if session is not None:
+            return session
+        # 清理长时间没有客户端连接的会话
+        now = time.monotonic()
+        for key, idle in list(LivePreview._sessions.items()):
+            if not idle.clients and now - idle.touched > LIVE_SESSION_IDLE:
+                del LivePreview._sessions[key]
+        if len(LivePreview._sessions) >= LIVE_MAX_SESSIONS:
+            return None
+        session = LivePreview._sessions[session_id] = LiveSession(session_id)
+        return session
+
+    @staticmethod
+    def _update_gauges():
+        Metrics.set_gauge("live_sessions", len(LivePreview._sessions))
+        Metrics.set_gauge("live_clients", sum(len(session.clients) for session in LivePreview._sessions.values()))
+
+    @staticmethod
+    async def _broadcast(session: LiveSession, text: str):
+        clients = list(session.clients)
+        results = await asyncio.gather(*(client.send_text(text) for client in clients), return_exceptions=True)
+        for client, result in zip(clients, results):
+            if isinstance(result, Exception):
+                session.clients.discard(client)
+
+    @staticmethod
+    async def serve(websocket: WebSocket, session_id: str, from_map: Optional[str] = None):
+        """
+        处理一个 WebSocket 连接（编辑器和预览页面使用同一接口）
+        连接后先收到 snapshot，之后每次修改所有客户端都会收到 patch，发送修改的客户端另外收到 ack
+        """
+        if not LIVE_ENABLED or not SESSION_ID_RE.match(session_id):
+            await websocket.close(code=1008)
+            return
+        session = LivePreview._get_session(session_id)
+        if session is None:
+            await websocket.close(code=1013, reason="too many live sessions")
+            return
+        await websocket.accept()
+        if from_map and not session.document.lines:
+            async with session.lock:
+                if not session.document.lines:
+                    await WorkloadPools.run('file_io', session.load_map, from_map)
+        session.clients.add(websocket)
+        session.touched = time.monotonic()
+        LivePreview._update_gauges()
+        try:
+            async with session.lock:
+                await websocket.send_text(await WorkloadPools.run('cpu', session.snapshot))
+            while True:
+                try:
+                    message = json.loads(await websocket.receive_text())
+                except (ValueError, RecursionError):
+                    await websocket.send_json({"type": "error", "detail": "消息不是有效的JSON"})
+                    continue
+                kind = message.get("type") if isinstance(message, dict) else None
+                if kind == "snapshot":
+                    async with session.lock:
+                        await websocket.send_text(await WorkloadPools.run('cpu', session.snapshot))
+                elif kind in ("full", "edit"):
+                    await LivePreview._handle_edit(websocket, session, message)
+                elif kind == "ping":
+                    await websocket.send_json({"type": "pong"})
+                else:
+                    await websocket.send_json({"type": "error", "detail": "type 必须是 full、edit、snapshot 或 ping"})
+        except WebSocketDisconnect:
+            pass
+        finally:
+            session.clients.discard(websocket)
+            session.touched = time.monotonic()
+            LivePreview._update_gauges()
+
+    @staticmethod
+    async def _handle_edit(websocket: WebSocket, session: LiveSession, message: Dict[str, Any]):
+        started = time.perf_counter()
+        async with session.lock:
+            try:
+                ops, reparsed = await WorkloadPools.run('cpu', session.apply, message)
+            except ValueError as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+                return
+            except Exception as e:
+                # 会话保持修改前的状态，连接继续可用
+                print(f"实时预览处理修改失败: {session.session_id}: {str(e)}")
+                Metrics.incr("live_edit_failed_total")
+                await websocket.send_json({"type": "error", "detail": f"处理修改失败: {type(e).__name__}"})
+                return
+            # 在锁内广播，保证所有客户端按版本号顺序收到补丁
+            if ops:
+                patch = MarkdownTree.dumps({"type": "patch", "rev": session.rev, "ops": ops})
+                await LivePreview._broadcast(session, patch)
+            rev = session.rev
+        session.touched = time.monotonic()
+        Metrics.incr("live_edit_total")
+        Metrics.incr("live_patch_ops_total", len(ops))
+        Metrics.incr("live_reparsed_lines_total", reparsed)
+        await websocket.send_json({
+            "type": "ack",
+            "rev": rev,
+            "ops": len(ops),
+            "reparsed_lines": reparsed,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 3)
+        })
+
+    @staticmethod
+    def status() -> Dict[str, Any]:
+        return {
+            "sessions": len(LivePreview._sessions),
+            "clients": sum(len(session.clients) for session in LivePreview._sessions.values())
+        }
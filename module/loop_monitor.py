@@ -0,0 +1,214 @@
+"""
+事件循环阻塞检测模块
+
+异步接口中直接执行的同步操作（文件读写、子进程、CPU 密集计算）会阻塞事件循环，期间所有请求都得不到处理。
+- 心跳：事件循环中每隔 interval_ms 调度一次回调，实际执行时间与预定时间之差即调度延迟（lag）
+- 看门狗线程：心跳超过 stall_threshold_ms 未执行时认为事件循环被阻塞，
+  每隔 sample_interval_ms 抓取一次事件循环线程的调用栈，直到事件循环恢复
+- 恢复后输出日志（阻塞时长、阻塞位置、出现最多的调用栈），写入指标，并保留最近的记录供 /metrics 查看
+- 事件循环线程停在 select 上却没有按时执行心跳时，说明它在等待其他线程释放 GIL，
+  此时一并记录各工作线程正在执行的位置（线程池中 CPU 密集的任务同样会拖慢事件循环）
+日志输出和指标写入都在看门狗线程中进行，不占用事件循环。
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from config import (
+    BASE_DIR, LOOP_MONITOR_ENABLED, LOOP_MONITOR_INTERVAL, LOOP_MONITOR_STALL_THRESHOLD,
+    LOOP_MONITOR_SAMPLE_INTERVAL, LOOP_MONITOR_MAX_RECORDS, LOOP_MONITOR_STACK_DEPTH
+)
+from .metrics import Metrics
+
+# 线程处于空闲等待（等待 I/O 或等待任务）时调用栈最内层所在的模块
+IDLE_MODULES = ('selectors.py', 'threading.py', 'queue.py', os.path.join('futures', 'thread.py'))
+
+
+class LoopMonitor:
+    """事件循环阻塞检测类"""
+
+    _loop: Optional[asyncio.AbstractEventLoop] = None
+    _loop_thread_id: Optional[int] = None
+    _handle: Optional[asyncio.TimerHandle] = None
+    _thread: Optional[threading.Thread] = None
+    _stop = threading.Event()
+    _lock = threading.Lock()
+    # 最近一次心跳的执行时间、调度延迟，以及自上次汇报以来的心跳数和最大延迟
+    _last_beat = 0.0
+    _last_lag = 0.0
+    _beats = 0
+    _window_max_lag = 0.0
+    _max_lag = 0.0
+    _stalls = 0
+    _recent: Deque[Dict[str, Any]] = deque(maxlen=LOOP_MONITOR_MAX_RECORDS)
+
+    @staticmethod
+    def start():
+        """在当前事件循环中启动心跳和看门狗线程（启动事件中调用）"""
+        if not LOOP_MONITOR_ENABLED or LoopMonitor._thread is not None:
+            return
+        LoopMonitor._loop = asyncio.get_running_loop()
+        LoopMonitor._loop_thread_id = threading.get_ident()
+        LoopMonitor._stop.clear()
+        LoopMonitor._last_beat = time.monotonic()
+        LoopMonitor._schedule()
+        LoopMonitor._thread = threading.Thread(target=LoopMonitor._watch, name="loop-monitor", daemon=True)
+        LoopMonitor._thread.start()
+
+    @staticmethod
+    def stop():
+        """进程退出时停止心跳和看门狗线程"""
+        LoopMonitor._stop.set()
+        if LoopMonitor._handle is not None:
+            LoopMonitor._handle.cancel()
+            LoopMonitor._handle = None
+        if LoopMonitor._thread is not None:
+            LoopMonitor._thread.join(timeout=1)
+            LoopMonitor._thread = None
+
+    # ==================== 心跳（事件循环中执行） ====================
+
+    @staticmethod
+    def _schedule():
+        expected = time.monotonic() + LOOP_MONITOR_INTERVAL
+        LoopMonitor._handle = LoopMonitor._loop.call_later(LOOP_MONITOR_INTERVAL, LoopMonitor._beat, expected)
+
+    @staticmethod
+    def _beat(expected: float):
+        now = time.monotonic()
+        lag = max(0.0, now - expected)
+        with LoopMonitor._lock:
+            LoopMonitor._last_beat = now
+            LoopMonitor._last_lag = lag
+            LoopMonitor._beats += 1
+            LoopMonitor._window_max_lag = max(LoopMonitor._window_max_lag, lag)
+        if not LoopMonitor._stop.is_set():
+            LoopMonitor._schedule()
+
+    # ==================== 看门狗线程 ====================
+
+    @staticmethod
+    def _watch():
+        stall: Optional[Dict[str, Any]] = None
+        last_report = time.monotonic()
+        while not LoopMonitor._stop.wait(LOOP_MONITOR_SAMPLE_INTERVAL):
+            now = time.monotonic()
+            with LoopMonitor._lock:
+                last_beat = LoopMonitor._last_beat
+                last_lag = LoopMonitor._last_lag
+            overdue = now - (last_beat + LOOP_MONITOR_INTERVAL)
+            if overdue >= LOOP_MONITOR_STALL_THRESHOLD:
+                if stall is None:
+                    stall = {"beat": last_beat, "stacks": Counter(), "threads": Counter(), "samples": 0}
+                frames = sys._current_frames()
+                stack = LoopMonitor._capture_stack(frames.get(LoopMonitor._loop_thread_id))
+                if stack:
+                    stall["stacks"][stack] += 1
+                    stall["samples"] += 1
+                    if LoopMonitor._is_idle(stack):
+                        stall["threads"].update(LoopMonitor._busy_threads(frames))
+            elif stall is not None and last_beat != stall["beat"]:
+                # 事件循环已恢复，恢复后第一次心跳的延迟即阻塞时长
+                LoopMonitor._report_stall(stall, last_lag)
+                stall = None
+            if now - last_report >= 1.0:
+                LoopMonitor._update_gauges()
+                last_report = now
+
+    @staticmethod
+    def _capture_stack(frame) -> Optional[Tuple[str, ...]]:
+        """线程当前的调用栈（由外到内），只保留最内层 stack_depth 层"""
+        if frame is None:
+            return None
+        summary = traceback.extract_stack(frame, limit=LOOP_MONITOR_STACK_DEPTH)
+        return tuple(f"{item.filename}:{item.lineno} in {item.name}" for item in summary)
+
+    @staticmethod
+    def _is_idle(stack: Tuple[str, ...]) -> bool:
+        filename = stack[-1].rsplit(':', 2)[0]
+        return filename.endswith(IDLE_MODULES)
+
+    @staticmethod
+    def _busy_threads(frames: Dict[int, Any]) -> List[str]:
+        """事件循环之外正在执行代码的线程及其位置（"线程名: 位置"）"""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        busy = []
+        for ident, frame in frames.items():
+            if ident in (LoopMonitor._loop_thread_id, threading.get_ident()):
+                continue
+            stack = LoopMonitor._capture_stack(frame)
+            if stack and not LoopMonitor._is_idle(stack):
+                busy.append(f"{names.get(ident, ident)}: {LoopMonitor._blocking_location(stack)}")
+        return busy
+
+    @staticmethod
+    def _blocking_location(stack: Tuple[str, ...]) -> str:
+        """调用栈中最内层的本项目代码，即阻塞发生的位置"""
+        base = str(BASE_DIR)
+        for entry in reversed(stack):
+            if entry.startswith(base) and 'site-packages' not in entry:
+                return entry[len(base):].lstrip('/\\')
+        return stack[-1] if stack else "未知"
+
+    @staticmethod
+    def _report_stall(stall: Dict[str, Any], duration: float):
+        stacks: Counter = stall["stacks"]
+        if stacks:
+            stack, hits = stacks.most_common(1)[0]
+        else:
+            stack, hits = (), 0
+        location = LoopMonitor._blocking_location(stack)
+        threads = [f"{entry}（{count} 次采样）" for entry, count in stall["threads"].most_common(5)]
+        if stack and LoopMonitor._is_idle(stack):
+            location = "等待 GIL（事件循环线程空闲，其他线程占用 GIL）"
+        record = {
+            "at": time.time(),
+            "duration_ms": round(duration * 1000, 1),
+            "location": location,
+            "samples": stall["samples"],
+            "stack": list(stack),
+            "stack_samples": hits,
+            "busy_threads": threads
+        }
+        with LoopMonitor._lock:
+            LoopMonitor._stalls += 1
+            LoopMonitor._max_lag = max(LoopMonitor._max_lag, duration)
+            LoopMonitor._recent.append(record)
+        Metrics.incr("event_loop_stalls_total")
+        Metrics.incr("event_loop_stall_seconds_total", duration)
+        lines = [f"事件循环阻塞 {record['duration_ms']} ms，位置: {location}（{hits}/{stall['samples']} 次采样）"]
+        lines += [f"    {entry}" for entry in stack]
+        if threads:
+            lines.append("  同时在执行的线程:")
+            lines += [f"    {entry}" for entry in threads]
+        print("\n".join(lines))
+
+    @staticmethod
+    def _update_gauges():
+        with LoopMonitor._lock:
+            last_lag = LoopMonitor._last_lag
+            window_max = LoopMonitor._window_max_lag
+            LoopMonitor._window_max_lag = 0.0
+            LoopMonitor._max_lag = max(LoopMonitor._max_lag, window_max)
+        Metrics.set_gauge("event_loop_lag_ms", round(last_lag * 1000, 3))
+        Metrics.set_gauge("event_loop_window_max_lag_ms", round(window_max * 1000, 3))
+
+    @staticmethod
+    def status() -> Dict[str, Any]:
+        """当前进程的事件循环调度延迟和最近的阻塞记录"""
+        with LoopMonitor._lock:
+            recent: List[Dict[str, Any]] = list(LoopMonitor._recent)
+            return {
+                "enabled": LOOP_MONITOR_ENABLED,
+                "running": LoopMonitor._thread is not None,
+                "lag_ms": round(LoopMonitor._last_lag * 1000, 3),
+                "max_lag_ms": round(max(LoopMonitor._max_lag, LoopMonitor._window_max_lag) * 1000, 3),
+                "beats": LoopMonitor._beats,
+                "stalls": LoopMonitor._stalls,
+                "stall_threshold_ms": round(LOOP_MONITOR_STALL_THRESHOLD * 1000, 3),
+                "recent_stalls": recent
+            }
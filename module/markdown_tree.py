@@ -0,0 +1,201 @@
+"""
+Markdown 转思维导图节点树模块
+
+在 Python 中直接将 Markdown 解析为与 markmap 结构一致的节点树：
+{"content": 节点HTML, "children": [...], "payload": {"tag": "h2", "lines": "起始行,结束行"}}
+不启动 markmap 进程，也不写任何文件。
+"""
+import html
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+HEADING_RE = re.compile(r'^ {0,3}(#{1,6})\s+(.*?)\s*#*\s*$')
+LIST_ITEM_RE = re.compile(r'^(\s*)(?:[-*+]|\d+[.)])\s+(.*)$')
+FENCE_RE = re.compile(r'^\s*(```|~~~)')
+TASK_RE = re.compile(r'^\[([ xX])\]\s+')
+
+# 行内格式（作用于已转义的文本）
+INLINE_CODE_RE = re.compile(r'`([^`]+)`')
+BOLD_RE = re.compile(r'(\*\*|__)(?=\S)(.+?)(?<=\S)\1')
+ITALIC_RE = re.compile(r'(?<![*\w])([*_])(?=\S)(.+?)(?<=\S)\1(?![*\w])')
+STRIKE_RE = re.compile(r'~~(?=\S)(.+?)(?<=\S)~~')
+LINK_RE = re.compile(r'\[([^\]]+)\]\(([^)\s]+)(?:\s+&quot;[^)]*&quot;)?\)')
+
+# 列表项层级从该值开始，保证总是挂在标题之下
+LIST_LEVEL_BASE = 10
+
+# 迭代结束标记
+_END = object()
+
+
+class MarkdownTree:
+    """Markdown 节点树解析类"""
+
+    @staticmethod
+    def render_inline(text: str) -> str:
+        """将行内 Markdown 转换为HTML（转义后处理代码、粗体、斜体、删除线和链接）"""
+        escaped = html.escape(text, quote=True)
+        codes: List[str] = []
+
+        def keep_code(match):
+            codes.append(f"<code>{match.group(1)}</code>")
+            return f"\x00{len(codes) - 1}\x00"
+
+        escaped = INLINE_CODE_RE.sub(keep_code, escaped)
+        escaped = BOLD_RE.sub(r'<strong>\2</strong>', escaped)
+        escaped = ITALIC_RE.sub(r'<em>\2</em>', escaped)
+        escaped = STRIKE_RE.sub(r'<del>\1</del>', escaped)
+        escaped = LINK_RE.sub(r'<a href="\2">\1</a>', escaped)
+        return re.sub(r'\x00(\d+)\x00', lambda m: codes[int(m.group(1))], escaped)
+
+    @staticmethod
+    def classify_line(line: str) -> Optional[Tuple[Any, ...]]:
+        """
+        识别单行 Markdown（不依赖上下文，实时预览按行缓存结果）
+        返回 ('fence', 标记)、(层级, 标签, 节点HTML) 或 None（不产生节点的行）
+        """
+        fence = FENCE_RE.match(line)
+        if fence:
+            return ('fence', fence.group(1))
+        heading = HEADING_RE.match(line)
+        if heading:
+            return (len(heading.group(1)), f"h{len(heading.group(1))}", MarkdownTree.render_inline(heading.group(2).strip()))
+        item = LIST_ITEM_RE.match(line)
+        if not item:
+            return None
+        content = item.group(2)
+        task = TASK_RE.match(content)
+        if task:
+            checked = task.group(1) != ' '
+            content = ('☑ ' if checked else '☐ ') + content[task.end():]
+        return (LIST_LEVEL_BASE + len(item.group(1).expandtabs(4)), "li", MarkdownTree.render_inline(content.strip()))
+
+    @staticmethod
+    def front_matter_end(lines: List[str]) -> int:
+        """front matter 之后第一行的行号（没有 front matter 时为 0）"""
+        if lines and lines[0].strip() == '---':
+            for i in range(1, len(lines)):
+                if lines[i].strip() in ('---', '...'):
+                    return i + 1
+        return 0
+
+    @staticmethod
+    def parse(text: str) -> Dict[str, Any]:
+        """
+        解析 Markdown 为节点树
+        标题按级别嵌套，列表项按缩进挂在最近的标题或父列表项下；
+        代码块和 front matter 中的内容不产生节点
+        """
+        root: Dict[str, Any] = {"content": "", "children": [], "payload": {"lines": "0,0"}}
+        stack = [(0, root)]
+        lines = text.splitlines()
+        in_fence: Optional[str] = None
+
+        for line_no in range(MarkdownTree.front_matter_end(lines), len(lines)):
+            entry = MarkdownTree.classify_line(lines[line_no])
+            if entry is None:
+                continue
+            if entry[0] == 'fence':
+                if in_fence is None:
+                    in_fence = entry[1]
+                elif entry[1] == in_fence:
+                    in_fence = None
+                continue
+            if in_fence is not None:
+                continue
+
+            level, tag, content = entry
+            node = {
+                "content": content,
+                "children": [],
+                "payload": {"tag": tag, "lines": f"{line_no},{line_no + 1}"}
+            }
+            while stack[-1][0] >= level:
+                stack.pop()
+            stack[-1][1]["children"].append(node)
+            stack.append((level, node))
+
+        # 与 markmap 一致：只有一个顶级节点时将其作为根节点
+        if len(root["children"]) == 1:
+            return root["children"][0]
+        return root
+
+    @staticmethod
+    def encode(root: Dict[str, Any], encoding: str = 'verbose', max_depth: Optional[int] = None) -> Any:
+        """
+        按指定编码输出节点树，可限制深度（根节点深度为 0）
+        - verbose: {"content", "depth", "children", "payload"}，被截断的节点带 "more": 子节点数
+        - compact: [content] 或 [content, children]；被截断的节点为 [content, 子节点数]
+        """
+        # 用显式栈遍历，嵌套层数不受递归深度限制
+        result_root: Any = None
+        stack: List[Tuple[Dict[str, Any], int, Optional[List[Any]]]] = [(root, 0, None)]
+        while stack:
+            node, depth, siblings = stack.pop()
+            content = node.get('content', '')
+            children = node.get('children') or []
+            truncated = max_depth is not None and depth >= max_depth and bool(children)
+            converted: List[Any] = []
+            if encoding == 'compact':
+                if truncated:
+                    result: Any = [content, len(children)]
+                elif children:
+                    result = [content, converted]
+                else:
+                    result = [content]
+            else:
+                result = {"content": content, "depth": depth, "children": converted}
+                if node.get('payload'):
+                    result["payload"] = node['payload']
+                if truncated:
+                    result["more"] = len(children)
+            if siblings is None:
+                result_root = result
+            else:
+                siblings.append(result)
+            if not truncated:
+                stack.extend((child, depth + 1, converted) for child in reversed(children))
+        return result_root
+
+    @staticmethod
+    def dumps(value: Any) -> str:
+        """
+        输出紧凑的JSON（与 json.dumps(ensure_ascii=False, separators=(',', ':')) 相同）
+        嵌套过深、json 模块超出递归深度时改用显式栈逐层输出
+        """
+        try:
+            return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+        except RecursionError:
+            pass
+        parts: List[str] = []
+        # 每层: [元素迭代器, 结束符, 是否为对象, 已输出的元素数]
+        stack: List[List[Any]] = []
+        current = value
+        while True:
+            if isinstance(current, dict):
+                parts.append('{')
+                stack.append([iter(current.items()), '}', True, 0])
+            elif isinstance(current, (list, tuple)):
+                parts.append('[')
+                stack.append([iter(current), ']', False, 0])
+            else:
+                parts.append(json.dumps(current, ensure_ascii=False))
+            while stack:
+                frame = stack[-1]
+                item = next(frame[0], _END)
+                if item is _END:
+                    parts.append(frame[1])
+                    stack.pop()
+                    continue
+                if frame[3]:
+                    parts.append(',')
+                frame[3] += 1
+                if frame[2]:
+                    key, current = item
+                    parts.append(json.dumps(str(key), ensure_ascii=False) + ':')
+                else:
+                    current = item
+                break
+            else:
+                return ''.join(parts)
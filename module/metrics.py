@@ -0,0 +1,104 @@
+"""
+运行指标模块
+
+各进程在内存中累计指标，由后台线程按 METRICS_FLUSH_INTERVAL 间隔写入共享状态，
+读取时汇总所有工作进程的数据。记录指标只修改内存，不会在事件循环中访问 SQLite。
+"""
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+from config import METRICS_FLUSH_INTERVAL
+from .shared_state import SharedState
+
+
+class Metrics:
+    """指标收集类"""
+
+    _counters: Dict[str, float] = {}
+    _gauges: Dict[str, float] = {}
+    _lock = threading.Lock()
+    _thread: Optional[threading.Thread] = None
+    _stop = threading.Event()
+
+    @staticmethod
+    def incr(name: str, value: float = 1):
+        """累加计数器"""
+        with Metrics._lock:
+            Metrics._counters[name] = Metrics._counters.get(name, 0) + value
+
+    @staticmethod
+    def set_gauge(name: str, value: float):
+        """设置瞬时值"""
+        with Metrics._lock:
+            Metrics._gauges[name] = value
+
+    @staticmethod
+    def local_snapshot() -> Dict[str, Dict[str, float]]:
+        """当前进程的指标"""
+        with Metrics._lock:
+            return {"counters": dict(Metrics._counters), "gauges": dict(Metrics._gauges)}
+
+    @staticmethod
+    def start():
+        """启动后台写入线程（启动事件中调用）"""
+        if Metrics._thread is not None:
+            return
+        Metrics._stop.clear()
+        Metrics._thread = threading.Thread(target=Metrics._flush_loop, name="metrics-flush", daemon=True)
+        Metrics._thread.start()
+
+    @staticmethod
+    def stop():
+        """停止后台写入线程，并写入最后一次指标"""
+        Metrics._stop.set()
+        if Metrics._thread is not None:
+            Metrics._thread.join(timeout=max(METRICS_FLUSH_INTERVAL, 1))
+            Metrics._thread = None
+        Metrics.flush()
+
+    @staticmethod
+    def _flush_loop():
+        """按间隔写入共享状态，直到进程退出"""
+        while not Metrics._stop.wait(METRICS_FLUSH_INTERVAL):
+            Metrics.flush()
+
+    @staticmethod
+    def flush():
+        """将当前进程的指标写入共享状态（在后台线程或线程池中调用）"""
+        snapshot = Metrics.local_snapshot()
+        values = [(name, 'counter', value) for name, value in snapshot["counters"].items()]
+        values += [(name, 'gauge', value) for name, value in snapshot["gauges"].items()]
+        if not values:
+            return
+        try:
+            SharedState.write_metrics(os.getpid(), values)
+        except Exception as e:
+            print(f"写入共享指标失败: {str(e)}")
+
+    @staticmethod
+    def aggregate() -> Dict[str, Any]:
+        """
+        汇总所有工作进程的指标
+        计数器对所有进程求和；瞬时值只统计仍在上报的进程
+        """
+        Metrics.flush()
+        stale_before = time.time() - max(METRICS_FLUSH_INTERVAL * 3, 10)
+        counters: Dict[str, float] = {}
+        gauges: Dict[str, float] = {}
+        per_worker: Dict[str, Dict[str, float]] = {}
+        for row in SharedState.read_metrics():
+            alive = row["updated_at"] >= stale_before
+            if row["kind"] == 'counter':
+                counters[row["name"]] = counters.get(row["name"], 0) + row["value"]
+            elif alive:
+                gauges[row["name"]] = gauges.get(row["name"], 0) + row["value"]
+            if alive:
+                per_worker.setdefault(str(row["pid"]), {})[row["name"]] = row["value"]
+        return {
+            "pid": os.getpid(),
+            "workers": sorted(per_worker),
+            "counters": counters,
+            "gauges": gauges,
+            "per_worker": per_worker
+        }
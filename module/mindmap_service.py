@@ -4,219 +4,852 @@
 import os
 import sys
 import time
+import signal
+import re
+import json
+import asyncio
+import codecs
 import subprocess
 import shutil
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
 from fastapi import Request, HTTPException
-from fastapi.responses import FileResponse
-from config import MARKDOWN_DIR, STATIC_HTML_DIR, ENABLE_SVG_DOWNLOAD_BUTTON
+from fastapi.responses import FileResponse, Response
+from config import (
+    MARKDOWN_DIR, STATIC_HTML_DIR, ENABLE_SVG_DOWNLOAD_BUTTON, MAX_MARKDOWN_SIZE,
+    SUBTREE_INDEX_DIR, LARGE_MAP_NODE_THRESHOLD, LARGE_MAP_INITIAL_DEPTH, LARGE_MAP_NODE_BUDGET,
+    RENDER_TIMEOUT, RENDER_MEMORY_LIMIT_MB, DISCONNECT_POLL_INTERVAL, ORPHAN_CLEANUP_AGE
+)
+from .id_generator import IdGenerator
+from .metrics import Metrics
+from .render_admission import RenderAdmission
+from .mindmap_tree import MindmapTree
+from .markdown_tree import MarkdownTree
+from .render_cache import RenderCache
+from .mindmap_svg import MindmapSvg
+from .atomic_writer import AtomicWriter
+from .storage import Storage
+from .search_index import SearchIndex
+from .workload_pools import WorkloadPools
+
+# 未找到 markmap 时重新探测的最短间隔，单位秒（安装后无需重启服务）
+MARKMAP_REPROBE_SECONDS = 30.0
+
+# 接收Markdown请求体时攒够这么多字节再交给文件线程池写入，单位字节
+MARKDOWN_WRITE_BATCH = 256 * 1024
+
+# 思维导图ID（即生成的文件名主干）只允许这些字符
+MAP_ID_RE = re.compile(r'^[\w.-]+$')
+
+# 节点树接口支持的编码
+TREE_ENCODINGS = ('compact', 'verbose')
+
+# 由规范渲染结果（markmap 输出的CDN版HTML，{id}.html）派生的HTML变体及其文件名后缀
+VARIANT_SUFFIXES = {'cdn': '', 'local': '.local', 'local-svg': '.local-svg'}
+
+# 变体HTML的文件名：{思维导图ID}{变体后缀}.html（思维导图ID中不含点号）
+VARIANT_FILENAME_RE = re.compile(r'^(?P<map_id>[\w-]+)(?P<suffix>\.local(?:-svg)?)?\.html$')
+
+
+class MarkdownSource(NamedTuple):
+    """已保存的Markdown源文件"""
+    path: Path
+    size: int
+    node_count: int
+    digest: str
 
 
 class MindmapService:
     """思维导图服务类"""
     
+    # markmap 可执行文件路径的探测结果
+    _markmap_path: Optional[str] = None
+    _markmap_probed_at = float('-inf')
+    
     @staticmethod
     def create_directories():
         """创建必要的目录"""
         os.makedirs(MARKDOWN_DIR, exist_ok=True)
         os.makedirs(STATIC_HTML_DIR, exist_ok=True)
     
+    @staticmethod
+    def markmap_path(refresh: bool = False) -> Optional[str]:
+        """
+        markmap 可执行文件的路径，探测结果缓存在进程内（启动预热时探测一次）
+        未找到时每隔 MARKMAP_REPROBE_SECONDS 秒重新探测；refresh 为真时立即重新探测
+        """
+        now = time.monotonic()
+        if refresh or (MindmapService._markmap_path is None
+                       and now - MindmapService._markmap_probed_at >= MARKMAP_REPROBE_SECONDS):
+            MindmapService._markmap_path = shutil.which('markmap')
+            MindmapService._markmap_probed_at = now
+        return MindmapService._markmap_path
+    
     @staticmethod
     def check_markmap_available():
         """检查markmap命令是否可用"""
-        markmap_path = shutil.which('markmap')
-        return markmap_path is not None
+        return MindmapService.markmap_path() is not None
     
     @staticmethod
     def generate_filename():
-        """生成基于时间戳的文件名"""
-        return str(int(time.time()))
+        """生成基于时间戳的文件名（多进程下唯一）"""
+        return IdGenerator.generate()
     
     @staticmethod
-    async def process_markdown(request: Request, content: str):
+    def _limit_child_resources(pid: int):
         """
-        处理Markdown内容，生成思维导图
+        渲染子进程启动后立即设置其内存上限（仅Linux，之后派生的子进程继承该上限）
+        不使用 preexec_fn：服务进程中有多个线程，fork 之后、exec 之前在子进程中执行 Python 代码并不安全
         """
+        import resource
+        if not hasattr(resource, 'prlimit'):
+            return
+        # V8 堆之外还有代码、缓冲区等开销，数据段上限留出一倍余量
+        limit = RENDER_MEMORY_LIMIT_MB * 1024 * 1024 * 2
+        try:
+            resource.prlimit(pid, resource.RLIMIT_DATA, (limit, limit))
+        except OSError as e:
+            print(f"设置渲染进程内存上限失败: {str(e)}")
+    
+    @staticmethod
+    def _kill_process_tree(process):
+        """终止渲染进程及其派生的所有子进程"""
         try:
-            # 创建目录
-            MindmapService.create_directories()
-            
-            # 检查markmap是否可用
-            if not MindmapService.check_markmap_available():
-                raise HTTPException(
-                    status_code=500, 
-                    detail="Error: markmap command not found. Please make sure it is installed and added to the system PATH."
-                )
-            
-            # 生成文件名
-            time_name = MindmapService.generate_filename()
-            md_file_name = f"{time_name}.md"
-            html_file_name = f"{time_name}.html"
-            
-            # 保存Markdown文件
-            md_file_path = MARKDOWN_DIR / md_file_name
-            with open(md_file_path, "w", encoding='utf-8') as f:
-                f.write(content)
-            
-            print(f"Markdown file created: {md_file_path}")
-            
-            # 构建markmap命令
-            markdown_cmd = f"markmap {md_file_path} --output {MARKDOWN_DIR / html_file_name} --no-open"
-            
-            # Windows环境使用PowerShell
             if os.name == 'nt':
-                markdown_cmd = f"powershell -Command {markdown_cmd}"
-            
-            print(f"即将执行的命令: {markdown_cmd}")
-            
-            # 执行markmap命令
-            result = subprocess.run(
-                markdown_cmd,
-                check=True, 
-                text=True, 
-                shell=True,
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.PIPE, 
-                universal_newlines=True
+                subprocess.run(
+                    ['taskkill', '/F', '/T', '/PID', str(process.pid)],
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+                )
+            else:
+                # 渲染进程以新会话启动，进程组号即其进程号
+                os.killpg(process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+    
+    @staticmethod
+    async def run_markmap(md_file_path: Path, html_output_path: Path):
+        """
+        执行markmap命令，将Markdown文件转换为HTML
+        超过 RENDER_TIMEOUT 或调用方取消时终止整个渲染进程组
+        """
+        env = dict(os.environ)
+        if RENDER_MEMORY_LIMIT_MB > 0:
+            env['NODE_OPTIONS'] = f"{env.get('NODE_OPTIONS', '')} --max-old-space-size={RENDER_MEMORY_LIMIT_MB}".strip()
+        
+        # Windows环境使用PowerShell
+        if os.name == 'nt':
+            args = ['powershell', '-Command', f"markmap {md_file_path} --output {html_output_path} --no-open"]
+            kwargs = {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+        else:
+            args = [MindmapService.markmap_path() or 'markmap', str(md_file_path), '--output', str(html_output_path), '--no-open']
+            kwargs = {'start_new_session': True}
+        
+        print(f"即将执行的命令: {' '.join(args)}")
+        
+        # 执行markmap命令
+        process = await asyncio.create_subprocess_exec(
+            *args,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=env,
+            **kwargs
+        )
+        if os.name != 'nt' and RENDER_MEMORY_LIMIT_MB > 0:
+            MindmapService._limit_child_resources(process.pid)
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=RENDER_TIMEOUT)
+        except asyncio.TimeoutError:
+            MindmapService._kill_process_tree(process)
+            await process.wait()
+            Metrics.incr("render_timeout_total")
+            raise HTTPException(status_code=504, detail=f"渲染超时（超过 {RENDER_TIMEOUT:g} 秒），已终止渲染进程")
+        except BaseException:
+            # 调用方取消（客户端断开）或其他异常：确保渲染进程组被终止，并等待回收，不留下僵尸进程；
+            # 等待期间再次被取消时，回收仍在后台完成
+            MindmapService._kill_process_tree(process)
+            await asyncio.shield(process.wait())
+            raise
+        
+        stdout = stdout.decode('utf-8', errors='replace')
+        stderr = stderr.decode('utf-8', errors='replace')
+        print(f"命令返回码: {process.returncode}")
+        print(f"命令输出: {stdout}")
+        print(f"命令错误信息: {stderr}")
+        
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(
+                process.returncode, 
+                args, 
+                output=stdout,
+                stderr=stderr
             )
+        return process.returncode
+    
+    @staticmethod
+    async def _watch_disconnect(request: Request):
+        """轮询客户端连接状态，断开时返回"""
+        while not await request.is_disconnected():
+            await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+    
+    @staticmethod
+    async def _render_in_slot(request: Request, source: MarkdownSource, html_output_path: Path):
+        """在准入名额内执行渲染"""
+        async with RenderAdmission.slot(request, source.size, source.node_count):
+            await MindmapService.run_markmap(source.path, html_output_path)
+    
+    @staticmethod
+    def _remove_files(*paths: Path):
+        """删除渲染失败或取消后残留的文件"""
+        for path in paths:
+            try:
+                path.unlink(missing_ok=True)
+            except OSError as e:
+                print(f"清理临时文件失败: {path}: {str(e)}")
+    
+    @staticmethod
+    def cleanup_orphans(max_age: float = None) -> int:
+        """
+        清理中断渲染残留的临时文件：
+        - markdown目录中的 .html（渲染输出，正常情况下会被移走）
+        - 没有对应思维导图的 .md
+        只处理修改时间早于 max_age 秒之前的文件，避免误删正在渲染的文件
+        """
+        max_age = ORPHAN_CLEANUP_AGE if max_age is None else max_age
+        if not MARKDOWN_DIR.exists():
+            return 0
+        cutoff = time.time() - max_age
+        removed = 0
+        for path in MARKDOWN_DIR.iterdir():
+            try:
+                if not path.is_file() or path.stat().st_mtime > cutoff:
+                    continue
+                if path.suffix == '.html' or (
+                    path.suffix == '.md' and not (STATIC_HTML_DIR / f"{path.stem}.html").exists()
+                ):
+                    path.unlink()
+                    removed += 1
+            except OSError:
+                continue
+        if removed:
+            print(f"已清理残留的渲染临时文件: {removed} 个")
+        return removed
+    
+    @staticmethod
+    def new_markdown_path() -> Path:
+        """为新的Markdown源文件分配路径（文件名即思维导图ID）"""
+        MindmapService.create_directories()
+        return MARKDOWN_DIR / f"{MindmapService.generate_filename()}.md"
+    
+    @staticmethod
+    def save_markdown(content: str) -> MarkdownSource:
+        """将已在内存中的Markdown文本保存为源文件"""
+        md_file_path = MindmapService.new_markdown_path()
+        data = content.encode('utf-8')
+        with open(md_file_path, "wb") as f:
+            f.write(data)
+        print(f"Markdown file created: {md_file_path}")
+        return MarkdownSource(
+            md_file_path, len(data), RenderAdmission.count_nodes(content), RenderCache.digest(data)
+        )
+    
+    @staticmethod
+    def _too_large() -> HTTPException:
+        return HTTPException(
+            status_code=413,
+            detail=f"Markdown 内容太大。最大允许大小: {MAX_MARKDOWN_SIZE // (1024*1024)}MB"
+        )
+    
+    @staticmethod
+    async def receive_markdown(request: Request) -> MarkdownSource:
+        """
+        将请求体以流式方式直接写入Markdown源文件
+        - 边接收边做增量UTF-8校验，非法编码返回 400
+        - 累计大小超过 MAX_MARKDOWN_SIZE 时立即停止接收并返回 413
+        - 顺带统计节点数（供渲染调度分类使用）并计算内容摘要（供渲染缓存使用）
+        请求体不会在内存中完整缓存
+        """
+        content_length = request.headers.get('content-length')
+        if content_length and content_length.isdigit() and int(content_length) > MAX_MARKDOWN_SIZE:
+            raise MindmapService._too_large()
+        
+        md_file_path = MindmapService.new_markdown_path()
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        hasher = RenderCache.hasher()
+        size = 0
+        node_count = 0
+        pending_line = ''
+        # 打开、写入、关闭和清理文件都在文件线程池中执行，请求体按批写入
+        f = await WorkloadPools.run('file_io', open, md_file_path, "wb")
+        try:
+            try:
+                batch: List[bytes] = []
+                batch_size = 0
+                async for chunk in request.stream():
+                    if not chunk:
+                        continue
+                    size += len(chunk)
+                    if size > MAX_MARKDOWN_SIZE:
+                        raise MindmapService._too_large()
+                    hasher.update(chunk)
+                    # 只扫描新的一块：对完整的行统计节点，未结束的行只保留行首留到下一块
+                    decoded = decoder.decode(chunk)
+                    last_newline = decoded.rfind('\n')
+                    if last_newline >= 0:
+                        node_count += RenderAdmission.count_nodes(pending_line + decoded[:last_newline + 1])
+                        pending_line = RenderAdmission.line_head(decoded[last_newline + 1:])
+                    else:
+                        pending_line = RenderAdmission.line_head(pending_line + decoded)
+                    batch.append(chunk)
+                    batch_size += len(chunk)
+                    if batch_size >= MARKDOWN_WRITE_BATCH:
+                        await WorkloadPools.run('file_io', f.write, b''.join(batch))
+                        batch, batch_size = [], 0
+                pending_line += decoder.decode(b'', final=True)
+                node_count += RenderAdmission.count_nodes(pending_line)
+                if batch:
+                    await WorkloadPools.run('file_io', f.write, b''.join(batch))
+            finally:
+                await asyncio.shield(WorkloadPools.run('file_io', f.close))
+        except UnicodeDecodeError:
+            await asyncio.shield(WorkloadPools.run('file_io', MindmapService._remove_files, md_file_path))
+            raise HTTPException(status_code=400, detail="Markdown 内容不是有效的 UTF-8 编码")
+        except BaseException:
+            # 超限、客户端断开等情况下删除未完成的文件
+            await asyncio.shield(WorkloadPools.run('file_io', MindmapService._remove_files, md_file_path))
+            raise
+        
+        print(f"Markdown file created: {md_file_path} ({size} bytes, {node_count} nodes)")
+        return MarkdownSource(md_file_path, size, node_count, hasher.hexdigest())
+    
+    @staticmethod
+    async def read_markdown_body(request: Request) -> Tuple[str, str]:
+        """
+        将请求体读入内存（不写文件），返回 (Markdown文本, 内容摘要)
+        同样做增量UTF-8校验和 MAX_MARKDOWN_SIZE 限制
+        """
+        content_length = request.headers.get('content-length')
+        if content_length and content_length.isdigit() and int(content_length) > MAX_MARKDOWN_SIZE:
+            raise MindmapService._too_large()
+        
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        hasher = RenderCache.hasher()
+        parts = []
+        size = 0
+        try:
+            async for chunk in request.stream():
+                if not chunk:
+                    continue
+                size += len(chunk)
+                if size > MAX_MARKDOWN_SIZE:
+                    raise MindmapService._too_large()
+                hasher.update(chunk)
+                parts.append(decoder.decode(chunk))
+            parts.append(decoder.decode(b'', final=True))
+        except UnicodeDecodeError:
+            raise HTTPException(status_code=400, detail="Markdown 内容不是有效的 UTF-8 编码")
+        return ''.join(parts), hasher.hexdigest()
+    
+    @staticmethod
+    async def render_markdown(request: Request, source: MarkdownSource) -> Path:
+        """
+        将已保存的Markdown源文件渲染为HTML，返回static/html目录下的HTML文件路径
+        渲染过程受 RenderAdmission 准入控制：按输入规模分通道、按客户端公平排队，
+        超出并发和队列上限时返回 503，单个客户端排队过多时返回 429；
+        客户端断开连接时取消排队或渲染，并清理临时文件
+        """
+        md_file_path = source.path
+        html_file_name = f"{md_file_path.stem}.html"
+        source_path = MARKDOWN_DIR / html_file_name
+        
+        # 检查markmap是否可用
+        if not MindmapService.check_markmap_available():
+            MindmapService._remove_files(md_file_path)
+            raise HTTPException(
+                status_code=500, 
+                detail="Error: markmap command not found. Please make sure it is installed and added to the system PATH."
+            )
+        
+        render_task = asyncio.ensure_future(
+            MindmapService._render_in_slot(request, source, source_path)
+        )
+        watcher = asyncio.ensure_future(MindmapService._watch_disconnect(request))
+        try:
+            done, _ = await asyncio.wait({render_task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if render_task not in done:
+                # 客户端已断开：取消排队或正在运行的渲染
+                render_task.cancel()
+                await asyncio.gather(render_task, return_exceptions=True)
+                Metrics.incr("render_cancelled_total")
+                raise HTTPException(status_code=499, detail="客户端已断开连接，渲染已取消")
+            render_task.result()
+        except BaseException:
+            if not render_task.done():
+                render_task.cancel()
+                await asyncio.gather(render_task, return_exceptions=True)
+            MindmapService._remove_files(md_file_path, source_path)
+            raise
+        finally:
+            watcher.cancel()
+        
+        # 移动HTML文件到static/html目录
+        target_path = STATIC_HTML_DIR / html_file_name
+        
+        os.replace(str(source_path), str(target_path))
+        print(f"HTML file moved to: {target_path}")
+        
+        await WorkloadPools.run('cpu', MindmapService.finish_render, target_path, source)
+        return target_path
+    
+    @staticmethod
+    def load_markdown(md_path: Path) -> MarkdownSource:
+        """读取已有的Markdown源文件（离线批量渲染使用），统计节点数并计算内容摘要"""
+        data = md_path.read_bytes()
+        return MarkdownSource(
+            md_path, len(data), RenderAdmission.count_nodes(data.decode('utf-8', errors='replace')),
+            RenderCache.digest(data)
+        )
+    
+    @staticmethod
+    async def render_file(source: MarkdownSource, html_path: Path, variant: str = 'cdn') -> Path:
+        """
+        不经过HTTP和准入控制，将Markdown源文件渲染到指定路径（离线批量渲染使用）
+        处理流程与接口相同：markmap 渲染 → 节点树缓存 / 大型思维导图模式 → 本地变体替换CDN链接；
+        输出到 static/html 时同样发布到存储后端并登记渲染缓存
+        """
+        html_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = AtomicWriter.temp_path_for(html_path)
+        try:
+            await MindmapService.run_markmap(source.path, temp_path)
+            os.replace(str(temp_path), str(html_path))
+        finally:
+            temp_path.unlink(missing_ok=True)
+        MindmapService.finish_render(html_path, source)
+        if variant != 'cdn':
+            AtomicWriter.update_text(html_path, lambda html: MindmapService.derive_variant(html, variant))
+        if html_path.parent == STATIC_HTML_DIR and source.path.parent == MARKDOWN_DIR:
+            MindmapService.publish_outputs(html_path, source)
+            if variant == 'cdn':
+                RenderCache.put_html(source.digest, variant, html_path.name)
+        return html_path
+    
+    @staticmethod
+    def finish_render(html_path: Path, source: MarkdownSource):
+        """渲染完成后的处理：缓存节点树供 /mindmap/tree 复用，节点过多时启用大型思维导图模式"""
+        with open(html_path, 'r', encoding='utf-8') as f:
+            html_content = f.read()
+        
+        tree = MindmapTree.extract_embedded_tree(html_content)
+        if tree is None:
+            # 没有节点树或嵌套过深无法解析：HTML 已发布，照常返回，只是不缓存节点树
+            print(f"未找到或无法解析内嵌的节点树，跳过节点树缓存和大型思维导图模式: {html_path}")
+            return
+        RenderCache.put_tree(source.digest, tree, source.size)
+        
+        if source.node_count > LARGE_MAP_NODE_THRESHOLD:
+            MindmapService.apply_large_map_mode(html_path, html_content, tree)
+    
+    @staticmethod
+    def apply_large_map_mode(html_path: Path, html_content: str, tree: Dict[str, Any]) -> bool:
+        """
+        大型思维导图模式：
+        首屏HTML只内嵌前 LARGE_MAP_INITIAL_DEPTH 层、最多 LARGE_MAP_NODE_BUDGET 个节点，
+        其余子树预先切分为分片并建立索引，展开时通过 /html/{id}/subtree/{node} 按需加载
+        """
+        map_id = html_path.stem
+        chunks_path, index_path = MindmapService.subtree_index_paths(map_id)
+        pruned = MindmapTree.build_subtree_index(
+            tree, LARGE_MAP_INITIAL_DEPTH, LARGE_MAP_NODE_BUDGET, chunks_path, index_path
+        )
+        html_content = MindmapTree.replace_embedded_tree(html_content, pruned)
+        html_content = MindmapService.inject_lazy_load_script(html_content)
+        AtomicWriter.write_text(html_path, html_content)
+        Metrics.incr("mindmap_large_map_total")
+        print(f"已启用大型思维导图模式: {html_path}")
+        return True
+    
+    @staticmethod
+    def publish_outputs(html_path: Path, source: MarkdownSource):
+        """
+        将渲染结果（HTML、Markdown 源文件、子树索引）发布到存储后端
+        使用对象存储时本地 static 目录只是工作目录，其他节点从存储后端取回；本地存储无需操作
+        """
+        if Storage.is_local():
+            return
+        Storage.publish(html_path, 'text/html; charset=utf-8')
+        Storage.publish(source.path, 'text/markdown; charset=utf-8')
+        for path in MindmapService.subtree_index_paths(html_path.stem):
+            if path.exists():
+                Storage.publish(path)
+    
+    @staticmethod
+    def subtree_index_paths(map_id: str):
+        """子树分片文件和索引文件的路径"""
+        return SUBTREE_INDEX_DIR / f"{map_id}.chunks", SUBTREE_INDEX_DIR / f"{map_id}.index.json"
+    
+    @staticmethod
+    @lru_cache(maxsize=64)
+    def _load_subtree_index(index_path: str, mtime: float) -> Dict[str, List[int]]:
+        """加载子树索引（按文件修改时间缓存）"""
+        with open(index_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    @staticmethod
+    def canonical_map_id(map_id: str) -> str:
+        """去掉变体后缀（变体页面按自身路径请求子树和SVG时带有后缀），得到思维导图ID"""
+        for suffix in VARIANT_SUFFIXES.values():
+            if suffix and map_id.endswith(suffix):
+                return map_id[:-len(suffix)]
+        return map_id
+    
+    @staticmethod
+    def get_subtree(map_id: str, node_id: str) -> Response:
+        """获取大型思维导图中某个折叠节点的子树JSON"""
+        map_id = MindmapService.canonical_map_id(map_id)
+        if not MAP_ID_RE.match(map_id) or not node_id.isdigit():
+            raise HTTPException(status_code=404, detail="子树不存在")
+        chunks_path, index_path = MindmapService.subtree_index_paths(map_id)
+        if not Storage.ensure_local(index_path) or not Storage.ensure_local(chunks_path):
+            raise HTTPException(status_code=404, detail="该思维导图没有子树索引")
+        index = MindmapService._load_subtree_index(str(index_path), index_path.stat().st_mtime)
+        data = MindmapTree.read_subtree(chunks_path, index, node_id)
+        if data is None:
+            raise HTTPException(status_code=404, detail="子树不存在")
+        return Response(
+            content=data,
+            media_type="application/json",
+            headers={"Cache-Control": "public, max-age=3600"}
+        )
+    
+    @staticmethod
+    def get_svg(map_id: str) -> FileResponse:
+        """
+        服务端导出思维导图SVG：由保存的Markdown计算布局生成，缓存在HTML旁边（{id}.svg）
+        Markdown 未变化时直接返回缓存的SVG
+        """
+        map_id = MindmapService.canonical_map_id(map_id)
+        if not MAP_ID_RE.match(map_id):
+            raise HTTPException(status_code=404, detail="文件不存在")
+        md_path = MARKDOWN_DIR / f"{map_id}.md"
+        if not Storage.ensure_local(md_path):
+            raise HTTPException(status_code=404, detail="思维导图不存在或其Markdown源文件已删除")
+        
+        svg_path = STATIC_HTML_DIR / f"{map_id}.svg"
+        if svg_path.exists() and svg_path.stat().st_mtime >= md_path.stat().st_mtime:
+            Metrics.incr("mindmap_svg_cache_hit_total")
+        else:
+            data = md_path.read_bytes()
+            digest = RenderCache.digest(data)
+            tree = RenderCache.get_tree(digest)
+            if tree is None:
+                tree = MarkdownTree.parse(data.decode('utf-8', errors='replace'))
+                RenderCache.put_tree(digest, tree, len(data))
+            # 先写临时文件再替换，并发导出同一张图时不会读到半个文件
+            with AtomicWriter.open(svg_path, 'w', encoding='utf-8') as f:
+                node_count = MindmapSvg.write_svg(tree, f)
+            Metrics.incr("mindmap_svg_render_total")
+            print(f"已导出SVG: {svg_path} ({node_count} nodes)")
+        
+        return FileResponse(
+            str(svg_path),
+            media_type="image/svg+xml",
+            filename=f"{map_id}.svg",
+            content_disposition_type="inline"
+        )
+    
+    @staticmethod
+    def inject_lazy_load_script(html_content: str) -> str:
+        """向大型思维导图注入按需加载子树的JavaScript代码"""
+        lazy_load_script = '''
+        <!-- 大型思维导图：展开折叠节点时按需加载子树 -->
+        <script>
+        (function() {
+            var mapId = location.pathname.split('/').pop().replace(/\\.html$/, '');
             
-            print(f"命令返回码: {result.returncode}")
-            print(f"命令输出: {result.stdout}")
-            print(f"命令错误信息: {result.stderr}")
-            
-            if result.returncode != 0:
-                raise subprocess.CalledProcessError(
-                    result.returncode, 
-                    result.args, 
-                    output=result.stdout,
-                    stderr=result.stderr
-                )
+            // 在已加载的节点树中查找某个节点的父节点
+            function findParent(root, target) {
+                var stack = [root];
+                while (stack.length) {
+                    var node = stack.pop();
+                    var children = node.children || [];
+                    if (children.indexOf(target) >= 0) {
+                        return node;
+                    }
+                    for (var i = 0; i < children.length; i++) {
+                        stack.push(children[i]);
+                    }
+                }
+                return null;
+            }
             
-            # 移动HTML文件到static/html目录
-            source_path = MARKDOWN_DIR / html_file_name
-            target_path = STATIC_HTML_DIR / html_file_name
+            function installLazyLoad() {
+                var mm = window.mm;
+                if (!mm || typeof mm.toggleNode !== 'function') {
+                    setTimeout(installLazyLoad, 100);
+                    return;
+                }
+                var originalToggle = mm.toggleNode.bind(mm);
+                mm.toggleNode = async function(data, recursive) {
+                    var payload = data && data.payload;
+                    if (payload && payload.lazy !== undefined && !payload.loaded) {
+                        // 标记为加载中，避免重复请求
+                        payload.loaded = 1;
+                        try {
+                            var response = await fetch(mapId + '/subtree/' + payload.lazy);
+                            if (!response.ok) {
+                                throw new Error('HTTP ' + response.status);
+                            }
+                            var chunk = await response.json();
+                            var parent = payload.more ? findParent(mm.state.data, data) : null;
+                            if (parent) {
+                                // “更多”节点：用下一批兄弟节点替换它
+                                var position = parent.children.indexOf(data);
+                                parent.children.splice.apply(parent.children, [position, 1].concat(chunk.children));
+                            } else {
+                                data.children = chunk.children;
+                                payload.fold = 0;
+                            }
+                            await mm.setData(mm.state.data);
+                            return;
+                        } catch (error) {
+                            payload.loaded = 0;
+                            console.error('加载子树失败:', error);
+                        }
+                    }
+                    return originalToggle(data, recursive);
+                };
+            }
             
-            os.replace(str(source_path), str(target_path))
-            print(f"HTML file moved to: {target_path}")
+            installLazyLoad();
+        })();
+        </script>
+        '''
+        
+        if '</body>' in html_content:
+            return html_content.replace('</body>', f'{lazy_load_script}\n</body>')
+        return html_content + lazy_load_script
+    
+    @staticmethod
+    def local_variant() -> str:
+        """/upload-local 返回的HTML变体（是否带下载SVG按钮），按请求时的配置决定"""
+        return 'local-svg' if ENABLE_SVG_DOWNLOAD_BUTTON else 'local'
+    
+    @staticmethod
+    def variant_filename(map_id: str, variant: str) -> str:
+        """思维导图某个变体的HTML文件名"""
+        return f"{map_id}{VARIANT_SUFFIXES[variant]}.html"
+    
+    @staticmethod
+    def reuse_cached_html(source: MarkdownSource, variant: str) -> Optional[str]:
+        """
+        相同内容已生成过同一变体的HTML时直接复用：删除刚保存的重复源文件，返回已有的HTML文件名
+        需要读取共享状态并检查存储后端（对象存储为网络请求），在线程池中调用
+        """
+        filename = RenderCache.get_html(source.digest, variant)
+        RenderCache.record(filename is not None)
+        if filename is None:
+            return None
+        MindmapService._remove_files(source.path)
+        print(f"内容未变化，复用已生成的思维导图: {filename}")
+        return filename
+    
+    @staticmethod
+    async def render_canonical(request: Request, source: MarkdownSource) -> str:
+        """
+        获取内容的规范渲染结果（markmap 输出的CDN版HTML，{id}.html），返回文件名
+        每份内容只渲染一次：相同内容已渲染过时直接复用；其他变体都由它派生，不再启动 markmap
+        """
+        cached = await WorkloadPools.run('listing', MindmapService.reuse_cached_html, source, 'cdn')
+        if cached is not None:
+            return cached
+        target_path = await MindmapService.render_markdown(request, source)
+        await WorkloadPools.run('render', MindmapService.register_canonical, target_path, source)
+        Metrics.incr("mindmap_render_total")
+        return target_path.name
+    
+    @staticmethod
+    def register_canonical(html_path: Path, source: MarkdownSource):
+        """发布规范渲染结果、更新检索索引并登记渲染缓存（都是阻塞的I/O，在线程池中调用）"""
+        MindmapService.publish_outputs(html_path, source)
+        SearchIndex.index_key(Storage.key_for(source.path))
+        RenderCache.put_html(source.digest, 'cdn', html_path.name)
+    
+    @staticmethod
+    async def process_markdown(request: Request, content: Optional[str] = None):
+        """
+        处理Markdown内容，生成思维导图
+        content 为空时从请求体流式读取
+        """
+        try:
+            if content is None:
+                source = await MindmapService.receive_markdown(request)
+            else:
+                source = await WorkloadPools.run('render', MindmapService.save_markdown, content)
+            filename = await MindmapService.render_canonical(request, source)
             
             # 返回预览链接
-            base_url = str(request.base_url)
-            preview_url = f"{base_url}html/{html_file_name}"
-            
-            return preview_url
+            return f"{request.base_url}html/{filename}"
             
+        except HTTPException:
+            # 重新抛出HTTP异常（包括准入控制的429/503）
+            raise
         except subprocess.CalledProcessError as e:
+            Metrics.incr("mindmap_render_failed_total")
             error_msg = f"Error generating HTML file: {e.output}\n{e.stderr}"
             print(error_msg)
             raise HTTPException(status_code=500, detail=error_msg)
         except Exception as e:
+            Metrics.incr("mindmap_render_failed_total")
             error_msg = f"Unexpected error: {str(e)}"
             print(error_msg)
             raise HTTPException(status_code=500, detail=error_msg)
 
     @staticmethod
-    async def process_markdown_replace(request: Request, content: str):
+    async def process_markdown_replace(request: Request, content: Optional[str] = None):
         """
-        处理Markdown内容，生成思维导图
+        处理Markdown内容，生成使用本地资源的思维导图
+        content 为空时从请求体流式读取
+        与 /upload 共用同一份规范渲染结果，返回其本地资源变体的地址；
+        变体HTML在第一次访问时由规范渲染结果替换CDN链接、注入下载SVG按钮得到
         """
         try:
-            # 创建目录
-            MindmapService.create_directories()
-
-            # 检查markmap是否可用
-            if not MindmapService.check_markmap_available():
-                raise HTTPException(
-                    status_code=500,
-                    detail="Error: markmap command not found. Please make sure it is installed and added to the system PATH."
-                )
-
-            # 生成文件名
-            time_name = MindmapService.generate_filename()
-            md_file_name = f"{time_name}.md"
-            html_file_name = f"{time_name}.html"
-
-            # 保存Markdown文件
-            md_file_path = MARKDOWN_DIR / md_file_name
-            with open(md_file_path, "w", encoding='utf-8') as f:
-                f.write(content)
-
-            print(f"Markdown file created: {md_file_path}")
-
-            # 构建markmap命令
-            markdown_cmd = f"markmap {md_file_path} --output {MARKDOWN_DIR / html_file_name} --no-open"
-
-            # Windows环境使用PowerShell
-            if os.name == 'nt':
-                markdown_cmd = f"powershell -Command {markdown_cmd}"
-
-            print(f"即将执行的命令: {markdown_cmd}")
-
-            # 执行markmap命令
-            result = subprocess.run(
-                markdown_cmd,
-                check=True,
-                text=True,
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True
-            )
-
-            print(f"命令返回码: {result.returncode}")
-            print(f"命令输出: {result.stdout}")
-            print(f"命令错误信息: {result.stderr}")
-
-            if result.returncode != 0:
-                raise subprocess.CalledProcessError(
-                    result.returncode,
-                    result.args,
-                    output=result.stdout,
-                    stderr=result.stderr
-                )
-
-            # 移动HTML文件到static/html目录
-            source_path = MARKDOWN_DIR / html_file_name
-            target_path = STATIC_HTML_DIR / html_file_name
-
-            os.replace(str(source_path), str(target_path))
-            print(f"HTML file moved to: {target_path}")
-            #替换文本内容
-            # 读取并替换HTML文件内容
-            with open(target_path, 'r', encoding='utf-8') as f:
-                html_content = f.read()
-            
-            # 替换CDN链接为本地路径
-            html_content = html_content.replace('https://cdn.jsdelivr.net/npm/d3@7.9.0/dist', '../htmljs')
-            html_content = html_content.replace('https://cdn.jsdelivr.net/npm/markmap-toolbar@0.18.10/dist', '../htmljs')
-            html_content = html_content.replace('https://cdn.jsdelivr.net/npm/markmap-view@0.18.10/dist/browser/index.js', '../htmljs/index2.js')
-            html_content = html_content.replace('https://cdn.jsdelivr.net/npm/markmap-toolbar@0.18.10/dist', '../htmljs')
-            # 根据配置决定是否注入保存图片的JavaScript代码
-            if ENABLE_SVG_DOWNLOAD_BUTTON:
-                html_content = MindmapService.inject_save_image_script(html_content)
-                print("已注入下载SVG按钮功能")
+            if content is None:
+                source = await MindmapService.receive_markdown(request)
             else:
-                print("根据配置，未注入下载SVG按钮功能")
-            
-            # 写回文件
-            with open(target_path, 'w', encoding='utf-8') as f:
-                f.write(html_content)
-            
-            print("已替换HTML文件中的CDN链接为本地路径，并注入保存图片功能")
+                source = await WorkloadPools.run('render', MindmapService.save_markdown, content)
+            filename = await MindmapService.render_canonical(request, source)
+            variant_name = MindmapService.variant_filename(Path(filename).stem, MindmapService.local_variant())
 
             # 返回预览链接
-            base_url = str(request.base_url)
-            preview_url = f"{base_url}html/{html_file_name}"
-
-            return preview_url
+            return f"{request.base_url}html/{variant_name}"
 
+        except HTTPException:
+            # 重新抛出HTTP异常（包括准入控制的429/503）
+            raise
         except subprocess.CalledProcessError as e:
+            Metrics.incr("mindmap_render_failed_total")
             error_msg = f"Error generating HTML file: {e.output}\n{e.stderr}"
             print(error_msg)
             raise HTTPException(status_code=500, detail=error_msg)
         except Exception as e:
+            Metrics.incr("mindmap_render_failed_total")
             error_msg = f"Unexpected error: {str(e)}"
             print(error_msg)
             raise HTTPException(status_code=500, detail=error_msg)
 
+    @staticmethod
+    def _tree_from_rendered_html(digest: str) -> Optional[Dict[str, Any]]:
+        """
+        从相同内容已生成的HTML中提取 markmap 节点树（大型思维导图的HTML只含部分节点，跳过）
+        需要读取共享状态、存储后端和HTML文件，在线程池中调用
+        """
+        for variant in ('cdn', 'local-svg', 'local'):
+            filename = RenderCache.get_html(digest, variant)
+            if filename is None:
+                continue
+            html_path = STATIC_HTML_DIR / filename
+            if Storage.ensure_local(MindmapService.subtree_index_paths(html_path.stem)[1]):
+                continue
+            try:
+                Storage.ensure_local(html_path)
+                with open(html_path, 'r', encoding='utf-8') as f:
+                    tree = MindmapTree.extract_embedded_tree(f.read())
+            except (OSError, RecursionError):
+                # 嵌套过深的节点树无法由 json 模块读取，改为直接解析Markdown
+                continue
+            if tree is not None:
+                return tree
+        return None
+    
+    @staticmethod
+    def _build_tree(text: str, digest: str, rendered: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """已生成的HTML中没有可用的节点树时直接解析Markdown，结果放入进程内缓存"""
+        tree = rendered if rendered is not None else MarkdownTree.parse(text)
+        RenderCache.put_tree(digest, tree, len(text.encode('utf-8')))
+        return tree
+    
+    @staticmethod
+    async def markdown_tree(request: Request, encoding: str = 'verbose', max_depth: Optional[int] = None) -> Response:
+        """
+        将Markdown转换为节点树JSON，供自行渲染的客户端使用
+        不启动 markmap、不生成HTML、不写任何文件；与HTML接口共用渲染缓存
+        - encoding: compact（嵌套数组，体积最小）或 verbose（带层级和源码行号）
+        - max_depth: 只返回到该层级（根节点为第 0 层），被截断的节点带子节点数量
+        """
+        if encoding not in TREE_ENCODINGS:
+            raise HTTPException(status_code=400, detail=f"不支持的编码: {encoding}，可选值: {', '.join(TREE_ENCODINGS)}")
+        if max_depth is not None and max_depth < 0:
+            raise HTTPException(status_code=400, detail="max_depth 不能小于 0")
+        
+        text, digest = await MindmapService.read_markdown_body(request)
+        # 获取节点树：进程内缓存 → 已生成的HTML（线程池中读取） → 直接解析Markdown
+        cached = RenderCache.get_tree(digest)
+        rendered = None
+        if cached is None:
+            rendered = await WorkloadPools.run('file_io', MindmapService._tree_from_rendered_html, digest)
+        hit = cached is not None or rendered is not None
+        
+        def build() -> bytes:
+            tree = cached if cached is not None else MindmapService._build_tree(text, digest, rendered)
+            body = {
+                "digest": digest,
+                "encoding": encoding,
+                "max_depth": max_depth,
+                "node_count": MindmapTree.count_nodes(tree),
+                "root": MarkdownTree.encode(tree, encoding, max_depth)
+            }
+            return MarkdownTree.dumps(body).encode('utf-8')
+        
+        data = await WorkloadPools.run('cpu', build)
+        RenderCache.record(hit)
+        Metrics.incr("mindmap_tree_total")
+        return Response(
+            content=data,
+            media_type="application/json",
+            headers={"X-Render-Cache": "hit" if hit else "miss"}
+        )
+    
+    @staticmethod
+    def localize_html(html_content: str) -> str:
+        """替换CDN链接为本地路径，并按配置注入下载SVG按钮"""
+        return MindmapService.derive_variant(html_content, MindmapService.local_variant())
+    
+    @staticmethod
+    def derive_variant(html_content: str, variant: str) -> str:
+        """由规范渲染结果（CDN版HTML）得到指定变体的HTML：只做字符串替换和脚本注入，不重新渲染"""
+        if variant == 'cdn':
+            return html_content
+        # 替换CDN链接为本地路径
+        html_content = html_content.replace('https://cdn.jsdelivr.net/npm/d3@7.9.0/dist', '../htmljs')
+        html_content = html_content.replace('https://cdn.jsdelivr.net/npm/markmap-toolbar@0.18.10/dist', '../htmljs')
+        html_content = html_content.replace('https://cdn.jsdelivr.net/npm/markmap-view@0.18.10/dist/browser/index.js', '../htmljs/index2.js')
+        # 带下载SVG按钮的变体注入保存图片的JavaScript代码
+        if variant == 'local-svg':
+            html_content = MindmapService.inject_save_image_script(html_content)
+        return html_content
+    
+    @staticmethod
+    def ensure_variant(map_id: str, variant: str) -> Optional[Path]:
+        """
+        返回思维导图某个变体的HTML文件路径，不存在或早于规范渲染结果时由规范渲染结果派生
+        派生的文件只保存在本地 static/html 目录，使用对象存储时各节点按需各自派生
+        """
+        canonical_path = STATIC_HTML_DIR / f"{map_id}.html"
+        if not Storage.ensure_local(canonical_path):
+            return None
+        variant_path = STATIC_HTML_DIR / MindmapService.variant_filename(map_id, variant)
+        try:
+            if variant_path.stat().st_mtime >= canonical_path.stat().st_mtime:
+                return variant_path
+        except FileNotFoundError:
+            pass
+        with open(canonical_path, 'r', encoding='utf-8') as f:
+            html_content = MindmapService.derive_variant(f.read(), variant)
+        AtomicWriter.write_text(variant_path, html_content)
+        Metrics.incr("mindmap_variant_derived_total")
+        print(f"已由规范渲染结果派生HTML变体: {variant_path}")
+        return variant_path
+    
     @staticmethod
     def inject_save_image_script(html_content: str) -> str:
         """
@@ -290,7 +923,7 @@ class MindmapService:
                 this.style.transform = 'translateY(0)';
             });
             
-            saveButton.onclick = saveAsVectorImage;
+            saveButton.onclick = saveFromServer;
             
             // 创建取消按钮（初始隐藏）
             const cancelButton = document.createElement('button');
@@ -348,6 +981,32 @@ class MindmapService:
             enablePageOperations();
         }
         
+        // 优先下载服务端导出的SVG（/html/{id}.svg），失败时退回浏览器端生成
+        async function saveFromServer() {
+            const svgUrl = location.pathname.replace(/\.html$/, '.svg');
+            if (svgUrl === location.pathname) {
+                saveAsVectorImage();
+                return;
+            }
+            try {
+                const response = await fetch(svgUrl);
+                if (!response.ok) {
+                    throw new Error('HTTP ' + response.status);
+                }
+                const blobUrl = URL.createObjectURL(await response.blob());
+                const link = document.createElement('a');
+                const timestamp = new Date().toISOString().replace(/[:.]/g, '-');
+                link.download = `mindmap-vector-${timestamp}.svg`;
+                link.href = blobUrl;
+                link.click();
+                URL.revokeObjectURL(blobUrl);
+                showNotification('SVG矢量图保存成功！支持任意缩放', 'success');
+            } catch (error) {
+                console.warn('服务端导出SVG失败，改为在浏览器中生成:', error);
+                saveAsVectorImage();
+            }
+        }
+        
         function saveAsVectorImage() {
             const button = document.getElementById('save-image-btn');
             const cancelBtn = document.getElementById('cancel-btn');
@@ -892,8 +1551,18 @@ class MindmapService:
 
     @staticmethod
     def get_html_file(filename: str):
-        """获取HTML文件"""
+        """获取HTML文件（使用对象存储时，本地没有的文件从存储后端取回）"""
+        if not MAP_ID_RE.match(filename):
+            raise HTTPException(status_code=404, detail="文件不存在")
+        match = VARIANT_FILENAME_RE.match(filename)
+        if match and match.group('suffix'):
+            # 本地资源变体：第一次访问时由规范渲染结果派生
+            variant = next(name for name, suffix in VARIANT_SUFFIXES.items() if suffix == match.group('suffix'))
+            file_path = MindmapService.ensure_variant(match.group('map_id'), variant)
+            if file_path is None:
+                raise HTTPException(status_code=404, detail="文件不存在")
+            return FileResponse(str(file_path))
         file_path = STATIC_HTML_DIR / filename
-        if not file_path.exists():
+        if not Storage.ensure_local(file_path):
             raise HTTPException(status_code=404, detail="文件不存在")
         return FileResponse(str(file_path))
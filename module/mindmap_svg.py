@@ -0,0 +1,152 @@
+"""
+思维导图SVG导出模块
+
+在 Python 中按 markmap 的默认样式计算横向树布局，直接生成独立的SVG文件，
+不依赖浏览器，也不需要在页面中克隆DOM。
+- 节点宽度按字符估算（全角字符 1em，其余 0.6em）
+- 子节点紧贴父节点右侧，间距与 markmap 一致
+- 每棵子树在纵向占用其所有子树高度之和，父节点在子节点范围内居中
+"""
+import html
+import re
+import unicodedata
+from typing import Any, Dict, List, TextIO
+
+FONT_SIZE = 16
+LINE_HEIGHT = 20
+PADDING_X = 8
+SPACING_HORIZONTAL = 80
+SPACING_VERTICAL = 5
+NODE_HEIGHT = LINE_HEIGHT + 6
+CIRCLE_RADIUS = 6
+MARGIN = 40
+FONT_FAMILY = '-apple-system, BlinkMacSystemFont, "Segoe UI", "PingFang SC", "Microsoft YaHei", sans-serif'
+
+# 与 markmap 默认配色一致（d3.schemeCategory10），按一级分支着色
+COLORS = [
+    '#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd',
+    '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf'
+]
+
+TAG_RE = re.compile(r'<[^>]+>')
+
+
+class MindmapSvg:
+    """SVG导出类"""
+
+    @staticmethod
+    def plain_text(content: str) -> str:
+        """节点内容（HTML片段）转为纯文本"""
+        return html.unescape(TAG_RE.sub('', content or '')).strip()
+
+    @staticmethod
+    def text_width(text: str) -> float:
+        """估算文本宽度（像素）"""
+        width = 0.0
+        for char in text:
+            if unicodedata.east_asian_width(char) in ('W', 'F'):
+                width += FONT_SIZE
+            else:
+                width += FONT_SIZE * 0.6
+        return width
+
+    @staticmethod
+    def layout(root: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        计算布局，返回按先序排列的节点列表：
+        {"text", "depth", "parent", "branch", "x", "y", "width", "has_children"}
+        其中 y 为节点下划线所在的纵坐标；全程迭代实现，不受递归深度限制
+        """
+        nodes: List[Dict[str, Any]] = []
+        children: List[List[int]] = []
+        stack = [(root, -1, 0, 0)]
+        while stack:
+            node, parent, depth, branch = stack.pop()
+            index = len(nodes)
+            text = MindmapSvg.plain_text(node.get('content', ''))
+            nodes.append({
+                "text": text,
+                "depth": depth,
+                "parent": parent,
+                "branch": branch,
+                "width": MindmapSvg.text_width(text) + PADDING_X * 2,
+            })
+            children.append([])
+            if parent >= 0:
+                children[parent].append(index)
+            kids = node.get('children') or []
+            for i in range(len(kids) - 1, -1, -1):
+                stack.append((kids[i], index, depth + 1, i if depth == 0 else branch))
+            nodes[index]["has_children"] = bool(kids)
+
+        # 自底向上计算子树高度（先序列表倒序即可保证子节点先于父节点）
+        heights = [0.0] * len(nodes)
+        for index in range(len(nodes) - 1, -1, -1):
+            kids = children[index]
+            block = sum(heights[k] for k in kids) + SPACING_VERTICAL * max(0, len(kids) - 1)
+            heights[index] = max(NODE_HEIGHT, block)
+
+        # 自顶向下分配坐标
+        tops = [0.0] * len(nodes)
+        for index, node in enumerate(nodes):
+            parent = node["parent"]
+            node["x"] = 0.0 if parent < 0 else nodes[parent]["x"] + nodes[parent]["width"] + SPACING_HORIZONTAL
+            node["y"] = tops[index] + heights[index] / 2 + NODE_HEIGHT / 2
+            kids = children[index]
+            block = sum(heights[k] for k in kids) + SPACING_VERTICAL * max(0, len(kids) - 1)
+            top = tops[index] + (heights[index] - block) / 2
+            for kid in kids:
+                tops[kid] = top
+                top += heights[kid] + SPACING_VERTICAL
+        return nodes
+
+    @staticmethod
+    def write_svg(root: Dict[str, Any], f: TextIO) -> int:
+        """计算布局并将SVG逐行写入文本流，返回节点数"""
+        nodes = MindmapSvg.layout(root)
+        width = max(node["x"] + node["width"] for node in nodes) + MARGIN * 2
+        height = max(node["y"] for node in nodes) + NODE_HEIGHT + MARGIN * 2
+
+        f.write(
+            f'<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{width:.0f}" height="{height:.0f}" '
+            f'viewBox="0 0 {width:.0f} {height:.0f}">\n'
+            f'<rect width="100%" height="100%" fill="white"/>\n'
+            f'<g transform="translate({MARGIN},{MARGIN})" font-size="{FONT_SIZE}" '
+            f'font-family=\'{FONT_FAMILY}\' fill="none">\n'
+        )
+        # 连线
+        for node in nodes:
+            parent = node["parent"]
+            if parent < 0:
+                continue
+            source = nodes[parent]
+            x1, y1 = source["x"] + source["width"], source["y"]
+            x2, y2 = node["x"], node["y"]
+            middle = (x1 + x2) / 2
+            f.write(
+                f'<path d="M{x1:.1f},{y1:.1f}C{middle:.1f},{y1:.1f} {middle:.1f},{y2:.1f} {x2:.1f},{y2:.1f}" '
+                f'stroke="{COLORS[node["branch"] % len(COLORS)]}" stroke-width="{MindmapSvg.line_width(node["depth"])}"/>\n'
+            )
+        # 节点：下划线、文字、折叠圆点
+        for node in nodes:
+            color = COLORS[node["branch"] % len(COLORS)]
+            x, y, node_width = node["x"], node["y"], node["width"]
+            f.write(
+                f'<line x1="{x:.1f}" y1="{y:.1f}" x2="{x + node_width:.1f}" y2="{y:.1f}" '
+                f'stroke="{color}" stroke-width="{MindmapSvg.line_width(node["depth"] + 1)}"/>'
+                f'<text x="{x + PADDING_X:.1f}" y="{y - 6:.1f}" fill="#333">{html.escape(node["text"])}</text>'
+            )
+            if node["has_children"]:
+                f.write(
+                    f'<circle cx="{x + node_width:.1f}" cy="{y:.1f}" r="{CIRCLE_RADIUS}" '
+                    f'stroke="{color}" stroke-width="1.5" fill="white"/>'
+                )
+            f.write('\n')
+        f.write('</g>\n</svg>\n')
+        return len(nodes)
+
+    @staticmethod
+    def line_width(depth: int) -> float:
+        """连线宽度随层级递减"""
+        return max(1.0, 3.0 - depth * 0.5)
@@ -0,0 +1,202 @@
+"""
+思维导图节点树工具模块
+
+处理 markmap 节点树（{"content", "children", "payload"}）：
+- 从 markmap 生成的HTML中提取/替换内嵌的节点树
+- 按层级和节点预算裁剪节点树，被裁掉的子树标记为延迟加载，子节点过多时分批加载
+- 为大型思维导图预先构建子树索引，按需读取
+"""
+import itertools
+import json
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from .atomic_writer import AtomicWriter
+from .markdown_tree import MarkdownTree
+
+# markmap 生成的HTML中，节点树作为参数紧跟在该标记之后
+EMBEDDED_TREE_MARKER = '()=>window.markmap,null,'
+
+
+class MindmapTree:
+    """节点树工具类"""
+
+    @staticmethod
+    def locate_embedded_tree(html_content: str) -> Optional[Tuple[int, int]]:
+        """
+        定位HTML中内嵌节点树JSON的起止位置，找不到时返回 None
+        嵌套过深、json 模块超出递归深度时同样返回 None（按没有节点树处理）
+        """
+        marker_pos = html_content.find(EMBEDDED_TREE_MARKER)
+        if marker_pos < 0:
+            return None
+        start = marker_pos + len(EMBEDDED_TREE_MARKER)
+        try:
+            _, end = json.JSONDecoder().raw_decode(html_content, start)
+        except (ValueError, RecursionError):
+            return None
+        return start, end
+
+    @staticmethod
+    def extract_embedded_tree(html_content: str) -> Optional[Dict[str, Any]]:
+        """提取HTML中内嵌的节点树"""
+        span = MindmapTree.locate_embedded_tree(html_content)
+        if span is None:
+            return None
+        return json.loads(html_content[span[0]:span[1]])
+
+    @staticmethod
+    def dumps(node: Dict[str, Any]) -> str:
+        """序列化节点树，转义 </ 以便安全嵌入 <script>；嵌套过深时不依赖递归"""
+        return MarkdownTree.dumps(node).replace('</', '<\\/')
+
+    @staticmethod
+    def replace_embedded_tree(html_content: str, tree: Dict[str, Any]) -> Optional[str]:
+        """用新的节点树替换HTML中内嵌的节点树"""
+        span = MindmapTree.locate_embedded_tree(html_content)
+        if span is None:
+            return None
+        return html_content[:span[0]] + MindmapTree.dumps(tree) + html_content[span[1]:]
+
+    @staticmethod
+    def count_nodes(root: Dict[str, Any]) -> int:
+        """统计节点树中的节点总数"""
+        count = 0
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            count += 1
+            stack.extend(node.get('children') or ())
+        return count
+
+    @staticmethod
+    def assign_ids(root: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """按先序遍历为节点分配编号，返回按编号排列的节点列表"""
+        nodes = []
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            node['_id'] = len(nodes)
+            nodes.append(node)
+            stack.extend(reversed(node.get('children') or ()))
+        return nodes
+
+    @staticmethod
+    def _shallow_copy(node: Dict[str, Any]) -> Dict[str, Any]:
+        copied = {key: value for key, value in node.items() if key not in ('children', '_id')}
+        if 'payload' in copied:
+            copied['payload'] = dict(copied['payload'])
+        copied['children'] = []
+        return copied
+
+    @staticmethod
+    def _mark_lazy(copied: Dict[str, Any], source: Dict[str, Any]):
+        """将节点标记为延迟加载：折叠并放入一个占位子节点，展开时由前端请求真实子树"""
+        payload = copied.setdefault('payload', {})
+        payload['lazy'] = source['_id']
+        payload['fold'] = 1
+        copied['children'] = [{
+            "content": f"… {len(source['children'])} 个子节点",
+            "children": [],
+            "payload": {"placeholder": 1}
+        }]
+
+    @staticmethod
+    def _more_node(lazy_id: int, remaining: int) -> Dict[str, Any]:
+        """子节点过多时代替其余兄弟节点的“更多”节点，展开时由前端请求下一批并替换它"""
+        return {
+            "content": f"… 还有 {remaining} 个子节点",
+            "children": [{"content": "…", "children": [], "payload": {"placeholder": 1}}],
+            "payload": {"lazy": lazy_id, "more": 1, "fold": 1}
+        }
+
+    @staticmethod
+    def prune(root: Dict[str, Any], max_depth: int, budget: int, ids: Iterator[int],
+              start: int = 0) -> Tuple[Dict[str, Any], List[Tuple[int, Dict[str, Any], int]]]:
+        """
+        按广度优先裁剪节点树：只保留 max_depth 层以内、总数不超过 budget 的节点
+        - 根节点的子节点从第 start 个开始，至少保留一个，保证每次加载都有进展；
+          放不下的其余子节点用一个“更多”节点代替，分批加载
+        - 更深层放不下的节点整体标记为延迟加载
+        返回 (裁剪后的树, 延迟加载项列表)，每项为 (分片编号, 原始节点, 起始子节点下标)
+        节点需已通过 assign_ids 编号；“更多”节点的分片编号从 ids 中分配
+        """
+        pruned_root = MindmapTree._shallow_copy(root)
+        frontier: List[Tuple[int, Dict[str, Any], int]] = []
+        count = 1
+        children = (root.get('children') or [])[start:]
+        # 根节点的子节点：为根节点和“更多”节点各留一个名额
+        keep = len(children) if len(children) < budget else max(1, budget - 2)
+        queue = deque()
+        for child in children[:keep]:
+            child_copy = MindmapTree._shallow_copy(child)
+            pruned_root['children'].append(child_copy)
+            count += 1
+            queue.append((child, child_copy, 1))
+        if keep < len(children):
+            more_id = next(ids)
+            pruned_root['children'].append(MindmapTree._more_node(more_id, len(children) - keep))
+            frontier.append((more_id, root, start + keep))
+            count += 2
+        while queue:
+            source, copied, depth = queue.popleft()
+            children = source.get('children') or []
+            if not children:
+                continue
+            if depth >= max_depth or count + len(children) > budget:
+                MindmapTree._mark_lazy(copied, source)
+                frontier.append((source['_id'], source, 0))
+                # 占位子节点同样计入预算
+                count += 1
+                continue
+            for child in children:
+                child_copy = MindmapTree._shallow_copy(child)
+                copied['children'].append(child_copy)
+                count += 1
+                queue.append((child, child_copy, depth + 1))
+        return pruned_root, frontier
+
+    @staticmethod
+    def build_subtree_index(root: Dict[str, Any], max_depth: int, budget: int,
+                            chunks_path: Path, index_path: Path) -> Dict[str, Any]:
+        """
+        裁剪节点树并为所有延迟加载的节点预先生成子树分片
+        - chunks_path: 各分片JSON依次写入的文件
+        - index_path: {分片编号: [偏移, 长度]} 索引
+        每个节点只出现在一个分片中，分片总大小与原树同阶；
+        子节点很多的节点按 budget 切分为多个分片，每个分片末尾的“更多”节点指向下一个分片
+        返回首屏使用的裁剪后节点树
+        """
+        nodes = MindmapTree.assign_ids(root)
+        # “更多”节点的分片编号排在所有节点编号之后
+        ids = itertools.count(len(nodes))
+        pruned_root, pending = MindmapTree.prune(root, max_depth, budget, ids)
+        index: Dict[str, List[int]] = {}
+
+        offset = 0
+        with AtomicWriter.open(chunks_path) as f:
+            queue = deque(pending)
+            while queue:
+                chunk_id, node, start = queue.popleft()
+                subtree, frontier = MindmapTree.prune(node, max_depth, budget, ids, start)
+                data = json.dumps(
+                    {"id": chunk_id, "children": subtree['children']},
+                    ensure_ascii=False, separators=(',', ':')
+                ).encode('utf-8')
+                f.write(data)
+                index[str(chunk_id)] = [offset, len(data)]
+                offset += len(data)
+                queue.extend(frontier)
+        AtomicWriter.write_text(index_path, json.dumps(index, separators=(',', ':')))
+        return pruned_root
+
+    @staticmethod
+    def read_subtree(chunks_path: Path, index: Dict[str, List[int]], node_id: str) -> Optional[bytes]:
+        """按索引读取一个子树分片（JSON字节），不存在时返回 None"""
+        entry = index.get(node_id)
+        if entry is None:
+            return None
+        offset, length = entry
+        with open(chunks_path, 'rb') as f:
+            f.seek(offset)
+            return f.read(length)
@@ -0,0 +1,119 @@
+"""
+按路径加锁模块
+
+对同一个文件的写操作串行执行：
+- 进程内：每个路径一把线程锁（按引用计数回收）
+- 进程间：对 RUNTIME_DIR/locks 下与路径对应的锁文件加 flock（仅POSIX）
+锁文件与目标文件分开存放，目标文件被替换（rename）后锁依然有效，也不会出现在文件列表中。
+"""
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List
+from config import RUNTIME_DIR
+
+try:
+    import fcntl
+except ImportError:  # Windows 下只做进程内加锁
+    fcntl = None
+
+LOCK_DIR = RUNTIME_DIR / "locks"
+
+
+class PathLock:
+    """按路径加锁类"""
+
+    _locks: Dict[str, List] = {}
+    _guard = threading.Lock()
+
+    @staticmethod
+    def _key(path: Path) -> str:
+        return os.path.normcase(os.path.abspath(str(path)))
+
+    @staticmethod
+    def _acquire_local(key: str, blocking: bool = True) -> bool:
+        with PathLock._guard:
+            entry = PathLock._locks.get(key)
+            if entry is None:
+                entry = PathLock._locks[key] = [threading.Lock(), 0]
+            entry[1] += 1
+        if entry[0].acquire(blocking):
+            return True
+        PathLock._forget_local(key)
+        return False
+
+    @staticmethod
+    def _release_local(key: str):
+        PathLock._locks[key][0].release()
+        PathLock._forget_local(key)
+
+    @staticmethod
+    def _forget_local(key: str):
+        with PathLock._guard:
+            entry = PathLock._locks[key]
+            entry[1] -= 1
+            if entry[1] == 0:
+                del PathLock._locks[key]
+
+    @staticmethod
+    def _open_lock_file(key: str):
+        LOCK_DIR.mkdir(parents=True, exist_ok=True)
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest() + '.lock'
+        return open(LOCK_DIR / name, 'a+b')
+
+    @staticmethod
+    @contextmanager
+    def hold(path: Path):
+        """
+        持有某个路径的写锁
+        用法:
+            with PathLock.hold(file_path):
+                ...读-改-写...
+        """
+        key = PathLock._key(path)
+        PathLock._acquire_local(key)
+        lock_file = None
+        try:
+            if fcntl is not None:
+                lock_file = PathLock._open_lock_file(key)
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            yield
+        finally:
+            if lock_file is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                lock_file.close()
+            PathLock._release_local(key)
+
+    @staticmethod
+    @contextmanager
+    def try_hold(path: Path) -> Iterator[bool]:
+        """
+        尝试持有某个路径的写锁，不等待：已被其他线程或进程持有时得到 False
+        用法:
+            with PathLock.try_hold(path) as acquired:
+                if acquired:
+                    ...
+        """
+        key = PathLock._key(path)
+        if not PathLock._acquire_local(key, blocking=False):
+            yield False
+            return
+        lock_file = None
+        try:
+            if fcntl is not None:
+                lock_file = PathLock._open_lock_file(key)
+                try:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    lock_file.close()
+                    lock_file = None
+                    yield False
+                    return
+            yield True
+        finally:
+            if lock_file is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                lock_file.close()
+            PathLock._release_local(key)
@@ -0,0 +1,281 @@
+"""
+渲染准入控制与公平调度模块
+
+限制每个工作进程同时运行的 markmap 渲染数，超出的请求进入有界等待队列。
+队列已满或等待超时时立即返回 503，并根据平均渲染耗时计算 Retry-After。
+
+请求按输入大小和节点数分为两个通道：
+- fast: 小文档，可使用全部渲染名额，空出名额时优先分配
+- bulk: 大文档，最多占用 BULK_LANE_CONCURRENCY 个名额
+每个通道内按客户端（API Key 请求头或IP）轮转出队，单个客户端的大量请求不会饿死其他客户端。
+"""
+import asyncio
+import hashlib
+import math
+import re
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+from fastapi import Request, HTTPException
+from config import (
+    MAX_CONCURRENT_RENDERS, RENDER_MAX_QUEUE_SIZE, RENDER_MAX_QUEUE_WAIT,
+    FAST_LANE_MAX_BYTES, FAST_LANE_MAX_NODES, BULK_LANE_CONCURRENCY,
+    RENDER_MAX_QUEUED_PER_CLIENT, CLIENT_KEY_HEADER
+)
+from .metrics import Metrics
+
+# 思维导图节点：标题行和列表项
+NODE_LINE_RE = re.compile(r'^\s*(?:#{1,6}\s|[-*+]\s|\d+[.)]\s)', re.MULTILINE)
+
+# 判断一行是否为节点只需要行首的这些字符（行首空白压缩之后）
+NODE_LINE_HEAD = 64
+
+
+class RenderLane:
+    """渲染通道：并发上限 + 按客户端分组的等待队列"""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.active = 0
+        self.queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        # 渲染耗时的指数移动平均，用于估算 Retry-After
+        self.avg_render_seconds = 1.0
+
+    def queued(self) -> int:
+        """通道内排队的请求数"""
+        return sum(len(queue) for queue in self.queues.values())
+
+    def queued_for(self, client: str) -> int:
+        """某个客户端在通道内排队的请求数"""
+        return len(self.queues.get(client, ()))
+
+    def enqueue(self, client: str, waiter: asyncio.Future):
+        self.queues.setdefault(client, deque()).append(waiter)
+
+    def remove(self, client: str, waiter: asyncio.Future):
+        queue = self.queues.get(client)
+        if queue is None:
+            return
+        try:
+            queue.remove(waiter)
+        except ValueError:
+            pass
+        if not queue:
+            del self.queues[client]
+
+    def pop_next(self) -> Optional[asyncio.Future]:
+        """按客户端轮转取出下一个等待者"""
+        while self.queues:
+            client, queue = next(iter(self.queues.items()))
+            waiter = queue.popleft()
+            if queue:
+                # 该客户端还有请求，移到队尾等待下一轮
+                self.queues.move_to_end(client)
+            else:
+                del self.queues[client]
+            if not waiter.done():
+                return waiter
+        return None
+
+    def record(self, elapsed: float, alpha: float = 0.2):
+        self.avg_render_seconds += alpha * (elapsed - self.avg_render_seconds)
+
+
+class RenderAdmission:
+    """渲染准入控制类"""
+
+    _active = 0
+    _lanes: Dict[str, RenderLane] = {
+        "fast": RenderLane("fast", MAX_CONCURRENT_RENDERS),
+        "bulk": RenderLane("bulk", BULK_LANE_CONCURRENCY),
+    }
+
+    @staticmethod
+    def count_nodes(content: str) -> int:
+        """统计Markdown中的节点数（标题和列表项）"""
+        return len(NODE_LINE_RE.findall(content))
+
+    @staticmethod
+    def line_head(fragment: str) -> str:
+        """
+        流式统计时未结束的行只保留判断是否为节点所需的行首部分：
+        行首空白压缩为一个空格，最多保留 NODE_LINE_HEAD 个字符，没有换行的长行不会被反复复制和扫描
+        """
+        stripped = fragment.lstrip()
+        if len(stripped) != len(fragment):
+            stripped = ' ' + stripped
+        return stripped[:NODE_LINE_HEAD]
+
+    @staticmethod
+    def classify(size: int, node_count: int) -> str:
+        """按输入大小和节点数选择通道"""
+        if size <= FAST_LANE_MAX_BYTES and node_count <= FAST_LANE_MAX_NODES:
+            return "fast"
+        return "bulk"
+
+    @staticmethod
+    def client_key(request: Request) -> str:
+        """识别客户端：优先使用 API Key 请求头（只保留摘要），否则使用客户端IP"""
+        api_key = request.headers.get(CLIENT_KEY_HEADER) if CLIENT_KEY_HEADER else None
+        if api_key:
+            return "key:" + hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+        return "ip:" + (request.client.host if request.client else "unknown")
+
+    @staticmethod
+    def queue_length() -> int:
+        """当前排队的请求总数"""
+        return sum(lane.queued() for lane in RenderAdmission._lanes.values())
+
+    @staticmethod
+    def retry_after(lane: RenderLane) -> int:
+        """按通道排队长度和平均渲染耗时估算客户端应等待的秒数"""
+        pending = lane.queued() + 1
+        estimate = pending * lane.avg_render_seconds / max(1, lane.limit)
+        return max(1, math.ceil(estimate))
+
+    @staticmethod
+    def status() -> dict:
+        """当前进程的准入状态"""
+        return {
+            "active": RenderAdmission._active,
+            "queued": RenderAdmission.queue_length(),
+            "max_concurrent": MAX_CONCURRENT_RENDERS,
+            "max_queue_size": RENDER_MAX_QUEUE_SIZE,
+            "max_queue_wait_seconds": RENDER_MAX_QUEUE_WAIT,
+            "lanes": {
+                name: {
+                    "active": lane.active,
+                    "queued": lane.queued(),
+                    "waiting_clients": len(lane.queues),
+                    "limit": lane.limit,
+                    "avg_render_seconds": round(lane.avg_render_seconds, 3)
+                }
+                for name, lane in RenderAdmission._lanes.items()
+            }
+        }
+
+    @staticmethod
+    def _update_gauges():
+        Metrics.set_gauge("render_active", RenderAdmission._active)
+        Metrics.set_gauge("render_queue_length", RenderAdmission.queue_length())
+        for name, lane in RenderAdmission._lanes.items():
+            Metrics.set_gauge(f"render_active_{name}", lane.active)
+            Metrics.set_gauge(f"render_queue_length_{name}", lane.queued())
+
+    @staticmethod
+    def _reject(lane: RenderLane, status_code: int, reason: str, detail: str):
+        """拒绝请求并记录指标"""
+        Metrics.incr("render_rejected_total")
+        Metrics.incr(f"render_rejected_{reason}_total")
+        raise HTTPException(
+            status_code=status_code,
+            detail=detail,
+            headers={"Retry-After": str(RenderAdmission.retry_after(lane))}
+        )
+
+    @staticmethod
+    def _can_start(lane: RenderLane) -> bool:
+        return RenderAdmission._active < MAX_CONCURRENT_RENDERS and lane.active < lane.limit
+
+    @staticmethod
+    def _start(lane: RenderLane):
+        lane.active += 1
+        RenderAdmission._active += 1
+
+    @staticmethod
+    def _pick_lane() -> Optional[RenderLane]:
+        """选择下一个获得名额的通道"""
+        fast = RenderAdmission._lanes["fast"]
+        bulk = RenderAdmission._lanes["bulk"]
+        # 批量通道有请求却一个都没在运行时先分配给它，避免被持续的小请求饿死
+        if bulk.queued() and bulk.active == 0:
+            return bulk
+        if fast.queued() and fast.active < fast.limit:
+            return fast
+        if bulk.queued() and bulk.active < bulk.limit:
+            return bulk
+        return None
+
+    @staticmethod
+    def _dispatch():
+        """把空闲名额转交给排队的请求"""
+        while RenderAdmission._active < MAX_CONCURRENT_RENDERS:
+            lane = RenderAdmission._pick_lane()
+            if lane is None:
+                break
+            waiter = lane.pop_next()
+            if waiter is None:
+                continue
+            RenderAdmission._start(lane)
+            waiter.set_result(True)
+        RenderAdmission._update_gauges()
+
+    @staticmethod
+    async def acquire(lane_name: str, client: str):
+        """获取渲染名额，必要时排队等待"""
+        lane = RenderAdmission._lanes[lane_name]
+        Metrics.incr(f"render_lane_{lane_name}_total")
+
+        if not lane.queued() and RenderAdmission._can_start(lane):
+            RenderAdmission._start(lane)
+            Metrics.incr("render_admitted_total")
+            RenderAdmission._update_gauges()
+            return
+
+        if lane.queued_for(client) >= RENDER_MAX_QUEUED_PER_CLIENT:
+            RenderAdmission._reject(lane, 429, "client_limit", "当前客户端排队的渲染请求过多，请稍后重试")
+        if lane.queued() >= RENDER_MAX_QUEUE_SIZE:
+            RenderAdmission._reject(lane, 503, "queue_full", "渲染队列已满，请稍后重试")
+
+        waiter = asyncio.get_running_loop().create_future()
+        lane.enqueue(client, waiter)
+        RenderAdmission._update_gauges()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=RENDER_MAX_QUEUE_WAIT)
+        except asyncio.TimeoutError:
+            if not (waiter.done() and not waiter.cancelled()):
+                waiter.cancel()
+                lane.remove(client, waiter)
+                RenderAdmission._update_gauges()
+                RenderAdmission._reject(lane, 503, "wait_timeout", f"渲染排队超过 {RENDER_MAX_QUEUE_WAIT:g} 秒，请稍后重试")
+            # 超时的同时刚好被分配了名额，直接使用
+        except asyncio.CancelledError:
+            # 请求被取消：若已分配名额则归还
+            if waiter.done() and not waiter.cancelled():
+                RenderAdmission.release(lane_name)
+            else:
+                waiter.cancel()
+                lane.remove(client, waiter)
+                RenderAdmission._update_gauges()
+            raise
+        Metrics.incr("render_admitted_total")
+
+    @staticmethod
+    def release(lane_name: str, elapsed: float = None):
+        """归还渲染名额，并转交给下一个排队的请求"""
+        lane = RenderAdmission._lanes[lane_name]
+        if elapsed is not None:
+            lane.record(elapsed)
+        lane.active -= 1
+        RenderAdmission._active -= 1
+        RenderAdmission._dispatch()
+
+    @staticmethod
+    @asynccontextmanager
+    async def slot(request: Request, size: int, node_count: int):
+        """
+        渲染名额上下文，按输入规模选择通道、按客户端公平排队
+
+        用法:
+            async with RenderAdmission.slot(request, size, node_count):
+                ...执行渲染...
+        """
+        lane_name = RenderAdmission.classify(size, node_count)
+        await RenderAdmission.acquire(lane_name, RenderAdmission.client_key(request))
+        started = time.monotonic()
+        try:
+            yield lane_name
+        finally:
+            RenderAdmission.release(lane_name, time.monotonic() - started)
@@ -0,0 +1,97 @@
+"""
+渲染缓存模块
+
+以 Markdown 内容的 SHA-256 摘要为键，在HTML接口和节点树接口之间共享渲染结果：
+- 节点树：当前进程内的LRU缓存，总量按源文本字节数限制在 TREE_CACHE_MAX_BYTES 以内
+- 已生成的HTML：摘要+变体 → 文件名，保存在共享状态中，所有工作进程可见
+相同内容重复提交时直接复用已有结果，不再启动 markmap。
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from config import STATIC_HTML_DIR, TREE_CACHE_MAX_BYTES
+from .metrics import Metrics
+from .shared_state import SharedState
+from .storage import Storage
+
+HTML_NAMESPACE = 'render_html'
+
+
+class RenderCache:
+    """渲染缓存类"""
+
+    _trees: "OrderedDict[str, Tuple[Dict[str, Any], int]]" = OrderedDict()
+    _tree_bytes = 0
+    _lock = threading.Lock()
+
+    @staticmethod
+    def hasher():
+        """创建用于计算内容摘要的增量哈希对象"""
+        return hashlib.sha256()
+
+    @staticmethod
+    def digest(data: bytes) -> str:
+        """计算内容摘要"""
+        return hashlib.sha256(data).hexdigest()
+
+    # ==================== 节点树 ====================
+
+    @staticmethod
+    def get_tree(digest: str) -> Optional[Dict[str, Any]]:
+        """读取缓存的节点树，调用方不得修改返回的对象"""
+        with RenderCache._lock:
+            entry = RenderCache._trees.get(digest)
+            if entry is None:
+                return None
+            RenderCache._trees.move_to_end(digest)
+            return entry[0]
+
+    @staticmethod
+    def put_tree(digest: str, tree: Dict[str, Any], cost: int):
+        """缓存节点树，cost 为源文本字节数；超出总量时淘汰最久未使用的条目"""
+        if not digest or cost > TREE_CACHE_MAX_BYTES:
+            return
+        with RenderCache._lock:
+            old = RenderCache._trees.pop(digest, None)
+            if old is not None:
+                RenderCache._tree_bytes -= old[1]
+            RenderCache._trees[digest] = (tree, cost)
+            RenderCache._tree_bytes += cost
+            while RenderCache._tree_bytes > TREE_CACHE_MAX_BYTES:
+                _, (_, evicted_cost) = RenderCache._trees.popitem(last=False)
+                RenderCache._tree_bytes -= evicted_cost
+            entries, total = len(RenderCache._trees), RenderCache._tree_bytes
+        Metrics.set_gauge("render_cache_tree_entries", entries)
+        Metrics.set_gauge("render_cache_tree_bytes", total)
+
+    # ==================== 已生成的HTML ====================
+
+    @staticmethod
+    def get_html(digest: str, variant: str) -> Optional[str]:
+        """查找相同内容已生成的HTML文件名，文件已被删除时视为未命中"""
+        if not digest:
+            return None
+        value = SharedState.cache_get(HTML_NAMESPACE, f"{variant}:{digest}")
+        if value is None:
+            return None
+        filename = value.decode('utf-8')
+        if not Storage.exists(STATIC_HTML_DIR / filename):
+            SharedState.cache_delete(HTML_NAMESPACE, f"{variant}:{digest}")
+            return None
+        return filename
+
+    @staticmethod
+    def put_html(digest: str, variant: str, filename: str):
+        """记录某个内容、某个变体对应的HTML文件名"""
+        if not digest:
+            return
+        try:
+            SharedState.cache_set(HTML_NAMESPACE, f"{variant}:{digest}", filename.encode('utf-8'))
+        except Exception as e:
+            print(f"写入渲染缓存失败: {str(e)}")
+
+    @staticmethod
+    def record(hit: bool):
+        """记录缓存命中情况"""
+        Metrics.incr("render_cache_hit_total" if hit else "render_cache_miss_total")
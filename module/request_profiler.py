@@ -0,0 +1,274 @@
+"""
+按请求的性能剖析模块
+
+排查线上个别慢请求（如某次 /upload-local、/preview）时使用：
+请求带上 X-Profile 请求头或 ?profile= 查询参数，且配置中已启用时，只对这一个请求采集：
+- CPU 采样：后台线程按固定间隔抓取事件循环线程、以及替该请求在工作线程池中执行任务的线程的调用栈
+- 内存分配：请求期间开启 tracemalloc，结束时与开始时的快照对比，列出新增分配最多的代码行和峰值
+结果写入剖析目录：{id}.speedscope.json（可直接拖入 https://www.speedscope.app 查看）和 {id}.txt（文本报告）。
+中间件只在 [profiling] enabled = true 时安装；未启用时没有任何额外开销。
+事件循环线程的采样会包含同一时间其他请求在事件循环上的工作，等待渲染子进程的时间显示为事件循环空闲（select）。
+"""
+import contextvars
+import json
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+from config import (
+    PROFILING_HEADER, PROFILING_QUERY_PARAM, PROFILING_TOKEN, PROFILING_DIR, PROFILING_SAMPLE_INTERVAL,
+    PROFILING_TRACEMALLOC_FRAMES, PROFILING_TOP_N, PROFILING_MAX_PROFILES
+)
+from .metrics import Metrics
+
+# 单个调用栈最多记录的层数
+MAX_STACK_DEPTH = 128
+
+# 当前请求的剖析会话（工作线程池提交任务时据此登记执行线程）
+_active_session: contextvars.ContextVar[Optional['ProfileSession']] = contextvars.ContextVar(
+    'profile_session', default=None
+)
+
+
+class ProfileSession:
+    """单个请求的剖析会话：采样线程 + tracemalloc 快照"""
+
+    def __init__(self, profile_id: str, label: str):
+        self.profile_id = profile_id
+        self.label = label
+        self.interval = PROFILING_SAMPLE_INTERVAL
+        self.threads: Dict[int, str] = {threading.get_ident(): 'event-loop'}
+        self.lock = threading.Lock()
+        self.frames: Dict[Tuple[str, str, int], int] = {}
+        self.samples: Dict[str, List[Tuple[List[int], float]]] = {}
+        self.stop_event = threading.Event()
+        self.sampler: Optional[threading.Thread] = None
+        self.started_tracemalloc = False
+        self.start_snapshot: Optional[tracemalloc.Snapshot] = None
+        self.end_snapshot: Optional[tracemalloc.Snapshot] = None
+        self.peak_bytes = 0
+        self.started_at = 0.0
+        self.elapsed = 0.0
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(PROFILING_TRACEMALLOC_FRAMES)
+            self.started_tracemalloc = True
+        tracemalloc.reset_peak()
+        self.start_snapshot = tracemalloc.take_snapshot()
+        self.started_at = time.perf_counter()
+        self.sampler = threading.Thread(target=self._sample_loop, name=f"profiler-{self.profile_id}", daemon=True)
+        self.sampler.start()
+
+    def stop(self):
+        self.elapsed = time.perf_counter() - self.started_at
+        self.stop_event.set()
+        if self.sampler is not None:
+            self.sampler.join()
+        self.peak_bytes = tracemalloc.get_traced_memory()[1]
+        self.end_snapshot = tracemalloc.take_snapshot()
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+
+    def track_thread(self, name: str) -> int:
+        """工作线程开始替该请求执行任务"""
+        ident = threading.get_ident()
+        with self.lock:
+            self.threads[ident] = name
+        return ident
+
+    def untrack_thread(self, ident: int):
+        with self.lock:
+            self.threads.pop(ident, None)
+
+    def _frame_index(self, frame) -> int:
+        code = frame.f_code
+        key = (code.co_name, code.co_filename, code.co_firstlineno)
+        index = self.frames.get(key)
+        if index is None:
+            index = self.frames[key] = len(self.frames)
+        return index
+
+    def _sample_loop(self):
+        own = threading.get_ident()
+        last = time.perf_counter()
+        while not self.stop_event.wait(self.interval):
+            now = time.perf_counter()
+            weight = (now - last) * 1000
+            last = now
+            current = sys._current_frames()
+            with self.lock:
+                threads = list(self.threads.items())
+            for ident, name in threads:
+                frame = current.get(ident)
+                if frame is None or ident == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(self._frame_index(frame))
+                    frame = frame.f_back
+                stack.reverse()
+                self.samples.setdefault(name, []).append((stack, weight))
+
+    # ==================== 报告 ====================
+
+    def speedscope(self) -> Dict[str, Any]:
+        """speedscope 文件格式（每个线程一个 sampled 类型的 profile，单位毫秒）"""
+        frames = [{"name": name, "file": filename, "line": line}
+                  for (name, filename, line), _ in sorted(self.frames.items(), key=lambda item: item[1])]
+        profiles = []
+        for thread_name, samples in sorted(self.samples.items()):
+            total = sum(weight for _, weight in samples)
+            profiles.append({
+                "type": "sampled",
+                "name": thread_name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": round(total, 3),
+                "samples": [stack for stack, _ in samples],
+                "weights": [round(weight, 3) for _, weight in samples]
+            })
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": self.label,
+            "exporter": "mindmap-request-profiler",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": profiles
+        }
+
+    def text_report(self) -> str:
+        names = {index: f"{name} ({filename}:{line})" for (name, filename, line), index in self.frames.items()}
+        lines = [
+            f"请求: {self.label}",
+            f"剖析ID: {self.profile_id}",
+            f"耗时: {self.elapsed * 1000:.1f} ms, 采样间隔: {self.interval * 1000:g} ms",
+            ""
+        ]
+        for thread_name, samples in sorted(self.samples.items()):
+            total = sum(weight for _, weight in samples) or 1.0
+            own: Counter = Counter()
+            cumulative: Counter = Counter()
+            for stack, weight in samples:
+                if stack:
+                    own[stack[-1]] += weight
+                for index in set(stack):
+                    cumulative[index] += weight
+            lines.append(f"== 线程 {thread_name}: {len(samples)} 个样本, {total:.1f} ms ==")
+            lines.append(f"-- 自身耗时前 {PROFILING_TOP_N} --")
+            for index, weight in own.most_common(PROFILING_TOP_N):
+                lines.append(f"{weight:10.1f} ms {weight / total:6.1%}  {names[index]}")
+            lines.append(f"-- 累计耗时前 {PROFILING_TOP_N} --")
+            for index, weight in cumulative.most_common(PROFILING_TOP_N):
+                lines.append(f"{weight:10.1f} ms {weight / total:6.1%}  {names[index]}")
+            lines.append("")
+        lines.append(f"== 内存分配（tracemalloc，最多 {PROFILING_TRACEMALLOC_FRAMES} 层调用栈） ==")
+        lines.append(f"请求期间峰值: {self.peak_bytes / 1024:.1f} KB")
+        if self.start_snapshot is not None and self.end_snapshot is not None:
+            filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+            diff = self.end_snapshot.filter_traces(filters).compare_to(
+                self.start_snapshot.filter_traces(filters), 'lineno'
+            )
+            lines.append(f"-- 新增分配前 {PROFILING_TOP_N}（请求结束时仍未释放） --")
+            for stat in diff[:PROFILING_TOP_N]:
+                lines.append(str(stat))
+        return "\n".join(lines) + "\n"
+
+
+class RequestProfiler:
+    """按请求的性能剖析类"""
+
+    # tracemalloc 是进程级的，同一时间只剖析一个请求
+    _busy = threading.Lock()
+
+    @staticmethod
+    def current() -> Optional[ProfileSession]:
+        return _active_session.get()
+
+    @staticmethod
+    def requested(scope: Dict[str, Any]) -> bool:
+        """请求是否要求剖析：请求头或查询参数的值为 1/true，或与配置的令牌一致"""
+        values = []
+        header = PROFILING_HEADER.lower().encode('latin-1')
+        for name, value in scope.get('headers', []):
+            if name == header:
+                values.append(value.decode('latin-1'))
+        query = scope.get('query_string', b'')
+        if query and PROFILING_QUERY_PARAM.encode('latin-1') in query:
+            values += parse_qs(query.decode('latin-1')).get(PROFILING_QUERY_PARAM, [])
+        for value in values:
+            value = value.strip()
+            if PROFILING_TOKEN:
+                if value == PROFILING_TOKEN:
+                    return True
+            elif value.lower() in ('1', 'true', 'yes'):
+                return True
+        return False
+
+    @staticmethod
+    def new_profile_id(method: str, path: str) -> str:
+        slug = re.sub(r'[^\w.-]+', '_', path.strip('/'))[:60] or 'root'
+        return f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{method.lower()}_{slug}_{uuid.uuid4().hex[:6]}"
+
+    @staticmethod
+    def write_reports(session: ProfileSession) -> List[Path]:
+        """写入 speedscope 和文本报告，并删除超出数量上限的旧报告"""
+        PROFILING_DIR.mkdir(parents=True, exist_ok=True)
+        json_path = PROFILING_DIR / f"{session.profile_id}.speedscope.json"
+        text_path = PROFILING_DIR / f"{session.profile_id}.txt"
+        json_path.write_text(json.dumps(session.speedscope(), ensure_ascii=False), encoding='utf-8')
+        text_path.write_text(session.text_report(), encoding='utf-8')
+        reports = sorted(PROFILING_DIR.glob('*.speedscope.json'), key=lambda path: path.stat().st_mtime)
+        for old in reports[:max(0, len(reports) - PROFILING_MAX_PROFILES)]:
+            old.unlink(missing_ok=True)
+            old.with_name(old.name.replace('.speedscope.json', '.txt')).unlink(missing_ok=True)
+        print(f"已写入请求剖析报告: {json_path}")
+        return [json_path, text_path]
+
+
+class ProfilingMiddleware:
+    """
+    ASGI 中间件：对要求剖析的请求采集 CPU 采样和内存分配
+    响应头 X-Profile-Id 给出报告文件名；已有请求正在剖析时照常处理并返回 X-Profile-Skipped: busy
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not RequestProfiler.requested(scope):
+            await self.app(scope, receive, send)
+            return
+        if not RequestProfiler._busy.acquire(blocking=False):
+            await self.app(scope, receive, self._with_headers(send, [(b'x-profile-skipped', b'busy')]))
+            return
+        try:
+            profile_id = RequestProfiler.new_profile_id(scope['method'], scope['path'])
+            session = ProfileSession(profile_id, f"{scope['method']} {scope['path']}")
+            token = _active_session.set(session)
+            session.start()
+            try:
+                await self.app(scope, receive, self._with_headers(send, [(b'x-profile-id', profile_id.encode())]))
+            finally:
+                session.stop()
+                _active_session.reset(token)
+            Metrics.incr("request_profile_total")
+        finally:
+            RequestProfiler._busy.release()
+        from .workload_pools import WorkloadPools
+        await WorkloadPools.run('file_io', RequestProfiler.write_reports, session)
+
+    @staticmethod
+    def _with_headers(send, headers: List[Tuple[bytes, bytes]]):
+        async def wrapped(message):
+            if message['type'] == 'http.response.start':
+                message = dict(message, headers=list(message.get('headers', [])) + headers)
+            await send(message)
+        return wrapped
@@ -0,0 +1,363 @@
+"""
+全文检索模块
+
+对保存的文本文件（text_files/）和思维导图的 Markdown 源文件（markdown/）建立磁盘倒排索引：
+- 索引基于 SQLite FTS5，保存在 RUNTIME_DIR/search.db（WAL 模式，多个工作进程共用）
+- 中日韩文字按重叠二元组（bigram）切分，并补上每段文字的最后一个字，单字查询按前缀匹配；
+  其他文字按单词切分，大小写不敏感
+- 保存文本、追加/替换、生成思维导图时增量更新；启动时后台对账，补齐新增、修改和已删除的文件
+- 按 BM25 排序（标题权重更高），分页返回，并从原文中截取包含关键词的摘要；
+  所有匹配文档参与排序，计数最多统计到 SEARCH_MAX_RESULTS 个，常见词的计数耗时不随文档总数增长
+"""
+import html
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import PurePosixPath
+from typing import Any, Dict, List, Optional, Tuple
+from fastapi import HTTPException
+from config import (
+    RUNTIME_DIR, SEARCH_ENABLED, SEARCH_MAX_DOCUMENT_CHARS, SEARCH_SNIPPET_CHARS, SEARCH_MAX_PAGE_SIZE,
+    SEARCH_MAX_RESULTS
+)
+from .metrics import Metrics
+from .path_lock import PathLock
+from .storage import Storage
+
+SEARCH_DB_PATH = RUNTIME_DIR / "search.db"
+# 启动对账期间持有该路径的锁（锁文件在 RUNTIME_DIR/locks 下，该路径本身不会被创建）
+SEARCH_RECONCILE_LOCK = RUNTIME_DIR / "search_reconcile"
+
+# 建立索引的目录（对象键前缀）及分类
+INDEXED_PREFIXES = {
+    'text_files/': 'text_files',
+    'markdown/': 'markdown',
+}
+
+# 中日韩文字：假名、CJK 统一表意文字（含扩展A）、兼容表意文字、谚文
+CJK_CHARS = '぀-ヿ㐀-䶿一-鿿豈-﫿가-힯'
+TOKEN_RE = re.compile(f'([{CJK_CHARS}]+)|([^\\W{CJK_CHARS}]+)')
+HEADING_RE = re.compile(r'^\s{0,3}#{1,6}\s+(.+?)\s*#*\s*$', re.MULTILINE)
+
+
+class SearchIndex:
+    """全文检索类"""
+
+    _local = threading.local()
+    _init_lock = threading.Lock()
+    _initialized_pid: Optional[int] = None
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS docs (
+        id INTEGER PRIMARY KEY,
+        key TEXT NOT NULL UNIQUE,
+        category TEXT NOT NULL,
+        title TEXT NOT NULL,
+        content TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        mtime REAL NOT NULL
+    );
+    CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(title, body, category, tokenize = 'unicode61');
+    """
+
+    @staticmethod
+    def connection() -> sqlite3.Connection:
+        """获取当前线程的索引数据库连接（每个进程、每个线程各自一个连接）"""
+        pid = os.getpid()
+        conn = getattr(SearchIndex._local, 'conn', None)
+        if conn is not None and SearchIndex._local.pid == pid:
+            return conn
+
+        SEARCH_DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(SEARCH_DB_PATH), timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA busy_timeout = 30000")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        with SearchIndex._init_lock:
+            if SearchIndex._initialized_pid != pid:
+                conn.execute("PRAGMA journal_mode = WAL")
+                conn.executescript(SearchIndex.SCHEMA)
+                SearchIndex._initialized_pid = pid
+        SearchIndex._local.conn = conn
+        SearchIndex._local.pid = pid
+        return conn
+
+    # ==================== 分词 ====================
+
+    @staticmethod
+    def tokenize(text: str) -> List[str]:
+        """
+        建索引用的分词：中日韩文字输出重叠二元组和最后一个字（"全文检索" → 全文 文检 检索 索），
+        其他文字按单词输出小写形式
+        """
+        tokens = []
+        for match in TOKEN_RE.finditer(text):
+            cjk, word = match.groups()
+            if word:
+                tokens.append(word.lower())
+                continue
+            tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+            tokens.append(cjk[-1])
+        return tokens
+
+    @staticmethod
+    def build_query(query: str) -> Tuple[str, List[str]]:
+        """
+        将用户输入转换为 FTS5 查询，返回 (查询表达式, 用于高亮的关键词)
+        多个关键词之间为"与"关系；连续的中日韩文字按二元组短语匹配，单个字按前缀匹配
+        """
+        clauses = []
+        terms = []
+        for match in TOKEN_RE.finditer(query):
+            cjk, word = match.groups()
+            if word:
+                clauses.append(f'"{word.lower()}"')
+                terms.append(word)
+            elif len(cjk) == 1:
+                clauses.append(f'"{cjk}" *')
+                terms.append(cjk)
+            else:
+                clauses.append('"' + ' '.join(cjk[i:i + 2] for i in range(len(cjk) - 1)) + '"')
+                terms.append(cjk)
+        return ' AND '.join(clauses), terms
+
+    # ==================== 建立索引 ====================
+
+    @staticmethod
+    def category_for(key: str) -> Optional[str]:
+        """对象键所属的索引分类，不在索引范围内时返回 None"""
+        for prefix, category in INDEXED_PREFIXES.items():
+            if key.startswith(prefix) and '/' not in key[len(prefix):]:
+                return category
+        return None
+
+    @staticmethod
+    def extract_title(key: str, text: str) -> str:
+        """标题：Markdown 取第一个标题，其余取文件名"""
+        if key.endswith('.md'):
+            match = HEADING_RE.search(text[:SEARCH_MAX_DOCUMENT_CHARS])
+            if match:
+                return match.group(1)
+        return PurePosixPath(key).name
+
+    @staticmethod
+    def index_document(key: str, text: str, size: int, mtime: float):
+        """
+        添加或更新一个文档（超过 SEARCH_MAX_DOCUMENT_CHARS 的部分不建索引）
+        更新时删除旧记录后重新插入，文档编号（rowid）递增，即按最近更新排列
+        """
+        category = SearchIndex.category_for(key)
+        if not SEARCH_ENABLED or category is None:
+            return
+        content = text[:SEARCH_MAX_DOCUMENT_CHARS]
+        title = SearchIndex.extract_title(key, content)
+        title_tokens = ' '.join(SearchIndex.tokenize(title))
+        body_tokens = ' '.join(SearchIndex.tokenize(content))
+
+        conn = SearchIndex.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT id FROM docs WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                conn.execute("DELETE FROM docs_fts WHERE rowid = ?", (row[0],))
+                conn.execute("DELETE FROM docs WHERE id = ?", (row[0],))
+            doc_id = conn.execute(
+                "INSERT INTO docs (key, category, title, content, size, mtime) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, category, title, content, size, mtime)
+            ).lastrowid
+            conn.execute(
+                "INSERT INTO docs_fts (rowid, title, body, category) VALUES (?, ?, ?, ?)",
+                (doc_id, title_tokens, body_tokens, category)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        Metrics.incr("search_index_total")
+
+    @staticmethod
+    def index_key(key: str):
+        """
+        从存储后端读取文件并更新索引
+        索引失败只记录日志，不影响保存和渲染本身，启动时的对账会补齐
+        """
+        if not SEARCH_ENABLED or SearchIndex.category_for(key) is None:
+            return
+        try:
+            backend = Storage.backend()
+            info = backend.stat(key)
+            if info is None:
+                SearchIndex.remove_document(key)
+                return
+            text = backend.read_bytes(key).decode('utf-8', errors='replace')
+            SearchIndex.index_document(key, text, info.size, info.mtime)
+        except Exception as e:
+            Metrics.incr("search_index_failed_total")
+            print(f"更新全文索引失败 {key}: {str(e)}")
+
+    @staticmethod
+    def remove_document(key: str):
+        """从索引中删除文档"""
+        conn = SearchIndex.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT id FROM docs WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                conn.execute("DELETE FROM docs_fts WHERE rowid = ?", (row[0],))
+                conn.execute("DELETE FROM docs WHERE id = ?", (row[0],))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def reconcile() -> Dict[str, int]:
+        """
+        对账：为存储中新增或修改过的文件建立索引，删除已不存在的文件的索引
+        按大小和修改时间判断文件是否变化，未变化的文件不会重新读取
+        """
+        if not SEARCH_ENABLED:
+            return {"indexed": 0, "removed": 0}
+        started = time.time()
+        indexed = removed = 0
+        known = {
+            key: (size, mtime)
+            for key, size, mtime in SearchIndex.connection().execute("SELECT key, size, mtime FROM docs")
+        }
+        backend = Storage.backend()
+        for prefix in INDEXED_PREFIXES:
+            for info in backend.list(prefix, recursive=False):
+                previous = known.pop(info.key, None)
+                if previous == (info.size, info.mtime):
+                    continue
+                SearchIndex.index_key(info.key)
+                indexed += 1
+        for key in known:
+            SearchIndex.remove_document(key)
+            removed += 1
+        total = SearchIndex.connection().execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+        Metrics.set_gauge("search_documents", total)
+        print(f"全文索引对账完成: 新增或更新 {indexed} 个, 删除 {removed} 个, "
+              f"共 {total} 个文档, 耗时 {time.time() - started:.2f}s")
+        return {"indexed": indexed, "removed": removed}
+
+    @staticmethod
+    def reconcile_in_background():
+        """
+        在后台线程中对账，不阻塞服务启动
+        多进程模式下由对账锁保证同一时间只有一个工作进程执行，其他进程发现锁被占用时跳过
+        """
+        if not SEARCH_ENABLED:
+            return
+
+        def run():
+            with PathLock.try_hold(SEARCH_RECONCILE_LOCK) as acquired:
+                if not acquired:
+                    print("其他工作进程正在对账全文索引，跳过")
+                    return
+                try:
+                    SearchIndex.reconcile()
+                except Exception as e:
+                    print(f"全文索引对账失败: {str(e)}")
+
+        threading.Thread(target=run, name="search-reconcile", daemon=True).start()
+
+    # ==================== 查询 ====================
+
+    @staticmethod
+    def make_snippet(content: str, terms: List[str]) -> str:
+        """从原文中截取第一个关键词附近的片段，HTML 转义后用 <mark> 标记关键词"""
+        lowered = content.lower()
+        positions = [pos for pos in (lowered.find(term.lower()) for term in terms) if pos >= 0]
+        first = min(positions) if positions else 0
+        start = max(0, first - SEARCH_SNIPPET_CHARS // 3)
+        end = min(len(content), start + SEARCH_SNIPPET_CHARS)
+        fragment = ' '.join(content[start:end].split())
+        if terms:
+            # 在原文上定位关键词，分段转义，避免把 HTML 实体切开
+            pattern = re.compile('|'.join(re.escape(term) for term in sorted(terms, key=len, reverse=True)), re.IGNORECASE)
+            parts = []
+            last = 0
+            for match in pattern.finditer(fragment):
+                parts.append(html.escape(fragment[last:match.start()]))
+                parts.append(f'<mark>{html.escape(match.group(0))}</mark>')
+                last = match.end()
+            parts.append(html.escape(fragment[last:]))
+            snippet = ''.join(parts)
+        else:
+            snippet = html.escape(fragment)
+        return ('…' if start > 0 else '') + snippet + ('…' if end < len(content) else '')
+
+    @staticmethod
+    def result_url(base_url: str, key: str, category: str) -> str:
+        """搜索结果的访问地址：文本文件为预览地址，Markdown 源文件为对应的思维导图"""
+        if category == 'markdown':
+            return f"{base_url}html/{PurePosixPath(key).stem}.html"
+        return f"{base_url}preview/{key}"
+
+    @staticmethod
+    def search(base_url: str, query: str, page: int = 1, page_size: int = 20,
+               category: Optional[str] = None) -> Dict[str, Any]:
+        """
+        全文检索，按相关度（BM25，标题权重更高）排序分页返回
+        结果包含文件路径、标题、访问地址、摘要和相关度得分；
+        所有匹配文档都参与排序；匹配文档超过 SEARCH_MAX_RESULTS 个时 total 只计到上限（total_exact 为 false）
+        """
+        if not SEARCH_ENABLED:
+            raise HTTPException(status_code=404, detail="全文检索未启用")
+        if page < 1:
+            raise HTTPException(status_code=400, detail="page 不能小于 1")
+        if not 1 <= page_size <= SEARCH_MAX_PAGE_SIZE:
+            raise HTTPException(status_code=400, detail=f"page_size 需要在 1 到 {SEARCH_MAX_PAGE_SIZE} 之间")
+        if category is not None and category not in INDEXED_PREFIXES.values():
+            raise HTTPException(
+                status_code=400,
+                detail=f"不支持的分类: {category}，可选值: {', '.join(INDEXED_PREFIXES.values())}"
+            )
+        match, terms = SearchIndex.build_query(query or '')
+        if not match:
+            raise HTTPException(status_code=400, detail="查询内容不能为空")
+        if category:
+            match = f'({match}) AND category : "{category}"'
+
+        started = time.perf_counter()
+        conn = SearchIndex.connection()
+        # 计数最多统计到 SEARCH_MAX_RESULTS + 1 个，用于判断总数是否精确
+        counted = conn.execute(
+            "SELECT COUNT(*) FROM (SELECT rowid FROM docs_fts WHERE docs_fts MATCH ? LIMIT ?)",
+            (match, SEARCH_MAX_RESULTS + 1)
+        ).fetchone()[0]
+        total = min(counted, SEARCH_MAX_RESULTS)
+        # 相关度排序覆盖所有匹配文档
+        rows = conn.execute(
+            "SELECT d.key, d.category, d.title, d.content, d.size, d.mtime, bm25(docs_fts, 5.0, 1.0, 0.0) AS score "
+            "FROM docs_fts JOIN docs d ON d.id = docs_fts.rowid WHERE docs_fts MATCH ? "
+            "ORDER BY score LIMIT ? OFFSET ?",
+            (match, page_size, (page - 1) * page_size)
+        ).fetchall()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        Metrics.incr("search_query_total")
+
+        return {
+            "query": query,
+            "total": total,
+            "total_exact": counted <= SEARCH_MAX_RESULTS,
+            "page": page,
+            "page_size": page_size,
+            "took_ms": round(elapsed_ms, 2),
+            "results": [
+                {
+                    "filename": key,
+                    "category": doc_category,
+                    "title": title,
+                    "url": SearchIndex.result_url(base_url, key, doc_category),
+                    "snippet": SearchIndex.make_snippet(content, terms),
+                    "score": round(-score, 4),
+                    "size": size,
+                    "modified_time": datetime.fromtimestamp(mtime).isoformat()
+                }
+                for key, doc_category, title, content, size, mtime, score in rows
+            ]
+        }
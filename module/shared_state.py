@@ -0,0 +1,158 @@
+"""
+多进程共享状态模块
+
+基于 SQLite（WAL 模式）在多个工作进程之间共享缓存、配额和指标，
+单进程模式下同样可用，数据保存在 config.STATE_DB_PATH。
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from config import STATE_DB_PATH
+
+
+class SharedState:
+    """共享状态存储类"""
+
+    _local = threading.local()
+    _init_lock = threading.Lock()
+    _initialized_pid: Optional[int] = None
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS cache (
+        namespace TEXT NOT NULL,
+        key TEXT NOT NULL,
+        value BLOB,
+        expires_at REAL,
+        PRIMARY KEY (namespace, key)
+    );
+    CREATE TABLE IF NOT EXISTS quotas (
+        name TEXT NOT NULL,
+        key TEXT NOT NULL,
+        used REAL NOT NULL,
+        window_start REAL NOT NULL,
+        PRIMARY KEY (name, key)
+    );
+    CREATE TABLE IF NOT EXISTS metrics (
+        pid INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        value REAL NOT NULL,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (pid, name)
+    );
+    """
+
+    @staticmethod
+    def connection() -> sqlite3.Connection:
+        """获取当前线程的数据库连接（每个进程、每个线程各自一个连接）"""
+        pid = os.getpid()
+        conn = getattr(SharedState._local, 'conn', None)
+        if conn is not None and SharedState._local.pid == pid:
+            return conn
+
+        STATE_DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(STATE_DB_PATH), timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA busy_timeout = 30000")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        with SharedState._init_lock:
+            if SharedState._initialized_pid != pid:
+                conn.execute("PRAGMA journal_mode = WAL")
+                conn.executescript(SharedState.SCHEMA)
+                SharedState._initialized_pid = pid
+        SharedState._local.conn = conn
+        SharedState._local.pid = pid
+        return conn
+
+    # ==================== 共享缓存 ====================
+
+    @staticmethod
+    def cache_get(namespace: str, key: str) -> Optional[bytes]:
+        """读取缓存，过期或不存在时返回 None"""
+        row = SharedState.connection().execute(
+            "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?",
+            (namespace, key)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at < time.time():
+            return None
+        return value
+
+    @staticmethod
+    def cache_set(namespace: str, key: str, value: bytes, ttl: Optional[float] = None):
+        """写入缓存，ttl 为空时永不过期"""
+        expires_at = time.time() + ttl if ttl else None
+        SharedState.connection().execute(
+            "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (namespace, key, value, expires_at)
+        )
+
+    @staticmethod
+    def cache_delete(namespace: str, key: str):
+        """删除缓存"""
+        SharedState.connection().execute(
+            "DELETE FROM cache WHERE namespace = ? AND key = ?", (namespace, key)
+        )
+
+    # ==================== 配额 ====================
+
+    @staticmethod
+    def consume_quota(name: str, key: str, limit: float, window_seconds: float, amount: float = 1) -> bool:
+        """
+        在固定时间窗口内消耗配额，所有进程共享同一计数
+        返回 True 表示配额足够并已扣减，False 表示超出配额
+        """
+        conn = SharedState.connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT used, window_start FROM quotas WHERE name = ? AND key = ?", (name, key)
+            ).fetchone()
+            used, window_start = row if row else (0.0, now)
+            if now - window_start >= window_seconds:
+                used, window_start = 0.0, now
+            allowed = used + amount <= limit
+            if allowed:
+                used += amount
+            conn.execute(
+                "INSERT OR REPLACE INTO quotas (name, key, used, window_start) VALUES (?, ?, ?, ?)",
+                (name, key, used, window_start)
+            )
+            conn.execute("COMMIT")
+            return allowed
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    # ==================== 指标 ====================
+
+    @staticmethod
+    def write_metrics(pid: int, values: List[Tuple[str, str, float]]):
+        """写入某个进程的指标快照，values 为 (名称, 类型, 数值) 列表"""
+        now = time.time()
+        conn = SharedState.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO metrics (pid, name, kind, value, updated_at) VALUES (?, ?, ?, ?, ?)",
+                [(pid, name, kind, value, now) for name, kind, value in values]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def read_metrics() -> List[Dict[str, Any]]:
+        """读取所有进程的指标"""
+        rows = SharedState.connection().execute(
+            "SELECT pid, name, kind, value, updated_at FROM metrics"
+        ).fetchall()
+        return [
+            {"pid": pid, "name": name, "kind": kind, "value": value, "updated_at": updated_at}
+            for pid, name, kind, value, updated_at in rows
+        ]
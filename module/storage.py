@@ -0,0 +1,463 @@
+"""
+存储后端模块
+
+FileService 和 MindmapService 通过统一的存储接口读写对象，键为相对 static 目录的路径
+（如 "text_files/a.txt"、"html/{id}.html"、"markdown/{id}.md"）：
+- LocalStorage: 本地磁盘（默认），对象即 STATIC_DIR 下的文件，写入走原子写入层
+- S3Storage: S3 兼容对象存储（AWS S3、MinIO 等），分片上传、连接池、流式读取、预签名下载；
+  依赖 boto3（可选依赖，仅在 backend = s3 时需要）
+使用对象存储时，本地 static 目录只作为渲染工作目录和缓存，多个节点共享同一个存储桶即可横向扩展。
+本地大文件的下载不经过 Python 逐块复制：服务器支持 ASGI pathsend 扩展时由服务器零拷贝发送，
+也可配置为交给前置 nginx 发送（X-Accel-Redirect）。
+以 . 开头的隐藏文件（文件元数据、原子写入的临时文件）不对外提供访问。
+"""
+import stat
+from datetime import datetime, timezone
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO, Iterator, NamedTuple, Optional
+from urllib.parse import quote
+from fastapi import HTTPException
+from fastapi.responses import FileResponse, RedirectResponse, Response, StreamingResponse
+from fastapi.staticfiles import StaticFiles
+from config import (
+    STATIC_DIR, STORAGE_BACKEND, S3_ENDPOINT_URL, S3_BUCKET, S3_PREFIX, S3_REGION,
+    S3_ACCESS_KEY, S3_SECRET_KEY, S3_ADDRESSING_STYLE, S3_PRESIGN_DOWNLOADS, S3_PRESIGN_EXPIRES,
+    S3_MULTIPART_THRESHOLD, S3_MULTIPART_CHUNKSIZE, S3_MAX_POOL_CONNECTIONS,
+    DOWNLOAD_LARGE_FILE_BYTES, DOWNLOAD_OFFLOAD, DOWNLOAD_NGINX_PREFIX, DOWNLOAD_CHUNK_SIZE
+)
+from .atomic_writer import AtomicWriter
+from .metrics import Metrics
+from .workload_pools import WorkloadPools
+
+# 流式读取的分块大小
+READ_CHUNK_SIZE = 256 * 1024
+
+
+class ObjectInfo(NamedTuple):
+    """存储对象信息"""
+    key: str
+    size: int
+    mtime: float
+
+
+class SizeLimitExceeded(Exception):
+    """写入内容超过允许的大小"""
+
+
+class LimitedReader:
+    """包装文件对象，累计读取超过 limit 字节时抛出 SizeLimitExceeded"""
+
+    def __init__(self, source: BinaryIO, limit: int):
+        self.source = source
+        self.limit = limit
+        self.total = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.source.read(size)
+        self.total += len(data)
+        if self.total > self.limit:
+            raise SizeLimitExceeded(self.total)
+        return data
+
+
+class LargeFileResponse(FileResponse):
+    """
+    本地大文件的下载响应：
+    - 服务器支持 ASGI pathsend 扩展（http.response.pathsend）且不是范围请求时，只把文件路径交给服务器，
+      由服务器用 sendfile 零拷贝发送，文件内容不经过 Python
+    - 否则（如 uvicorn 不支持 pathsend，或 Range 请求）按 DOWNLOAD_CHUNK_SIZE 的大分块读取发送，
+      减少每次读写的调度开销
+    """
+
+    chunk_size = DOWNLOAD_CHUNK_SIZE
+
+    async def __call__(self, scope, receive, send):
+        pathsend = 'http.response.pathsend' in scope.get('extensions', {})
+        ranged = any(name == b'range' for name, _ in scope.get('headers', []))
+        Metrics.incr("download_pathsend_total" if pathsend and not ranged else "download_chunked_total")
+        await super().__call__(scope, receive, send)
+
+
+class PublicStaticFiles(StaticFiles):
+    """静态文件挂载：路径中任何一级以 . 开头（隐藏文件或目录）时返回 404"""
+
+    def lookup_path(self, path: str):
+        if any(part.startswith('.') for part in PurePosixPath(path.replace('\\', '/')).parts):
+            return "", None
+        return super().lookup_path(path)
+
+
+class StorageBackend:
+    """存储后端接口"""
+
+    name = "base"
+
+    def put_file(self, key: str, source: BinaryIO, content_type: Optional[str] = None) -> int:
+        """从文件对象流式写入对象，返回写入的字节数；中途出错时不产生对象"""
+        raise NotImplementedError
+
+    def put_bytes(self, key: str, data: bytes, content_type: Optional[str] = None):
+        """写入对象（整体替换）"""
+        raise NotImplementedError
+
+    def put_path(self, key: str, path: Path, content_type: Optional[str] = None):
+        """上传本地文件"""
+        with open(path, 'rb') as f:
+            self.put_file(key, f, content_type)
+
+    def create_exclusive(self, key: str) -> bool:
+        """以"不存在才创建"的方式预留对象名，已存在时返回 False"""
+        raise NotImplementedError
+
+    def stat(self, key: str) -> Optional[ObjectInfo]:
+        """对象信息，不存在时返回 None"""
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        return self.stat(key) is not None
+
+    def list(self, prefix: str = '', recursive: bool = True) -> Iterator[ObjectInfo]:
+        """列出前缀下的对象；recursive 为 False 时只列出该层级"""
+        raise NotImplementedError
+
+    def iter_read(self, key: str, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[bytes]:
+        """流式读取对象"""
+        raise NotImplementedError
+
+    def read_bytes(self, key: str) -> bytes:
+        return b''.join(self.iter_read(key))
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def local_path(self, key: str) -> Optional[Path]:
+        """对象在本地磁盘上的路径（仅本地存储）"""
+        return None
+
+    def presigned_url(self, key: str, filename: str, media_type: str, inline: bool) -> Optional[str]:
+        """生成预签名下载地址（仅对象存储）"""
+        return None
+
+
+class LocalStorage(StorageBackend):
+    """本地磁盘存储"""
+
+    name = "local"
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def local_path(self, key: str) -> Path:
+        return self.root / key
+
+    def put_file(self, key: str, source: BinaryIO, content_type: Optional[str] = None) -> int:
+        size = 0
+        with AtomicWriter.open(self.local_path(key)) as f:
+            while True:
+                chunk = source.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                f.write(chunk)
+                size += len(chunk)
+        return size
+
+    def put_bytes(self, key: str, data: bytes, content_type: Optional[str] = None):
+        AtomicWriter.write_bytes(self.local_path(key), data)
+
+    def put_path(self, key: str, path: Path, content_type: Optional[str] = None):
+        target = self.local_path(key)
+        if Path(path).resolve() != target.resolve():
+            super().put_path(key, path, content_type)
+
+    def create_exclusive(self, key: str) -> bool:
+        path = self.local_path(key)
+        try:
+            AtomicWriter.reserve(path.parent, [path.name])
+        except FileExistsError:
+            return False
+        return True
+
+    def stat(self, key: str) -> Optional[ObjectInfo]:
+        try:
+            st = self.local_path(key).stat()
+        except OSError:
+            return None
+        # 目录等非普通文件不是存储对象（与对象存储的语义一致）
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        return ObjectInfo(key, st.st_size, st.st_mtime)
+
+    def list(self, prefix: str = '', recursive: bool = True) -> Iterator[ObjectInfo]:
+        base = self.root / prefix if prefix else self.root
+        if not base.is_dir():
+            return
+        paths = base.rglob('*') if recursive else base.iterdir()
+        for path in paths:
+            if path.name.startswith('.') or not path.is_file():
+                continue
+            st = path.stat()
+            yield ObjectInfo(path.relative_to(self.root).as_posix(), st.st_size, st.st_mtime)
+
+    def iter_read(self, key: str, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[bytes]:
+        with open(self.local_path(key), 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def read_bytes(self, key: str) -> bytes:
+        return self.local_path(key).read_bytes()
+
+    def delete(self, key: str):
+        self.local_path(key).unlink(missing_ok=True)
+
+
+class S3Storage(StorageBackend):
+    """S3 兼容对象存储"""
+
+    name = "s3"
+
+    def __init__(self, bucket: str, prefix: str = '', endpoint_url: Optional[str] = None,
+                 region: Optional[str] = None, access_key: Optional[str] = None,
+                 secret_key: Optional[str] = None, addressing_style: str = 'auto'):
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+            from botocore.config import Config
+            from botocore.exceptions import ClientError
+        except ImportError:
+            raise RuntimeError("使用 S3 存储需要安装 boto3: pip install boto3")
+        if not bucket:
+            raise RuntimeError("使用 S3 存储需要配置 [storage] s3_bucket")
+
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self._client_error = ClientError
+        # 连接池由 botocore 管理，所有线程共用同一个客户端
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url or None,
+            region_name=region or None,
+            aws_access_key_id=access_key or None,
+            aws_secret_access_key=secret_key or None,
+            config=Config(
+                max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+                s3={'addressing_style': addressing_style},
+                retries={'max_attempts': 3, 'mode': 'standard'}
+            )
+        )
+        # 超过阈值的对象自动分片上传，分片并发使用同一个连接池
+        self.transfer_config = TransferConfig(
+            multipart_threshold=S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=S3_MULTIPART_CHUNKSIZE,
+            max_concurrency=max(1, min(10, S3_MAX_POOL_CONNECTIONS // 2))
+        )
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    def _is_missing(self, error) -> bool:
+        return error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+    def put_file(self, key: str, source: BinaryIO, content_type: Optional[str] = None) -> int:
+        counter = LimitedReader(source, float('inf'))
+        extra = {'ContentType': content_type} if content_type else None
+        # 分片上传失败时 boto3 会中止该次上传，不会留下不完整的对象
+        self.client.upload_fileobj(counter, self.bucket, self._key(key),
+                                   ExtraArgs=extra, Config=self.transfer_config)
+        return counter.total
+
+    def put_bytes(self, key: str, data: bytes, content_type: Optional[str] = None):
+        kwargs = {'ContentType': content_type} if content_type else {}
+        self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=data, **kwargs)
+
+    def create_exclusive(self, key: str) -> bool:
+        # 条件写入：对象已存在时服务端返回 412
+        try:
+            self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=b'', IfNoneMatch='*')
+        except self._client_error as e:
+            code = e.response.get('Error', {}).get('Code')
+            if code in ('PreconditionFailed', 'ConditionalRequestConflict', '412'):
+                return False
+            raise
+        return True
+
+    def stat(self, key: str) -> Optional[ObjectInfo]:
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except self._client_error as e:
+            if self._is_missing(e):
+                return None
+            raise
+        return ObjectInfo(key, head['ContentLength'], head['LastModified'].timestamp())
+
+    def list(self, prefix: str = '', recursive: bool = True) -> Iterator[ObjectInfo]:
+        paginator = self.client.get_paginator('list_objects_v2')
+        kwargs = {'Bucket': self.bucket, 'Prefix': self._key(prefix)}
+        if not recursive:
+            kwargs['Delimiter'] = '/'
+        for page in paginator.paginate(**kwargs):
+            for item in page.get('Contents', []):
+                key = item['Key'][len(self.prefix):]
+                if PurePosixPath(key).name.startswith('.'):
+                    continue
+                yield ObjectInfo(key, item['Size'], item['LastModified'].timestamp())
+
+    def iter_read(self, key: str, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[bytes]:
+        try:
+            body = self.client.get_object(Bucket=self.bucket, Key=self._key(key))['Body']
+        except self._client_error as e:
+            if self._is_missing(e):
+                raise FileNotFoundError(key)
+            raise
+        try:
+            for chunk in body.iter_chunks(chunk_size):
+                yield chunk
+        finally:
+            body.close()
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def presigned_url(self, key: str, filename: str, media_type: str, inline: bool) -> Optional[str]:
+        disposition = 'inline' if inline else 'attachment'
+        return self.client.generate_presigned_url(
+            'get_object',
+            Params={
+                'Bucket': self.bucket,
+                'Key': self._key(key),
+                'ResponseContentType': media_type,
+                'ResponseContentDisposition': f'{disposition}; filename="{filename}"'
+            },
+            ExpiresIn=S3_PRESIGN_EXPIRES
+        )
+
+
+class Storage:
+    """存储后端入口类"""
+
+    _backend: Optional[StorageBackend] = None
+
+    @staticmethod
+    def backend() -> StorageBackend:
+        """按配置创建（并复用）存储后端"""
+        if Storage._backend is None:
+            if STORAGE_BACKEND == 's3':
+                Storage._backend = S3Storage(
+                    S3_BUCKET, S3_PREFIX, S3_ENDPOINT_URL, S3_REGION,
+                    S3_ACCESS_KEY, S3_SECRET_KEY, S3_ADDRESSING_STYLE
+                )
+            else:
+                Storage._backend = LocalStorage(STATIC_DIR)
+            print(f"存储后端: {Storage._backend.name}")
+        return Storage._backend
+
+    @staticmethod
+    def is_local() -> bool:
+        return isinstance(Storage.backend(), LocalStorage)
+
+    @staticmethod
+    def normalize_key(relative_path: str) -> str:
+        """规范化对象键，拒绝绝对路径、.. 等越出存储根目录的路径，以及隐藏文件（如元数据文件）"""
+        parts = [part for part in PurePosixPath(relative_path.replace('\\', '/')).parts if part != '.']
+        if not parts or parts[0] == '/' or any(part.startswith('.') or not part for part in parts):
+            raise HTTPException(status_code=404, detail=f"文件不存在: {relative_path}")
+        return '/'.join(parts)
+
+    @staticmethod
+    def key_for(path: Path) -> str:
+        """本地 static 目录下的文件对应的对象键"""
+        return Path(path).resolve().relative_to(STATIC_DIR.resolve()).as_posix()
+
+    @staticmethod
+    def publish(path: Path, content_type: Optional[str] = None):
+        """将本地生成的文件（HTML、Markdown 源文件、索引等）发布到存储后端；本地存储无需操作"""
+        backend = Storage.backend()
+        if backend.local_path(Storage.key_for(path)) is None:
+            backend.put_path(Storage.key_for(path), path, content_type)
+
+    @staticmethod
+    def exists(path: Path) -> bool:
+        """本地 static 目录下的文件在本地或存储后端中存在"""
+        if path.exists():
+            return True
+        backend = Storage.backend()
+        key = Storage.key_for(path)
+        return backend.local_path(key) is None and backend.exists(key)
+
+    @staticmethod
+    def ensure_local(path: Path) -> bool:
+        """本地缓存中没有该文件时从存储后端取回，返回本地文件是否可用"""
+        if path.exists():
+            return True
+        backend = Storage.backend()
+        key = Storage.key_for(path)
+        if backend.local_path(key) is not None or not backend.exists(key):
+            return False
+        with AtomicWriter.open(path) as f:
+            for chunk in backend.iter_read(key):
+                f.write(chunk)
+        return True
+
+    @staticmethod
+    def file_response(key: str, filename: str, media_type: str, inline: bool = False,
+                      allow_redirect: bool = True) -> Response:
+        """
+        返回对象的下载响应：
+        本地存储直接发送文件；对象存储在允许时重定向到预签名地址，否则由服务端流式转发
+        """
+        backend = Storage.backend()
+        path = backend.local_path(key)
+        disposition = 'inline' if inline else 'attachment'
+        if path is not None:
+            try:
+                stat_result = path.stat()
+            except OSError:
+                stat_result = None
+            if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
+                raise HTTPException(status_code=404, detail="文件不存在")
+            if stat_result.st_size >= DOWNLOAD_LARGE_FILE_BYTES:
+                return Storage.large_file_response(key, path, stat_result, filename, media_type, disposition)
+            return FileResponse(path=str(path), filename=filename, media_type=media_type,
+                                content_disposition_type=disposition, stat_result=stat_result)
+
+        info = backend.stat(key)
+        if info is None:
+            raise HTTPException(status_code=404, detail="文件不存在")
+        if allow_redirect and S3_PRESIGN_DOWNLOADS:
+            url = backend.presigned_url(key, filename, media_type, inline)
+            if url:
+                return RedirectResponse(url, status_code=307)
+        last_modified = datetime.fromtimestamp(info.mtime, timezone.utc).strftime('%a, %d %b %Y %H:%M:%S GMT')
+        return StreamingResponse(
+            WorkloadPools.iterate('file_io', backend.iter_read(key)),
+            media_type=media_type,
+            headers={
+                "Content-Length": str(info.size),
+                "Content-Disposition": f'{disposition}; filename="{filename}"',
+                "Last-Modified": last_modified
+            }
+        )
+
+    @staticmethod
+    def large_file_response(key: str, path: Path, stat_result, filename: str, media_type: str,
+                            disposition: str) -> Response:
+        """
+        本地大文件的下载响应：配置了 offload = nginx 时只返回 X-Accel-Redirect 响应头，
+        由 nginx 从 internal location 发送文件（零拷贝，Range 请求也由 nginx 处理）；否则使用 LargeFileResponse
+        """
+        response = LargeFileResponse(path=str(path), filename=filename, media_type=media_type,
+                                     content_disposition_type=disposition, stat_result=stat_result)
+        if DOWNLOAD_OFFLOAD != 'nginx':
+            return response
+        Metrics.incr("download_offload_total")
+        return Response(
+            media_type=media_type,
+            headers={
+                "X-Accel-Redirect": DOWNLOAD_NGINX_PREFIX.rstrip('/') + '/' + quote(key),
+                "Content-Disposition": response.headers["content-disposition"],
+                "Last-Modified": response.headers["last-modified"],
+                "ETag": response.headers["etag"]
+            }
+        )
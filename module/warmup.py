@@ -0,0 +1,179 @@
+"""
+启动预热与就绪状态模块
+
+工作进程启动后在后台依次执行预热步骤，全部完成后才标记为就绪（/readyz 返回 200）：
+- renderer: 探测并缓存 markmap 可执行文件路径，之后的请求不再逐次查找 PATH
+- render: 用一份很小的 Markdown 执行一次真实渲染，让 Node 预先加载 markmap 的模块（操作系统文件缓存），
+  顺带预热节点树提取、CDN 替换和 Markdown 解析等 Python 代码路径
+- storage / state / search: 创建存储后端客户端、打开共享状态和全文索引数据库（建表）
+- pools: 预先启动各类工作的线程池
+预热期间服务照常接收请求；/healthz 只表示进程存活，不执行任何 I/O。
+require_renderer 为真时，markmap 不可用或预热渲染失败会保持未就绪，并每隔 retry_interval_seconds 秒重试。
+"""
+import asyncio
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional
+from config import (
+    WARMUP_ENABLED, WARMUP_RENDER, WARMUP_TIMEOUT, WARMUP_REQUIRE_RENDERER, WARMUP_RETRY_INTERVAL,
+    RUNTIME_DIR
+)
+from .metrics import Metrics
+from .mindmap_service import MindmapService
+from .mindmap_tree import MindmapTree
+from .markdown_tree import MarkdownTree
+from .render_cache import RenderCache
+from .storage import Storage
+from .shared_state import SharedState
+from .search_index import SearchIndex
+from .workload_pools import WorkloadPools
+
+# 预热渲染使用的 Markdown（覆盖标题、列表、代码和链接）
+WARMUP_MARKDOWN = """# 预热
+## 分支一
+- 列表项
+- [链接](https://example.com)
+## 分支二
+```python
+print("warmup")
+```
+"""
+
+# 与渲染流程相关的步骤，require_renderer 为真时失败即未就绪
+RENDERER_STEPS = ('renderer', 'render')
+
+
+class Warmup:
+    """启动预热与就绪状态类"""
+
+    _ready = False
+    _started_at: Optional[float] = None
+    _finished_at: Optional[float] = None
+    _attempts = 0
+    _steps: Dict[str, Dict[str, Any]] = {}
+    _task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def is_ready() -> bool:
+        return Warmup._ready
+
+    @staticmethod
+    def start():
+        """在当前事件循环中启动后台预热任务（启动事件中调用）"""
+        Warmup._started_at = time.time()
+        Metrics.set_gauge("ready", 0)
+        Warmup._task = asyncio.ensure_future(Warmup._run_until_ready())
+
+    @staticmethod
+    def stop():
+        """进程退出时取消未完成的预热"""
+        if Warmup._task is not None and not Warmup._task.done():
+            Warmup._task.cancel()
+
+    @staticmethod
+    async def _run_until_ready():
+        while True:
+            Warmup._attempts += 1
+            await Warmup.run()
+            if Warmup._ready:
+                return
+            print(f"预热未完成，{WARMUP_RETRY_INTERVAL:g} 秒后重试")
+            await asyncio.sleep(WARMUP_RETRY_INTERVAL)
+
+    @staticmethod
+    async def _step(name: str, func: Callable[[], Awaitable[Any]]) -> bool:
+        """执行一个预热步骤，记录耗时和结果"""
+        started = time.perf_counter()
+        try:
+            detail = await asyncio.wait_for(func(), timeout=WARMUP_TIMEOUT)
+            result = {"status": "ok"}
+            if isinstance(detail, str):
+                result["detail"] = detail
+        except asyncio.TimeoutError:
+            result = {"status": "failed", "detail": f"超时（{WARMUP_TIMEOUT:g} 秒）"}
+        except Exception as e:
+            result = {"status": "failed", "detail": getattr(e, 'detail', None) or str(e)}
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        Warmup._steps[name] = result
+        Metrics.incr(f"warmup_step_{result['status']}_total")
+        print(f"预热步骤 {name}: {result['status']} ({result['seconds']}s)"
+              + (f" - {result['detail']}" if result['status'] != 'ok' else ""))
+        return result["status"] == "ok"
+
+    @staticmethod
+    async def run():
+        """执行全部预热步骤并更新就绪状态"""
+        Warmup._steps = {}
+        started = time.perf_counter()
+        renderer_ok = await Warmup._step('renderer', Warmup._probe_renderer)
+        if WARMUP_ENABLED:
+            if WARMUP_RENDER and renderer_ok:
+                await Warmup._step('render', Warmup._warmup_render)
+            await Warmup._step('storage', lambda: WorkloadPools.run('file_io', Warmup._open_storage))
+            await Warmup._step('state', lambda: WorkloadPools.run('listing', SharedState.connection))
+            await Warmup._step('search', lambda: WorkloadPools.run('listing', SearchIndex.connection))
+            await Warmup._step('pools', Warmup._start_pools)
+        failed = [name for name, step in Warmup._steps.items() if step["status"] != "ok"]
+        blocking = [name for name in failed if name in RENDERER_STEPS] if WARMUP_REQUIRE_RENDERER else []
+        Warmup._ready = not blocking
+        Warmup._finished_at = time.time()
+        elapsed = time.perf_counter() - started
+        Metrics.set_gauge("ready", 1 if Warmup._ready else 0)
+        Metrics.set_gauge("warmup_seconds", round(elapsed, 3))
+        print(f"预热完成: {'已就绪' if Warmup._ready else '未就绪'}，耗时 {elapsed:.2f}s"
+              + (f"，失败步骤: {', '.join(failed)}" if failed else ""))
+
+    @staticmethod
+    async def _probe_renderer() -> str:
+        path = MindmapService.markmap_path(refresh=True)
+        if path is None:
+            raise RuntimeError("未找到 markmap 命令")
+        return path
+
+    @staticmethod
+    async def _warmup_render() -> str:
+        """在临时目录中渲染一份很小的 Markdown，并走一遍渲染后处理的代码路径"""
+        RUNTIME_DIR.mkdir(parents=True, exist_ok=True)
+        work_dir = Path(tempfile.mkdtemp(prefix="warmup-", dir=RUNTIME_DIR))
+        try:
+            md_path = work_dir / "warmup.md"
+            html_path = work_dir / "warmup.html"
+            md_path.write_text(WARMUP_MARKDOWN, encoding='utf-8')
+            await MindmapService.run_markmap(md_path, html_path)
+
+            def post_process() -> int:
+                html_content = html_path.read_text(encoding='utf-8')
+                MindmapTree.extract_embedded_tree(html_content)
+                MindmapService.localize_html(html_content)
+                MarkdownTree.parse(WARMUP_MARKDOWN)
+                RenderCache.digest(WARMUP_MARKDOWN.encode('utf-8'))
+                return len(html_content)
+
+            size = await WorkloadPools.run('cpu', post_process)
+            return f"{size} bytes"
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    @staticmethod
+    def _open_storage() -> str:
+        backend = Storage.backend()
+        backend.stat('.warmup')
+        return backend.name
+
+    @staticmethod
+    async def _start_pools():
+        """每个线程池执行一个空任务，提前创建线程"""
+        await asyncio.gather(*(WorkloadPools.run(name, time.sleep, 0) for name in WorkloadPools.status()))
+
+    @staticmethod
+    def status() -> Dict[str, Any]:
+        """就绪状态和各预热步骤的结果"""
+        return {
+            "status": "ready" if Warmup._ready else "starting" if Warmup._finished_at is None else "not_ready",
+            "started_at": Warmup._started_at,
+            "finished_at": Warmup._finished_at,
+            "attempts": Warmup._attempts,
+            "steps": Warmup._steps
+        }
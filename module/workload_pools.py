@@ -0,0 +1,164 @@
+"""
+按工作类型隔离的线程池模块
+
+同步的阻塞操作不再共用 Starlette 默认线程池，而是按工作类型交给各自固定大小的线程池：
+- render: 思维导图渲染前后的文件处理（移动/发布生成的HTML、更新检索索引）
+- file_io: 文件读写（下载、预览、上传写入、文本编辑、HTML和子树读取、ZIP打包）
+- listing: 目录列举与检索（/files、/search、打包筛选）
+- cpu: CPU密集的后处理（节点树解析、HTML改写、SVG布局）
+大量预览排满 file_io 时，列表、检索和渲染后处理仍有各自的线程可用。
+各线程池的活动数、排队数、等待/运行耗时写入指标，/metrics 中可查看利用率。
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterator
+from config import EXECUTOR_WORKERS
+from .metrics import Metrics
+from .request_profiler import RequestProfiler
+
+# 迭代结束的标记（StopIteration 不能穿过 Future 传递）
+_DONE = object()
+
+
+class WorkloadPool:
+    """单个工作类型的线程池及其利用率统计"""
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"pool-{name}")
+        self.lock = threading.Lock()
+        self.active = 0
+        self.queued = 0
+        self.started = 0
+        self.completed = 0
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _run(self, submitted_at: float, func: Callable[[], Any], profile=None) -> Any:
+        started = time.monotonic()
+        waited = started - submitted_at
+        with self.lock:
+            self.queued -= 1
+            self.active += 1
+            self.started += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        self._update_gauges()
+        # 提交方请求正在被剖析时，登记本线程以便采样
+        ident = profile.track_thread(f"pool-{self.name}") if profile is not None else None
+        try:
+            return func()
+        finally:
+            if ident is not None:
+                profile.untrack_thread(ident)
+            elapsed = time.monotonic() - started
+            with self.lock:
+                self.active -= 1
+                self.completed += 1
+                self.busy_seconds += elapsed
+            Metrics.incr(f"executor_{self.name}_tasks_total")
+            Metrics.incr(f"executor_{self.name}_busy_seconds_total", elapsed)
+            Metrics.incr(f"executor_{self.name}_wait_seconds_total", waited)
+            self._update_gauges()
+
+    def submit(self, func: Callable[[], Any], profile=None):
+        """提交任务，返回 concurrent.futures.Future"""
+        with self.lock:
+            self.queued += 1
+        self._update_gauges()
+        future = self.executor.submit(self._run, time.monotonic(), func, profile)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future):
+        # 开始执行前被取消（客户端断开）的任务不会经过 _run，在这里移出排队数
+        if future.cancelled():
+            with self.lock:
+                self.queued -= 1
+            self._update_gauges()
+
+    def _update_gauges(self):
+        Metrics.set_gauge(f"executor_{self.name}_active", self.active)
+        Metrics.set_gauge(f"executor_{self.name}_queued", self.queued)
+
+    def status(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "workers": self.workers,
+                "active": self.active,
+                "queued": self.queued,
+                "utilization": round(self.active / self.workers, 3),
+                "completed": self.completed,
+                "busy_seconds": round(self.busy_seconds, 3),
+                "avg_wait_ms": round(self.wait_seconds * 1000 / self.started, 3) if self.started else 0.0,
+                "max_wait_ms": round(self.max_wait_seconds * 1000, 3),
+                "avg_run_ms": round(self.busy_seconds * 1000 / self.completed, 3) if self.completed else 0.0
+            }
+
+
+class WorkloadPools:
+    """按工作类型隔离的线程池"""
+
+    _pools: Dict[str, WorkloadPool] = {
+        name: WorkloadPool(name, workers) for name, workers in EXECUTOR_WORKERS.items()
+    }
+    _started_at = time.monotonic()
+
+    @staticmethod
+    def _submit(name: str, func: Callable[..., Any], *args, **kwargs):
+        """提交到指定类型的线程池（保留调用方的 contextvars），返回 concurrent.futures.Future"""
+        context = contextvars.copy_context()
+        return WorkloadPools._pools[name].submit(
+            functools.partial(context.run, func, *args, **kwargs), RequestProfiler.current()
+        )
+
+    @staticmethod
+    async def run(name: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """在指定类型的线程池中执行同步函数，等待其结果"""
+        return await asyncio.wrap_future(WorkloadPools._submit(name, func, *args, **kwargs))
+
+    @staticmethod
+    async def iterate(name: str, iterator: Iterator[bytes]) -> AsyncIterator[bytes]:
+        """
+        在指定类型的线程池中逐块迭代同步迭代器，供 StreamingResponse 使用
+        （否则 Starlette 会在默认线程池中迭代）；迭代结束或客户端断开时关闭迭代器
+        """
+        pending = None
+        try:
+            while True:
+                pending = WorkloadPools._submit(name, next, iterator, _DONE)
+                chunk = await asyncio.wrap_future(pending)
+                if chunk is _DONE:
+                    break
+                yield chunk
+        finally:
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                if pending is not None and not pending.done():
+                    # 客户端断开时上一块可能仍在读取，读完后再在该线程中关闭
+                    pending.add_done_callback(lambda _: close())
+                else:
+                    close()
+
+    @staticmethod
+    def status() -> Dict[str, Any]:
+        """当前进程各线程池的状态；utilization 为当前活动线程占比，busy_ratio 为启动以来的平均占用率"""
+        uptime = max(time.monotonic() - WorkloadPools._started_at, 1e-9)
+        result = {}
+        for name, pool in WorkloadPools._pools.items():
+            status = pool.status()
+            status["busy_ratio"] = round(min(1.0, status["busy_seconds"] / (uptime * pool.workers)), 4)
+            result[name] = status
+        return result
+
+    @staticmethod
+    def shutdown():
+        """进程退出时关闭线程池（不等待未开始的任务）"""
+        for pool in WorkloadPools._pools.values():
+            pool.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,73 @@
+"""
+S3Storage 离线测试：使用 moto 模拟 S3，不需要真实的对象存储
+
+运行: pip install boto3 moto pytest && python -m pytest -q tests
+"""
+import io
+import os
+import pytest
+
+boto3 = pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+
+from module.storage import S3Storage
+
+BUCKET = "mindmap-test"
+
+
+@pytest.fixture
+def storage():
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    with moto.mock_aws():
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket=BUCKET)
+        yield S3Storage(BUCKET, prefix="app", region="us-east-1")
+
+
+def test_put_stat_and_read(storage):
+    storage.put_bytes("text_files/a.txt", b"hello", "text/plain")
+    info = storage.stat("text_files/a.txt")
+    assert info.key == "text_files/a.txt"
+    assert info.size == 5
+    assert storage.exists("text_files/a.txt")
+    assert storage.read_bytes("text_files/a.txt") == b"hello"
+    # 对象键带上配置的前缀
+    head = storage.client.head_object(Bucket=BUCKET, Key="app/text_files/a.txt")
+    assert head["ContentType"] == "text/plain"
+
+
+def test_put_file_and_chunked_read(storage):
+    data = os.urandom(300 * 1024)
+    assert storage.put_file("files/b.bin", io.BytesIO(data)) == len(data)
+    chunks = list(storage.iter_read("files/b.bin", chunk_size=64 * 1024))
+    assert len(chunks) > 1
+    assert b"".join(chunks) == data
+
+
+def test_missing_object(storage):
+    assert storage.stat("files/missing.bin") is None
+    assert not storage.exists("files/missing.bin")
+    with pytest.raises(FileNotFoundError):
+        list(storage.iter_read("files/missing.bin"))
+
+
+def test_list(storage):
+    for key in ("files/a.txt", "files/sub/b.txt", "files/.hidden", "html/c.html"):
+        storage.put_bytes(key, b"x")
+    assert sorted(info.key for info in storage.list("files/")) == ["files/a.txt", "files/sub/b.txt"]
+    assert [info.key for info in storage.list("files/", recursive=False)] == ["files/a.txt"]
+    assert len(list(storage.list())) == 3
+
+
+def test_delete(storage):
+    storage.put_bytes("files/a.txt", b"x")
+    storage.delete("files/a.txt")
+    assert storage.stat("files/a.txt") is None
+    assert list(storage.list("files/")) == []
+
+
+def test_presigned_url(storage):
+    storage.put_bytes("files/a.txt", b"x")
+    url = storage.presigned_url("files/a.txt", "a.txt", "text/plain", inline=False)
+    assert "app/files/a.txt" in url
+    assert "response-content-disposition" in url